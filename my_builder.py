@@ -1,10 +1,21 @@
 #!/usr/bin/env python3.6
 
+import time
+start_time = time.perf_counter()
+
 import os
 import sys
-from scripts import builder_main
+from scripts import my_utils, daemon_client
 
 if __name__ == '__main__':
-    workspace_root = builder_main.my_utils.normalize_path(os.path.dirname(os.path.abspath(__file__)))
+    workspace_root = my_utils.normalize_path(os.path.dirname(os.path.abspath(__file__)))
     os.chdir(workspace_root)
+
+    # forward the command to the builder daemon if one is running
+    exit_code = daemon_client.forward_to_daemon(workspace_root, sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from scripts import builder_main
+    builder_main.profile_utils.profiler.add_span('builder imports', start_time, time.perf_counter())
     sys.exit(builder_main.main(workspace_root))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import subprocess
+from pathlib import Path
+from . import my_utils
+from . import cmake_utils
+from . import event_utils
+
+# Content addressed cache of the installed outputs (app, tests, lib), shared between workspaces.
+# The key hashes the sources, the cmake files, the initial cache settings and the toolchain versions: on a hit the
+# outputs are restored without running cmake. The local store is a directory with one entry per key, evicted in
+# least recently used order above a size limit. An optional HTTP backend is read with GET and written with PUT {url}/{key}.tar.gz
+
+manifest_name = 'manifest.json'
+
+def is_enabled(args):
+    return not args.no_artifact_cache and bool(args.artifact_cache_dir or args.artifact_cache_url)
+
+def _get_version(cmd):
+    try:
+        output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding='utf-8', errors='replace').stdout
+        return output.splitlines()[0] if output else ''
+    except OSError:
+        return ''
+
+# path, size and modification time of the executable, which change when the tool is upgraded
+def _get_executable_stamp(name):
+    path = my_utils.which(name) if name else None
+    try:
+        stat = os.stat(os.path.realpath(path or name))
+    except (OSError, TypeError):
+        return f'{name}:missing'
+    return f'{os.path.realpath(path or name)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+def get_toolchain_version_path(args):
+    return my_utils.normalize_path(f'{args.build_root}/toolchain_version.txt')
+
+# the versions printed by cmake and the compiler, probed once per toolchain: the next builds, no-op builds included,
+# only check the executables against the stamp stored with the versions in build/toolchain_version.txt
+def get_toolchain_version(args):
+    compiler = os.environ.get('CXX') or my_utils.which('c++') or my_utils.which('cl') or ''
+    stamp = f'{_get_executable_stamp(args.cmake_path)}\0{_get_executable_stamp(compiler)}'
+    version_path = get_toolchain_version_path(args)
+    try:
+        stored_stamp, _, version = Path(version_path).read_text().partition('\n')
+        if stored_stamp == stamp:
+            return version
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    version = f'{_get_version([args.cmake_path, "--version"])}\0{compiler}\0{_get_version([compiler, "--version"]) if compiler else ""}'
+    if os.path.isdir(args.build_root):
+        my_utils.write_text_atomically(version_path, f'{stamp}\n{version}')
+    return version
+
+def compute_key(args, cache_content):
+    sha = hashlib.sha256()
+    # the workspace path is in the settings (install prefix...), it must not prevent sharing between workspaces
+    sha.update(cache_content.replace(Path(args.workspace_root).as_posix(), '<workspace>').encode('utf-8'))
+    sha.update(get_toolchain_version(args).encode('utf-8'))
+    files = ['CMakeLists.txt', 'CMakeLists.txt.in'] + \
+            sorted(Path(f).relative_to(args.workspace_root).as_posix() for f in Path(f'{args.workspace_root}/scripts/cmake').glob('*.cmake'))
+    for root, _, names in os.walk(f'{args.workspace_root}/src'):
+        for name in names:
+            files.append(Path(root, name).relative_to(args.workspace_root).as_posix())
+    for path in sorted(set(files)):
+        sha.update(f'\0{path}\0'.encode('utf-8'))
+        try:
+            sha.update(Path(f'{args.workspace_root}/{path}').read_bytes())
+        except FileNotFoundError:
+            pass
+    return sha.hexdigest()
+
+#### local store
+
+# the manifest paths are relative to the workspace: a broken or malicious entry (an HTTP cache) must not write elsewhere
+def get_safe_path(root, path):
+    root = os.path.realpath(root)
+    destination = os.path.realpath(os.path.join(root, path))
+    if os.path.isabs(path) or destination == root or os.path.commonpath([root, destination]) != root:
+        raise ValueError(f'invalid path {path} in the artifact cache entry')
+    return destination
+
+# returns the restored files and their size, raises ValueError for invalid entries before restoring anything
+def _restore_entry(args, entry_dir):
+    manifest = json.loads(Path(f'{entry_dir}/{manifest_name}').read_text())
+    files = manifest['files']
+    destinations = [get_safe_path(args.workspace_root, path) for path in files]
+    restored_bytes = 0
+    for path, destination in zip(files, destinations):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy2(get_safe_path(f'{entry_dir}/files', path), destination)
+        restored_bytes += os.path.getsize(destination)
+    # least recently used eviction is based on the manifest modification time
+    os.utime(f'{entry_dir}/{manifest_name}')
+    return files, restored_bytes
+
+# the unit tests run the executables of the build directory, as the build outputs them
+def _restore_build_dir_executables(args, files):
+    bin_dir = f'bin/{args.config}/'
+    for path in files:
+        if path.startswith(bin_dir) and '/' not in path[len(bin_dir):]:
+            os.makedirs(args.build_dir, exist_ok=True)
+            shutil.copy2(f'{args.workspace_root}/{path}', f'{args.build_dir}/{path[len(bin_dir):]}')
+
+def _store_entry(cache_dir, key, files, read_file):
+    entry_dir = f'{cache_dir}/{key}'
+    if os.path.exists(entry_dir):
+        return
+    # written in a temporary directory then renamed, so that concurrent builders never see partial entries
+    tmp_dir = f'{cache_dir}/.tmp-{uuid.uuid4().hex}'
+    size = 0
+    for path in files:
+        destination = get_safe_path(f'{tmp_dir}/files', path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        read_file(path, destination)
+        size += os.path.getsize(destination)
+    Path(f'{tmp_dir}/{manifest_name}').write_text(json.dumps({'files': files, 'size': size}))
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True) # stored by an other builder meanwhile
+
+def evict(cache_dir, max_size):
+    entries = []
+    for entry in os.scandir(cache_dir):
+        manifest_path = f'{entry.path}/{manifest_name}'
+        if entry.name.startswith('.') or not os.path.exists(manifest_path):
+            continue
+        try:
+            entries.append((os.path.getmtime(manifest_path), json.loads(Path(manifest_path).read_text())['size'], entry.path))
+        except (OSError, ValueError, KeyError):
+            pass
+    total_size = sum(entry[1] for entry in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+#### http backend
+
+def _http_get(args, key, cache_dir):
+    import io
+    import tarfile
+    import urllib.request
+    import urllib.error
+    try:
+        with urllib.request.urlopen(f'{args.artifact_cache_url.rstrip("/")}/{key}.tar.gz', timeout=30) as response:
+            data = response.read()
+    except (urllib.error.URLError, OSError):
+        return False
+    try:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+            members = {member.name: member for member in archive.getmembers() if member.isfile()}
+            files = json.loads(archive.extractfile(members[manifest_name]).read())['files']
+            for path in files:
+                get_safe_path(args.workspace_root, path)
+
+            def read_file(path, destination):
+                with open(destination, 'wb') as destination_file:
+                    shutil.copyfileobj(archive.extractfile(members[f'files/{path}']), destination_file)
+                os.chmod(destination, members[f'files/{path}'].mode & 0o755)
+            _store_entry(cache_dir, key, files, read_file)
+    except (tarfile.TarError, KeyError, ValueError) as e:
+        my_utils.builder_print_warning(f'artifact cache: invalid entry {key[:16]} from {args.artifact_cache_url}: {e}')
+        return False
+    return True
+
+def _http_put(args, key, entry_dir):
+    import io
+    import tarfile
+    import urllib.request
+    import urllib.error
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        archive.add(f'{entry_dir}/{manifest_name}', arcname=manifest_name)
+        archive.add(f'{entry_dir}/files', arcname='files')
+    request = urllib.request.Request(f'{args.artifact_cache_url.rstrip("/")}/{key}.tar.gz', data=buffer.getvalue(), method='PUT')
+    try:
+        urllib.request.urlopen(request, timeout=30).close()
+    except (urllib.error.URLError, OSError) as e:
+        my_utils.builder_print_warning(f'artifact cache: failed to upload to {args.artifact_cache_url}: {e}')
+
+#### builder interface
+
+def get_local_cache_dir(args):
+    # the http backend also needs a local directory, the default one is in the user home
+    if args.artifact_cache_dir:
+        return my_utils.make_path_absolute(args.workspace_root, args.artifact_cache_dir)
+    return my_utils.normalize_path('~/.cache/builder/artifacts')
+
+# returns True if the outputs were restored
+def restore(args):
+    args.artifact_cache_key = compute_key(args, cmake_utils.cmake_cache_init(args))
+    cache_dir = get_local_cache_dir(args)
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_dir = f'{cache_dir}/{args.artifact_cache_key}'
+
+    source = 'local'
+    if not os.path.exists(f'{entry_dir}/{manifest_name}'):
+        if not args.artifact_cache_url or not _http_get(args, args.artifact_cache_key, cache_dir):
+            my_utils.builder_print(f'artifact cache: miss for {args.artifact_cache_key[:16]}')
+            event_utils.emit('cache', cache='artifact', config=args.config, hit=False, key=args.artifact_cache_key)
+            return False
+        source = 'http'
+
+    try:
+        files, restored_bytes = _restore_entry(args, entry_dir)
+    except (OSError, ValueError, KeyError) as e:
+        my_utils.builder_print_warning(f'artifact cache: failed to restore {args.artifact_cache_key[:16]}, building instead: {e}')
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        event_utils.emit('cache', cache='artifact', config=args.config, hit=False, key=args.artifact_cache_key)
+        return False
+    _restore_build_dir_executables(args, files)
+    file_count = len(files)
+    event_utils.emit('cache', cache='artifact', config=args.config, hit=True, key=args.artifact_cache_key, source=source,
+                     files=file_count, bytes=restored_bytes)
+    my_utils.builder_print(f'artifact cache: {source} hit for {args.artifact_cache_key[:16]}, restored {file_count} files '
+                           f'({restored_bytes / 1024 ** 2:.1f} MiB) without running cmake')
+    return True
+
+# store the files installed by the build, listed by cmake in install_manifest.txt
+def store(args):
+    try:
+        installed = Path(f'{args.build_dir}/install_manifest.txt').read_text().split()
+    except FileNotFoundError:
+        return # msvc builds don't run the install target
+    files = []
+    for path in installed:
+        try:
+            files.append(Path(path).relative_to(args.workspace_root).as_posix())
+        except ValueError:
+            pass # installed outside of the workspace
+
+    cache_dir = get_local_cache_dir(args)
+    _store_entry(cache_dir, args.artifact_cache_key, files, lambda path, destination: shutil.copy2(f'{args.workspace_root}/{path}', destination))
+    evict(cache_dir, args.artifact_cache_size * 1024 ** 2)
+    if args.artifact_cache_url:
+        _http_put(args, args.artifact_cache_key, f'{cache_dir}/{args.artifact_cache_key}')
+    my_utils.builder_print(f'artifact cache: stored {len(files)} files for {args.artifact_cache_key[:16]}')
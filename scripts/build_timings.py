@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+from pathlib import Path
+from . import my_utils
+
+# Per object and per target compile/link times, recorded by scripts/timing_launcher.py during `builder build --timings`
+
+def get_timings_log_path(args):
+    return my_utils.normalize_path(f'{args.build_dir}/timings/commands.jsonl')
+
+def get_timings_report_path(args):
+    return my_utils.normalize_path(f'{args.build_dir}/build_timings.json')
+
+def get_rule_launch_command(args, kind):
+    launcher_path = Path(f'{args.workspace_root}/scripts/timing_launcher.py').as_posix()
+    return f'"{Path(sys.executable).as_posix()}" "{launcher_path}" "{Path(get_timings_log_path(args)).as_posix()}" {kind}'
+
+# remove the records of the previous build
+def reset_timings_log(args):
+    log_path = get_timings_log_path(args)
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+
+def _read_records(log_path):
+    records = []
+    try:
+        with open(log_path) as log_file:
+            for line in log_file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass # truncated line of an interrupted build
+    except FileNotFoundError:
+        pass
+    return records
+
+# object files are written to CMakeFiles/<target>.dir/<source path>.o
+target_dir_regex = re.compile(r'CMakeFiles[/\\]([^/\\]+)\.dir[/\\]')
+
+def _get_target(record):
+    if record['kind'] == 'compile':
+        match = target_dir_regex.search(record['output'] or '')
+        return match.group(1) if match else 'unknown'
+    # libmy_lib.a => my_lib, my_app.exe => my_app
+    name, extension = os.path.splitext(os.path.basename(record['output'] or 'unknown'))
+    if extension in ('.a', '.so', '.dylib') and name.startswith('lib'):
+        name = name[3:]
+    return name if extension in ('.a', '.so', '.dylib', '.lib', '.exe') else name + extension
+
+def _get_object_name(args, record):
+    source = record['source'] or record['output'] or 'unknown'
+    if os.path.isabs(source):
+        try:
+            return Path(source).relative_to(args.workspace_root).as_posix()
+        except ValueError:
+            pass
+    return Path(source).as_posix()
+
+def compute_timings(args):
+    objects = {}
+    targets = {}
+    for record in _read_records(get_timings_log_path(args)):
+        target = targets.setdefault(_get_target(record), {'compile': 0.0, 'link': 0.0, 'objects': 0})
+        if record['kind'] == 'compile':
+            objects[_get_object_name(args, record)] = record['duration']
+            target['compile'] += record['duration']
+            target['objects'] += 1
+        else:
+            target['link'] += record['duration']
+    return {'config': args.config, 'objects': objects, 'targets': targets}
+
+def _format_delta(duration, previous_duration):
+    if previous_duration is None:
+        return ''
+    delta = duration - previous_duration
+    percent = f' ({100 * delta / previous_duration:+.0f}%)' if previous_duration else ''
+    return f'  {delta:+.2f}s{percent} vs previous'
+
+def print_timings_report(timings, previous, max_objects=20):
+    previous_objects = previous.get('objects', {}) if previous else {}
+    previous_targets = previous.get('targets', {}) if previous else {}
+
+    my_utils.builder_print('Targets (compile time is the sum over its objects):')
+    for name, target in sorted(timings['targets'].items(), key=lambda item: -(item[1]['compile'] + item[1]['link'])):
+        total = target['compile'] + target['link']
+        previous_target = previous_targets.get(name)
+        # only comparable when the same objects were compiled, not after an incremental build
+        is_comparable = previous_target and previous_target['objects'] == target['objects']
+        previous_total = previous_target['compile'] + previous_target['link'] if is_comparable else None
+        my_utils.builder_print(f'{total:9.2f}s  {name}: {target["objects"]} objects compiled in {target["compile"]:.2f}s, '
+                               f'linked in {target["link"]:.2f}s{_format_delta(total, previous_total)}')
+
+    ranked_objects = sorted(timings['objects'].items(), key=lambda item: -item[1])
+    my_utils.builder_print(f'Slowest objects ({min(max_objects, len(ranked_objects))} of {len(ranked_objects)}):')
+    for name, duration in ranked_objects[:max_objects]:
+        my_utils.builder_print(f'{duration:9.2f}s  {name}{_format_delta(duration, previous_objects.get(name))}')
+
+# writes build/<config>/build_timings.json, the previous report is kept as build_timings.previous.json for comparison
+def write_timings_report(args):
+    timings = compute_timings(args)
+    if not timings['objects'] and not timings['targets']:
+        # keep the last reports of an up to date build
+        my_utils.builder_print('No compile or link command ran, nothing to report')
+        return
+
+    report_path = get_timings_report_path(args)
+    previous_path = report_path.replace('.json', '.previous.json')
+    previous = None
+    if os.path.exists(report_path):
+        os.replace(report_path, previous_path)
+        try:
+            previous = json.loads(Path(previous_path).read_text())
+        except ValueError:
+            pass
+
+    Path(report_path).write_text(json.dumps(timings, indent=1, sort_keys=True))
+    print_timings_report(timings, previous)
+    my_utils.builder_print(f'Build timings written to: {report_path}')
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import subprocess
+import multiprocessing
+from pathlib import Path
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from . import my_utils
+from . import builder_scaffold
+
+# builder bench: times the edit-build-test loop scenarios on copies of the workspace, the hello world tree of src/
+# and synthetic trees with many sources, and compares the results with a baseline.
+
+scenario_choices = ['cold_generate', 'noop_build', 'touch_source', 'touch_header', 'clean_rebuild', 'unit_tests']
+
+def run_builder(bench_workspace, builder_args):
+    cmd = [sys.executable, f'{bench_workspace}/my_builder.py'] + builder_args
+    start = time.perf_counter()
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=bench_workspace, encoding='utf-8', errors='replace')
+    duration = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'`builder {" ".join(builder_args)}` failed:\n' + '\n'.join(result.stdout.splitlines()[-20:]))
+    return duration
+
+def touch(path):
+    Path(path).touch()
+    # make sure the modification time differs from the previous build even on coarse file systems
+    os.utime(path, (time.time() + 1, time.time() + 1))
+
+def run_scenario(bench_workspace, scenario, config, touched_header):
+    build = ['build', '--config', config]
+    touched_source = f'{bench_workspace}/src/lib/source_1.cpp'
+    if scenario == 'cold_generate':
+        shutil.rmtree(f'{bench_workspace}/build', ignore_errors=True)
+        return run_builder(bench_workspace, build + ['--no_build'])
+    if scenario == 'noop_build':
+        return run_builder(bench_workspace, build)
+    if scenario == 'touch_source':
+        touch(touched_source)
+        return run_builder(bench_workspace, build)
+    if scenario == 'touch_header':
+        touch(touched_header)
+        return run_builder(bench_workspace, build)
+    if scenario == 'clean_rebuild':
+        return run_builder(bench_workspace, build + ['--clean'])
+    if scenario == 'unit_tests':
+        return run_builder(bench_workspace, ['unit-tests', '--config', config])
+    raise ValueError(scenario)
+
+def percentile(samples, fraction):
+    values = sorted(samples)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize(samples):
+    return {'samples': samples, 'median': percentile(samples, 0.5), 'p90': percentile(samples, 0.9),
+            'min': min(samples), 'max': max(samples)}
+
+def bench_tree(args, tree_name, file_count):
+    bench_workspace = my_utils.normalize_path(f'{args.bench_dir}/{tree_name}')
+    builder_scaffold.copy_workspace(args.workspace_root, bench_workspace)
+    touched_header = f'{bench_workspace}/src/lib/subfolder/source_2.h'
+    if file_count:
+        touched_header = builder_scaffold.generate_project(bench_workspace, file_count, depth=3, libs=max(1, file_count // 250), fan_out=4)
+
+    # scenarios other than cold_generate start from a built tree
+    run_builder(bench_workspace, ['build', '--config', args.config])
+    results = {}
+    for scenario in args.scenarios:
+        samples = []
+        for _ in range(args.repeat):
+            samples.append(run_scenario(bench_workspace, scenario, args.config, touched_header))
+        if scenario == 'cold_generate':
+            run_builder(bench_workspace, ['build', '--config', args.config])
+        results[scenario] = summarize(samples)
+        my_utils.builder_print(f'bench: {tree_name:>16} {scenario:>14}: median {results[scenario]["median"]:7.3f}s, p90 {results[scenario]["p90"]:7.3f}s')
+    return results
+
+# returns the list of (tree, scenario, baseline median, median) slower than the threshold
+def compare_with_baseline(results, baseline, threshold):
+    regressions = []
+    my_utils.builder_print(f'bench: comparison with the baseline (regression threshold {threshold:.0f}%):')
+    for tree_name, scenarios in results['trees'].items():
+        for scenario, result in scenarios.items():
+            baseline_result = baseline.get('trees', {}).get(tree_name, {}).get(scenario)
+            if baseline_result is None:
+                continue
+            change = 100 * (result['median'] - baseline_result['median']) / baseline_result['median'] if baseline_result['median'] else 0
+            is_regression = change > threshold
+            if is_regression:
+                regressions.append((tree_name, scenario, baseline_result['median'], result['median']))
+            my_utils.builder_print(f'bench: {tree_name:>16} {scenario:>14}: {baseline_result["median"]:7.3f}s -> {result["median"]:7.3f}s '
+                                   f'({change:+.1f}%){"  REGRESSION" if is_regression else ""}')
+    return regressions
+
+def parse_file_counts(value):
+    return [int(count) for count in value.split(',') if count.strip()]
+
+def main(workspace_root, command_argv, argv):
+    desc = '''
+builder bench [options]     time the edit-build-test loop on copies of the workspace and compare with a baseline
+
+Scenarios: cold_generate, noop_build, touch_source, touch_header, clean_rebuild, unit_tests.
+They run on the hello world tree of src/ and on synthetic trees adding the given numbers of sources (see builder scaffold).
+'''
+    parser = ArgumentParser('bench', usage='builder bench [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+    parser.add_argument('--repeat', '-n', default=3, type=int, metavar='<count>', help='Number of runs of each scenario (default is 3)')
+    parser.add_argument('--scenarios', default=','.join(scenario_choices), metavar='<scenario,...>',
+                        help=f'Comma separated scenarios to run among {", ".join(scenario_choices)} (default is all)')
+    parser.add_argument('--synthetic', default='', type=parse_file_counts, metavar='<count,...>',
+                        help='Also run the scenarios on synthetic trees with these numbers of generated sources, for instance 200,2000')
+    parser.add_argument('--config', '-c', default='release', choices=['debug', 'release'], metavar='<configuration>',
+                        help='configuration to build in debug or release (default is release)')
+    parser.add_argument('--output', '-o', default='build/bench/results.json', metavar='<file>',
+                        help='JSON file receiving the results (default is build/bench/results.json)')
+    parser.add_argument('--baseline', '-b', default=None, metavar='<file>', help='Results of a previous run to compare with')
+    parser.add_argument('--threshold', '-t', default=10.0, type=float, metavar='<percent>',
+                        help='Median slowdown against the baseline considered as a regression, making the command fail (default is 10)')
+    parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+    args = parser.parse_args(command_argv)
+    args.workspace_root = workspace_root
+    args.bench_dir = my_utils.normalize_path(f'{workspace_root}/build/bench')
+    args.scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    for scenario in args.scenarios:
+        if scenario not in scenario_choices:
+            my_utils.builder_print_error(f'Unknown bench scenario {scenario}, choose from {", ".join(scenario_choices)}')
+            return 1
+
+    baseline = None
+    if args.baseline:
+        try:
+            baseline = json.loads(Path(my_utils.make_path_absolute(workspace_root, args.baseline)).read_text())
+        except (OSError, ValueError) as e:
+            my_utils.builder_print_error(f'Failed to read the baseline {args.baseline}: {e}')
+            return 1
+
+    trees = [('hello_world', 0)] + [(f'synthetic_{count}', count) for count in args.synthetic]
+    results = {'repeat': args.repeat, 'config': args.config, 'python': platform.python_version(), 'system': platform.platform(),
+               'cpu_count': multiprocessing.cpu_count(), 'trees': {}}
+    try:
+        for tree_name, file_count in trees:
+            results['trees'][tree_name] = bench_tree(args, tree_name, file_count)
+    except RuntimeError as e:
+        my_utils.builder_print_error(f'bench: {e}')
+        return 1
+
+    output_path = my_utils.make_path_absolute(workspace_root, args.output)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    Path(output_path).write_text(json.dumps(results, indent=1))
+    my_utils.builder_print(f'bench: results written to {output_path}')
+
+    if baseline is not None and compare_with_baseline(results, baseline, args.threshold):
+        my_utils.builder_print_error('bench: performance regressions against the baseline')
+        return 1
+    return 0
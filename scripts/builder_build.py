@@ -5,18 +5,50 @@ import sys
 import platform
 import shutil
 import stat
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
-import psutil
 from .my_generic_parser import MyGenericParser
 from . import my_utils
 from . import cmake_utils
+from . import build_timings
+from . import compiler_cache
+from . import compile_modes
+from . import job_policy
+from . import clean_utils
+from . import process_utils
+from . import dist_utils
+from . import deps_utils
+from . import artifact_cache
+from . import event_utils
+from .profile_utils import profiler
 
-app_name = "my_app"
-unit_test_name = "my_app_unit_test"
+# cmake generator name => generator option, of the generators chosen by default
+cmake_generator_names = {'Unix Makefiles': 'makefile', 'Ninja': 'ninja'}
+
+# the generator recorded in the CMakeCache.txt of an existing build directory of the configurations, or None.
+# cmake fails when the generator of a build directory changes, so it is kept until the directory is cleaned.
+def get_recorded_generator(args):
+    if getattr(args, 'clean', False): # builder deps has no --clean
+        return None
+    for config in args.config:
+        try:
+            with open(f'{args.build_root}/{config}/CMakeCache.txt', encoding='utf-8', errors='replace') as cache_file:
+                for line in cache_file:
+                    if line.startswith('CMAKE_GENERATOR:INTERNAL='):
+                        generator = cmake_generator_names.get(line.partition('=')[2].strip())
+                        if generator:
+                            return generator
+                        break
+        except FileNotFoundError:
+            pass
+    return None
 
 def set_generator_if_needed(args):
     args.current_system = platform.system()
-    default_generators = {'Windows': 'msvc15', 'Linux': 'makefile', 'Darwin': 'makefile'}
+    default_unix_generator = 'ninja' if my_utils.which('ninja') else 'makefile'
+    default_generators = {'Windows': 'msvc15', 'Linux': default_unix_generator, 'Darwin': default_unix_generator}
 
     if not args.current_system in list(default_generators.keys()):
         my_utils.builder_print_error(f'The platform {args.current_system} is not supported by the builder')
@@ -28,6 +60,8 @@ def set_generator_if_needed(args):
             return 1
 
         args.generator = default_generators.get(args.current_system)
+        if args.current_system != 'Windows':
+            args.generator = get_recorded_generator(args) or args.generator
         if not args.generator:
             my_utils.builder_print_error(f'No default generator defined for the current system {args.current_system} . Please provide a valid generator option.')
             return 1
@@ -44,6 +78,8 @@ def set_generator_if_needed(args):
             return 1
         else:
             args.cmake_generator = "Unix Makefiles"
+    elif args.generator == 'ninja':
+        args.cmake_generator = "Ninja"
     elif args.generator.startswith('msvc'):
         if args.generator == 'msvc14':
             args.cmake_generator = "Visual Studio 15 2017"
@@ -58,18 +94,55 @@ def set_generator_if_needed(args):
 
     return 0
 
+def get_executable_names(args):
+    return [args.app_name, args.unit_tests_name]
+
+# the processes registered by the builder, only killed if their executable is an output of the configurations being
+# built: the processes of the other configurations may be tested by a concurrent builder command, builder run for instance
+def kill_registered_processes(args):
+    import psutil
+    bin_root = my_utils.normalize_path(f'{args.workspace_root}/bin')
+    config_dirs = [my_utils.normalize_path(f'{root}/{config}') for config in args.config for root in (args.build_root, bin_root)]
+    names = get_executable_names(args)
+    for pid in process_utils.get_registered_pids(args.build_root):
+        try:
+            p = psutil.Process(pid)
+            exe = my_utils.normalize_path(p.exe())
+            name = os.path.splitext(os.path.basename(exe))[0]
+            if name in names and any(exe.startswith(config_dir + os.sep) for config_dir in config_dirs):
+                my_utils.builder_print(f'killing process {name} ({pid})')
+                p.kill()
+            elif name in names and any(exe.startswith(output_dir + os.sep) for output_dir in (args.build_root, bin_root)):
+                continue # an other configuration, still registered
+        except psutil.NoSuchProcess:
+            pass
+        except psutil.Error as e:
+            my_utils.builder_print_warning(f'Failed to kill process {pid}: {e}')
+        process_utils.unregister_process(args.build_root, pid)
+
+def kill_all_processes(args):
+    import psutil
+    names = get_executable_names(args)
+    for p in psutil.process_iter(attrs=["name", "exe", "cmdline"]):
+        process_name = p.info['name']
+        for name in names:
+            if name == process_name or \
+                    p.info['exe'] and os.path.basename(p.info['exe']) == name or \
+                    p.info['cmdline'] and p.info['cmdline'][0] == name:
+
+                my_utils.builder_print(f'killing process {process_name}')
+                p.kill()
+
 def kill_processed_if_needed(args):
+    # --jobs_dry_run only prints the job choice, it must not stop the running app or tests
+    if args.jobs_dry_run:
+        return 0
     if not args.no_build or args.clean:
-        # kill all instance of app or unitests
-        for p in psutil.process_iter(attrs=["name", "exe", "cmdline"]):
-            process_name = p.info['name']
-            for name in [app_name, unit_test_name]:
-                if name == process_name or \
-                        p.info['exe'] and os.path.basename(p.info['exe']) == name or \
-                        p.info['cmdline'] and p.info['cmdline'][0] == name:
-
-                    my_utils.builder_print(f'killing process {process_name}')
-                    p.kill()
+        # kill the instances of app or unitests, only the ones started by the builder unless --kill_all
+        if args.kill_all:
+            kill_all_processes(args)
+        else:
+            kill_registered_processes(args)
     return 0
 
 def create_or_delete_build_directories(args):
@@ -89,7 +162,11 @@ def create_or_delete_build_directories(args):
             my_utils.builder_print_warning(f'Failed to delete file {rpath} : [{excinfo}]. ')
 
     if args.clean and os.path.exists(args.build_dir):
-        shutil.rmtree(args.build_dir, onerror=print_error)
+        # the old build directory is deleted in background while the new build runs
+        if not clean_utils.delete_in_background(args.build_root, args.build_dir):
+            shutil.rmtree(args.build_dir, onerror=print_error)
+    elif args.clean_outputs and os.path.exists(args.build_dir):
+        clean_utils.clean_outputs(args)
 
     if not os.path.exists(args.build_dir):
         os.makedirs(args.build_dir)
@@ -97,7 +174,8 @@ def create_or_delete_build_directories(args):
     return 0
 
 def get_camke_path(args):
-    args.cmake_path = my_utils.normalize_path(shutil.which('cmake'))
+    cmake_path = my_utils.which('cmake')
+    args.cmake_path = my_utils.normalize_path(cmake_path) if cmake_path else None
     if args.cmake_path is None:
         my_utils.builder_print_error(f'Cmake executable not found. Make sure it avaiblable in your PATH environment variable.')
         return 1
@@ -108,7 +186,133 @@ def get_camke_path(args):
     return 0
 
 
+def set_config_build_directories(args, config):
+    args.config = config
+    args.build_dir = my_utils.normalize_path(f'{args.build_root}/{config}')
+    args.app_build_dir = my_utils.normalize_path(f'{args.build_dir}/app')
+    args.lib_build_dir = my_utils.normalize_path(f'{args.build_dir}/lib')
+    args.tests_build_dir = my_utils.normalize_path(f'{args.build_dir}/tests')
+
+# generate and build a single configuration, runs in a worker process when several configurations are built
+def build_config(args):
+    if args.is_multi_config:
+        my_utils.set_output_tag(args.config)
+
+    is_full_build = compile_modes.is_full_build(args)
+    with profiler.span(f'{args.config}: create_or_delete_build_directories'):
+        error = create_or_delete_build_directories(args)
+    if error != 0:
+        return error
+
+    # the prebuilt dependencies are part of the cmake cache, also used by the artifact cache key
+    with profiler.span(f'{args.config}: prepare dependencies'):
+        deps_utils.prepare_googletest(args)
+
+    use_artifact_cache = artifact_cache.is_enabled(args) and not args.no_build
+    if use_artifact_cache:
+        with profiler.span(f'{args.config}: artifact cache restore'):
+            if artifact_cache.restore(args):
+                return 0
+
+    if not args.no_generate:
+        with profiler.span(f'{args.config}: cmake_generate'):
+            error = cmake_utils.cmake_generate(args)
+        if error != 0:
+            return 1
+
+    if not args.no_build:
+        if args.dist_workers:
+            dist_utils.set_build_environment(args)
+        build_start = time.perf_counter()
+        compiler_cache_stats = compiler_cache.get_compiler_cache_stats(args) if args.compiler_cache_path else None
+        with profiler.span(f'{args.config}: cmake_build'):
+            error = cmake_utils.cmake_build(args)
+        if args.compiler_cache_path:
+            compiler_cache.print_compiler_cache_stats(args, compiler_cache_stats)
+        if args.dist_workers:
+            dist_utils.print_stats(args, time.perf_counter() - build_start)
+        if error != 0:
+            return 1
+        if is_full_build:
+            compile_modes.record_full_build(args, time.perf_counter() - build_start)
+        if args.timings:
+            build_timings.write_timings_report(args)
+        if use_artifact_cache:
+            with profiler.span(f'{args.config}: artifact cache store'):
+                artifact_cache.store(args)
+
+    return 0
+
+# the spans recorded in the worker process are sent back to be merged in the main process profile
+def build_config_in_worker(args):
+    # forked workers inherit the spans already recorded by the main process
+    profiler.spans = []
+    args.max_job_memory = 0
+    error = build_config(args)
+    clean_utils.wait_for_background_deletions(args.workspace_root)
+    # the pool workers exit without running the atexit functions
+    event_utils.events.flush()
+    return error, profiler.spans, args.max_job_memory
+
+# the distributed builds run as many more jobs as the reachable workers accept
+def get_dist_workers_jobs(args, config_count, reasons):
+    statuses = args.dist_worker_statuses
+    worker_jobs = sum(status['jobs'] for status in statuses.values()) // config_count
+    reasons.append(f'{len(statuses)} reachable distributed build workers accept {worker_jobs} more jobs')
+    return worker_jobs
+
+def build_configs(args, configs):
+    # the cpu budget is split between the configurations instead of each one taking all cores
+    jobs, max_load, reasons = job_policy.choose_jobs(args, len(configs))
+    if args.dist_workers:
+        if not args.dist_token:
+            my_utils.builder_print_error('--dist_workers requires the token of the workers: set dist_token in builder-config.txt, '
+                                         'the BUILDER_DIST_TOKEN environment variable or --dist_token')
+            return 1
+        dist_utils.query_workers(args)
+    if args.dist_workers and args.jobs == 'auto':
+        jobs += get_dist_workers_jobs(args, len(configs), reasons)
+    event_utils.emit('jobs', command='build', configs=configs, jobs=jobs, max_load=max_load, reasons=reasons)
+    if args.verbose or args.jobs_dry_run:
+        job_policy.print_job_choice(jobs, max_load, reasons)
+    if args.jobs_dry_run:
+        return 0
+
+    config_args_list = []
+    for config in configs:
+        config_args = copy.copy(args)
+        set_config_build_directories(config_args, config)
+        config_args.build_jobs = jobs
+        config_args.build_max_load = max_load
+        config_args.is_multi_config = len(configs) > 1
+        config_args_list.append(config_args)
+
+    if len(configs) == 1:
+        config_args = config_args_list[0]
+        config_args.max_job_memory = 0
+        results = [(build_config(config_args), [], config_args.max_job_memory)]
+    else:
+        my_utils.builder_print(f'Building configurations {", ".join(configs)} concurrently with {jobs} jobs each')
+        with ProcessPoolExecutor(max_workers=len(configs)) as executor:
+            results = list(executor.map(build_config_in_worker, config_args_list))
+        for _, spans, _ in results:
+            profiler.spans.extend(spans)
+
+    max_job_memory = max(result[2] for result in results)
+    if max_job_memory > 0:
+        job_policy.save_max_job_memory(args, max_job_memory)
+
+    errors = [result[0] for result in results]
+
+    error = 0
+    for config, config_error in zip(configs, errors):
+        if config_error != 0:
+            my_utils.builder_print_error(f'Build of configuration {config} failed')
+            error = config_error
+    return error
+
 def main(workspace_root, command_argv, argv):
+    main_start = time.perf_counter()
     desc = '''
 builder make [options]     run cmake to generate and build solution
 
@@ -119,13 +323,13 @@ See 'builder make --help' for more information on this command.
     my_parser = MyGenericParser(parser, workspace_root)
     my_parser.add_args_for_build_command()
     args = my_parser.parse_args_with_config_file(command_argv)
+    profiler.add_span('parse arguments', main_start, time.perf_counter())
 
     args.workspace_root = workspace_root
 
-    args.build_dir = my_utils.normalize_path(f'{workspace_root}/build')
-    args.app_build_dir = my_utils.normalize_path(f'{args.build_dir}/app')
-    args.lib_build_dir = my_utils.normalize_path(f'{args.build_dir}/lib')
-    args.tests_build_dir = my_utils.normalize_path(f'{args.build_dir}/tests')
+    # each configuration is built in its own directory: build/debug, build/release
+    configs = args.config
+    args.build_root = my_utils.normalize_path(f'{workspace_root}/build')
     args.no_build = False if args.rebuild else args.no_build
 
     if args.app_name is None:
@@ -139,21 +343,34 @@ See 'builder make --help' for more information on this command.
         my_utils.builder_print_command(workspace_root, argv)
         print(str(args).replace(', ', ', \n'))
 
+    try:
+        return run_build_steps(args, configs)
+    finally:
+        if args.profile:
+            write_profile(args)
+        clean_utils.wait_for_background_deletions(workspace_root)
+
+def run_build_steps(args, configs):
     for f in [set_generator_if_needed,
               kill_processed_if_needed,
-              create_or_delete_build_directories,
-              set_generator_if_needed,
-              get_camke_path]:
-        error = f(args)
+              get_camke_path,
+              compiler_cache.resolve_compiler_cache]:
+        with profiler.span(f.__name__):
+            error = f(args)
         if error != 0:
             return error
 
-    if not args.no_generate:
-        if cmake_utils.cmake_generate(args) != 0:
-            return 1
+    if args.timings and args.generator.startswith('msvc'):
+        my_utils.builder_print_warning('--timings is not supported by the msvc generators, ignoring it')
+        args.timings = False
 
-    if not args.no_build:
-        if cmake_utils.cmake_build(args) != 0:
-            return 1
+    with profiler.span('build configurations'):
+        return build_configs(args, configs)
 
-    return 0
+def write_profile(args):
+    profiler.add_interpreter_startup_span(end=min(span[1] for span in profiler.spans))
+    profile_path = my_utils.make_path_absolute(args.workspace_root, args.profile)
+    summary = profiler.write(profile_path)
+    my_utils.builder_print(f'Profile written to: {profile_path}')
+    for line in summary.splitlines():
+        my_utils.builder_print(line)
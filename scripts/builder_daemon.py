@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import socket
+import signal
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from . import my_utils
+from . import config_store
+from . import daemon_client
+from . import event_utils
+
+# Long lived builder process serving the build and unit-tests commands on a unix socket.
+# The imports, the tool lookups and the parsed config stay warm in the daemon: each command runs in a process forked
+# from it, with its stdout/stderr redirected to the client connection.
+
+def warm_state(workspace_root):
+    # the forked commands inherit the modules and caches of the daemon
+    from . import builder_main
+    for command in daemon_client.forwarded_commands:
+        builder_main.import_command_module(command)
+    # the modules deferred out of the builder startup
+    import psutil # pylint: disable=W0611
+    for tool in ['cmake', 'ninja', 'ccache', 'sccache']:
+        my_utils.which(tool)
+    config_store.read_config_sections(workspace_root, config_store.get_config_paths(workspace_root))
+
+def read_request(connection):
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = connection.recv(64 * 1024)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data.decode('utf-8')) if data else None
+
+def run_forked_command(workspace_root, connection, request):
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    # child process: run the command with its output sent to the client
+    exit_code = 1
+    try:
+        # the default SIGCHLD disposition, subprocess can't read the exit code of the commands without it
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.environ.clear()
+        os.environ.update(request.get('env', {}))
+        os.chdir(workspace_root)
+        os.dup2(connection.fileno(), 1)
+        os.dup2(connection.fileno(), 2)
+        from . import builder_main
+        exit_code = builder_main.main(workspace_root, ['my_builder.py'] + request['argv']) or 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except BaseException as e: # pylint: disable=W0703
+        my_utils.builder_print_error(f'builder daemon: {e}')
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        event_utils.events.flush()
+        connection.sendall(daemon_client.exit_code_marker + f'{exit_code}\n'.encode('utf-8'))
+        os._exit(0)
+
+# the forked commands are not waited for when they run: the finished ones are reaped between the requests
+reap_interval = 1.0
+
+def reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return # no child left
+        if pid == 0:
+            return # the other children are still running
+
+def serve(workspace_root):
+    socket_path = daemon_client.get_socket_path(workspace_root)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    warm_state(workspace_root)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(8)
+    server.settimeout(reap_interval)
+    my_utils.builder_print(f'builder daemon listening on {socket_path}')
+    try:
+        while True:
+            reap_children()
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            connection.settimeout(None)
+            with connection:
+                request = read_request(connection)
+                if request is None:
+                    continue
+                if request['command'] == 'stop':
+                    connection.sendall(b'stopping\n')
+                    break
+                if request['command'] == 'status':
+                    connection.sendall(f'running pid {os.getpid()}\n'.encode('utf-8'))
+                    continue
+                warm_state(workspace_root)
+                run_forked_command(workspace_root, connection, request)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    my_utils.builder_print('builder daemon stopped')
+    return 0
+
+def send_control_request(workspace_root, command):
+    client = daemon_client.connect(workspace_root)
+    if client is None:
+        my_utils.builder_print('No builder daemon running')
+        return 1
+    with client:
+        daemon_client.send_request(client, {'command': command})
+        my_utils.builder_print(f'builder daemon: {client.recv(1024).decode("utf-8").strip()}')
+    return 0
+
+def main(workspace_root, command_argv, argv):
+    desc = '''
+builder daemon [options]     run a builder daemon serving the build and unit-tests commands of this workspace
+
+While the daemon runs, `builder build` and `builder unit-tests` are forwarded to it and skip the builder startup.
+Without daemon they run in process as usual. Only supported on unix.
+'''
+    parser = ArgumentParser('daemon', usage='builder daemon [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+    parser.add_argument('--stop', default=False, action='store_true', help='Stop the running daemon')
+    parser.add_argument('--status', default=False, action='store_true', help='Tell whether a daemon is running')
+    parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+    args = parser.parse_args(command_argv)
+
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork'):
+        my_utils.builder_print_error('The builder daemon is only supported on unix')
+        return 1
+
+    if args.stop:
+        return send_control_request(workspace_root, 'stop')
+    if args.status:
+        return send_control_request(workspace_root, 'status')
+
+    if daemon_client.connect(workspace_root) is not None:
+        my_utils.builder_print_error('A builder daemon is already running for this workspace')
+        return 1
+    return serve(workspace_root)
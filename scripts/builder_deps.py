@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from .my_generic_parser import MyGenericParser
+from . import my_utils
+from . import deps_utils
+from . import builder_build
+
+def main(workspace_root, command_argv, argv):
+    desc = '''
+builder deps [options]     fetch, build and verify the dependencies (googletest) of the dependency cache
+
+The pinned googletest sources are copied from --source, from the googletest package of the distribution, or downloaded
+and verified with their sha256. They are built once per toolchain and configuration in the cache shared by the
+workspaces (see --deps_cache_dir), so builds neither need the network nor rebuild googletest after a clean.
+'''
+    parser = ArgumentParser('deps', usage='builder deps [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+
+    my_parser = MyGenericParser(parser, workspace_root)
+    my_parser.add_args_for_config_command()
+    parser.add_argument('--config', '-c', default='all', type=my_parser.to_config_list, metavar='<configuration>',
+                        help='configurations to build the dependencies for, debug, release, a comma separated list of them or all (default is all)')
+    parser.add_argument('--source', '-s', default=None, metavar='<dir|archive>',
+                        help='Copy the googletest sources from this directory or archive instead of the default sources')
+    parser.add_argument('--offline', default=False, action='store_true', help='Do not download the sources')
+    parser.add_argument('--verify', default=False, action='store_true', help='Only verify the sources and builds already in the cache')
+    parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+    args = my_parser.parse_args_with_config_file(command_argv)
+
+    args.workspace_root = workspace_root
+    args.build_root = my_utils.normalize_path(f'{workspace_root}/build')
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    if args.deps_cache_dir == 'none':
+        my_utils.builder_print_error('The dependency cache is disabled by --deps_cache_dir none')
+        return 1
+    cache_dir = deps_utils.get_cache_dir(args)
+    dependency = deps_utils.googletest
+
+    if not args.verify:
+        for f in [builder_build.set_generator_if_needed, builder_build.get_camke_path]:
+            error = f(args)
+            if error != 0:
+                return error
+
+        source = my_utils.make_path_absolute(workspace_root, args.source) if args.source else None
+        if source and not os.path.exists(source):
+            my_utils.builder_print_error(f'{source} not found')
+            return 1
+        sources_dir = deps_utils.fetch_sources(args, dependency, source, allow_download=not args.offline)
+        if sources_dir is None:
+            my_utils.builder_print_error(f'{dependency["name"]} {dependency["version"]} sources are not available')
+            return 1
+        for config in args.config:
+            args.config = config
+            install_dir = deps_utils.build_dependency(args, dependency, sources_dir)
+            if install_dir is None:
+                return 1
+            my_utils.builder_print(f'{dependency["name"]} {dependency["version"]} ({config}): {install_dir}')
+
+    problems = deps_utils.verify_cache(args, dependency)
+    for problem in problems:
+        my_utils.builder_print_error(problem)
+    if not problems:
+        my_utils.builder_print(f'dependency cache {cache_dir} verified')
+    return 1 if problems else 0
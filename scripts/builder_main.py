@@ -3,53 +3,106 @@
 # Disable R0911:Too many return statements due to yes builder_main is just a big switch as designed
 # pylint: disable=R0911
 
+import os
 import sys
+import time
+import importlib
 from argparse import ArgumentParser, RawDescriptionHelpFormatter, ArgumentError
 from .my_utils import builder_print_error
-try:
-    from . import builder_build, builder_config, builder_system_tests, builder_unit_tests, my_utils
-except ModuleNotFoundError as e:
-    builder_print_error(f'{e}: install required modules with command: `py -3 -m pip install -r scripts/builder/requirements.txt`')
-    sys.exit(1)
+from . import profile_utils
+from . import event_utils
+
+# command => module implementing it with a main(workspace_root, command_argv, argv) function.
+# The modules are imported when their command runs, so `builder help` or `builder config` don't pay for the build imports.
+command_modules = {
+    'build': 'builder_build',
+    'config': 'builder_config',
+    'deps': 'builder_deps',
+    'unit-tests': 'builder_unit_tests',
+    'system-tests': 'builder_system_tests',
+    'bench': 'builder_bench',
+    'scaffold': 'builder_scaffold',
+    'run': 'builder_run',
+    'watch': 'builder_watch',
+    'worker': 'builder_worker',
+    'daemon': 'builder_daemon',
+}
 
 main_desc = '''
 Command
     'build'                   Generate/Build with Cmake
     'config'                  Create builder-config.txt to store options in a text file that will be read in subsequent calls to the builder
 
+    'deps'                    Fetch, build and verify the googletest dependency cache shared by the workspaces
+
     'unit-tests'              Run the unit tests (requires the unit tests to have been built)
     'system-tests'            Run the system tests (requires the app to have been built)
 
+    'run'                     Run several commands in one builder process, as a graph of concurrent steps (see run --plan)
+
+    'bench'                   Time the edit-build-test loop scenarios and compare them with a baseline
+    'scaffold'                Generate a large multi library project to measure how the builder scales
+    'watch'                   Rebuild and rerun the unit tests when the sources change
+    'worker'                  Run a worker compiling the jobs of distributed builds (see build --dist_workers)
+    'daemon'                  Run a builder daemon serving the build and unit-tests commands to skip the builder startup
+
     'help', '-h', '--help'    Print this help
 
+Options
+    --startup-profile [<command>]   Run the command (default is help) with python -X importtime and report the startup costs
+    --events jsonl[:<path>]         Append a JSON lines stream of the builder events to path (default is build/events.jsonl),
+                                    also set with the BUILDER_EVENTS environment variable. Follow it with `tail -f <path>`
+
     See 'builder <command> --help' for more information on a specific command.
 '''
 
+def import_command_module(command):
+    try:
+        return importlib.import_module(f'.{command_modules[command]}', __package__)
+    except ModuleNotFoundError as e:
+        builder_print_error(f'{e}: install required modules with command: `py -3 -m pip install -r scripts/builder/requirements.txt`')
+        sys.exit(1)
+
+def run_command(workspace_root, command, command_argv, argv):
+    event_utils.emit('command_start', command=command, argv=argv)
+    start = time.perf_counter()
+    exit_code = 1
+    try:
+        exit_code = import_command_module(command).main(workspace_root, command_argv, argv)
+        return exit_code
+    except SystemExit as e:
+        exit_code = e.code
+        raise
+    finally:
+        event_utils.emit('command_end', command=command, exit_code=exit_code or 0, duration=time.perf_counter() - start)
+
 def main(workspace_root, sys_argv=None):
     sys_argv = sys_argv if sys_argv else sys.argv
-    command_choices = ['help', 'build', 'config', 'unit-tests', 'system-tests', 'lint']
+    command_choices = ['help'] + list(command_modules) + ['lint']
 
-    main_parser = ArgumentParser(add_help=False, formatter_class=RawDescriptionHelpFormatter, description=main_desc)
+    argv = sys_argv[1:]
+    if argv and argv[0] == '--startup-profile':
+        return profile_utils.report_startup_profile(workspace_root, argv[1:] if len(argv) > 1 else ['help'])
+
+    # no abbreviations: the options of the commands must not be taken for --events
+    main_parser = ArgumentParser(add_help=False, allow_abbrev=False, formatter_class=RawDescriptionHelpFormatter, description=main_desc)
     main_parser.add_argument('command', nargs='?', default='help', choices=command_choices, help='', metavar='<command>')
+    main_parser.add_argument('--events', default=os.environ.get(event_utils.events_env_var), help='', metavar='jsonl[:<path>]')
 
-    argv = sys_argv[1:]
     args, command_argv = main_parser.parse_known_args(argv)
 
+    if args.events:
+        error = event_utils.events.open(workspace_root, args.events)
+        if error:
+            builder_print_error(error)
+            return 1
+
     try:
         if args.command in ('help', '-h'):
             return main_parser.print_help()
 
-        if args.command == 'config':
-            return builder_config.main(workspace_root, command_argv, argv)
-
-        if args.command == 'build':
-            return builder_build.main(workspace_root, command_argv, argv)
-
-        if args.command == 'unit-tests':
-            return builder_unit_tests.main(workspace_root, command_argv, argv)
-
-        if args.command == 'system-tests':
-            return builder_system_tests.main(workspace_root, command_argv, argv)
+        if args.command in command_modules:
+            return run_command(workspace_root, args.command, command_argv, argv)
 
     except ArgumentError:
         # Same behavior than argparse for ArgumentError raised out of argparse
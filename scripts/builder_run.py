@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shlex
+import subprocess
+import traceback
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from . import my_utils
+from . import test_utils
+from . import event_utils
+from . import job_policy
+from .my_generic_parser import config_choices
+from .profile_utils import profiler
+
+# builder run: runs several builder commands in one builder process, as a graph of steps.
+# The imports, tool lookups and config snapshot are warmed once, then each step runs in a process forked from the
+# builder (a new builder process on Windows), with its output in build/logs/run_<step>.log.
+# Independent steps run concurrently, for instance the tests of a configuration while an other one is building.
+
+# commands whose dependencies are inferred from their configurations, the other commands run alone in order
+configured_commands = ['build', 'unit-tests', 'system-tests']
+
+class Step:
+    def __init__(self, name, argv, needs=None):
+        self.name = name
+        self.argv = argv
+        self.command = argv[0] if argv else 'help'
+        self.configs = get_step_configs(argv)
+        self.needs = needs # names of the steps to run before, inferred when None
+        self.concurrent_builds = 1 # build steps, including this one, that can run at the same time
+        self.state = 'pending' # pending, running, passed, failed, skipped
+        self.start = None
+        self.end = None
+        self.pid = None
+        self.process = None
+        self.log_path = None
+
+    def get_duration(self):
+        return self.end - self.start if self.start is not None and self.end is not None else 0
+
+# the configurations read from --config/-c, with the defaults of the commands
+def get_step_configs(argv):
+    value = 'release'
+    for i, arg in enumerate(argv[:-1]):
+        if arg in ('--config', '-c'):
+            value = argv[i + 1]
+    if value == 'all':
+        return set(config_choices)
+    return {config.strip() for config in value.split(',')}
+
+def get_step_name(argv, names):
+    base_name = '-'.join([argv[0] if argv else 'help'] + sorted(get_step_configs(argv)))
+    name, index = base_name, 2
+    while name in names:
+        name, index = f'{base_name}-{index}', index + 1
+    return name
+
+def to_argv(command):
+    return shlex.split(command) if isinstance(command, str) else [str(arg) for arg in command]
+
+# plan files are toml (python 3.11+) or json:
+#   [[steps]]
+#   name = "build"                       optional, default is the command and its configurations
+#   command = "build --config debug"     or a list of arguments
+#   needs = ["config"]                   optional, inferred from the commands and configurations by default
+def read_plan(plan_path):
+    with open(plan_path, 'rb') as plan_file:
+        content = plan_file.read()
+    if plan_path.endswith('.toml'):
+        try:
+            import tomllib
+        except ModuleNotFoundError:
+            raise ValueError(f'{plan_path}: toml plans require python 3.11+, use a json plan instead')
+        plan = tomllib.loads(content.decode('utf-8'))
+    else:
+        plan = json.loads(content.decode('utf-8'))
+
+    steps = []
+    for entry in plan.get('steps', []):
+        if 'command' not in entry:
+            raise ValueError(f'{plan_path}: a step has no command')
+        argv = to_argv(entry['command'])
+        name = entry.get('name') or get_step_name(argv, [step.name for step in steps])
+        steps.append(Step(name, argv, entry.get('needs')))
+    return steps, plan.get('max_parallel')
+
+# build steps need the previous builds and tests of their configurations, test steps the previous builds of theirs.
+# The other commands, like config, need all the previous steps and all the next steps need them.
+def infer_needs(steps):
+    for index, step in enumerate(steps):
+        if step.needs is not None:
+            continue
+        step.needs = []
+        for previous in steps[:index]:
+            if step.command not in configured_commands or previous.command not in configured_commands:
+                step.needs.append(previous.name)
+            elif step.configs & previous.configs and (step.command == 'build' or previous.command == 'build'):
+                step.needs.append(previous.name)
+
+def check_graph(steps):
+    names = {step.name for step in steps}
+    if len(names) != len(steps):
+        return 'Step names must be unique'
+    for step in steps:
+        unknown = [need for need in step.needs if need not in names]
+        if unknown:
+            return f'Step {step.name} needs unknown steps: {", ".join(unknown)}'
+    # a step can only be visited once all the steps it needs are
+    visited = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [step for step in remaining if all(need in visited for need in step.needs)]
+        if not ready:
+            return f'Dependency cycle between the steps {", ".join(step.name for step in remaining)}'
+        for step in ready:
+            visited.add(step.name)
+            remaining.remove(step)
+    return None
+
+def get_all_needs(step, steps_by_name):
+    all_needs = set()
+    pending = list(step.needs)
+    while pending:
+        name = pending.pop()
+        if name not in all_needs:
+            all_needs.add(name)
+            pending.extend(steps_by_name[name].needs)
+    return all_needs
+
+# the build steps not ordered with a build step can run at the same time: each one builds with its share of the
+# cpus instead of all of them. The group of steps running together is built in plan order, up to max_parallel steps
+def set_concurrent_builds(steps, max_parallel):
+    steps_by_name = {step.name: step for step in steps}
+    build_steps = [step for step in steps if step.command == 'build']
+    all_needs = {step.name: get_all_needs(step, steps_by_name) for step in build_steps}
+
+    def is_concurrent(step, other):
+        return other.name not in all_needs[step.name] and step.name not in all_needs[other.name]
+
+    for step in build_steps:
+        group = [step]
+        for other in build_steps:
+            if other is not step and len(group) < max_parallel and all(is_concurrent(member, other) for member in group):
+                group.append(other)
+        step.concurrent_builds = len(group)
+
+def warm_state(workspace_root, steps):
+    # the forked steps inherit the modules and caches of the builder
+    from . import builder_daemon
+    from . import builder_main
+    builder_daemon.warm_state(workspace_root)
+    for step in steps:
+        if step.command in builder_main.command_modules:
+            builder_main.import_command_module(step.command)
+
+def run_step_in_child(workspace_root, step, log_fd):
+    exit_code = 1
+    try:
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+        profiler.spans = []
+        my_utils.set_output_tag(step.name)
+        os.environ[job_policy.concurrent_builds_env_var] = str(step.concurrent_builds)
+        from . import builder_main
+        exit_code = builder_main.main(workspace_root, ['my_builder.py'] + step.argv) or 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except BaseException: # pylint: disable=W0703
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        event_utils.events.flush()
+        os._exit(exit_code)
+
+def start_step(args, step):
+    step.log_path = my_utils.normalize_path(f'{args.build_root}/logs/run_{step.name}.log')
+    os.makedirs(os.path.dirname(step.log_path), exist_ok=True)
+    my_utils.builder_print(f'run: starting {step.name}: builder {" ".join(step.argv)}')
+    step.state = 'running'
+    step.start = time.perf_counter()
+    with open(step.log_path, 'wb') as log_file:
+        if hasattr(os, 'fork'):
+            sys.stdout.flush()
+            sys.stderr.flush()
+            step.pid = os.fork()
+            if step.pid == 0:
+                run_step_in_child(args.workspace_root, step, log_file.fileno())
+        else:
+            cmd = [sys.executable, f'{args.workspace_root}/my_builder.py'] + step.argv
+            env = dict(os.environ, **{job_policy.concurrent_builds_env_var: str(step.concurrent_builds)})
+            step.process = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT, cwd=args.workspace_root, env=env)
+
+# returns the exit code of the step, or None while it runs
+def poll_step(step):
+    if step.process is not None:
+        return step.process.poll()
+    pid, status = os.waitpid(step.pid, os.WNOHANG)
+    if pid == 0:
+        return None
+    return os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+
+def finish_step(args, step, exit_code):
+    step.end = time.perf_counter()
+    step.state = 'passed' if exit_code == 0 else 'failed'
+    profiler.add_span(step.name, step.start, step.end)
+    if exit_code == 0:
+        my_utils.builder_print(f'run: {step.name} passed in {step.get_duration():.2f} seconds')
+        if args.verbose:
+            test_utils.print_log_tail(step.log_path, None)
+    else:
+        my_utils.builder_print_error(f'run: {step.name} failed with exit code {exit_code} in {step.get_duration():.2f} seconds, '
+                                     f'end of {step.log_path}:')
+        test_utils.print_log_tail(step.log_path)
+
+def run_steps(args, steps):
+    steps_by_name = {step.name: step for step in steps}
+    stop = False
+    while True:
+        for step in steps:
+            if step.state != 'pending':
+                continue
+            needs = [steps_by_name[need] for need in step.needs]
+            if stop or any(need.state in ('failed', 'skipped') for need in needs):
+                step.state = 'skipped'
+                my_utils.builder_print_warning(f'run: skipping {step.name}')
+            elif all(need.state == 'passed' for need in needs) and \
+                    sum(1 for other in steps if other.state == 'running') < args.max_parallel:
+                start_step(args, step)
+
+        running = [step for step in steps if step.state == 'running']
+        if not running:
+            break
+        time.sleep(0.05)
+        for step in running:
+            exit_code = poll_step(step)
+            if exit_code is not None:
+                finish_step(args, step, exit_code)
+                if exit_code != 0 and not args.keep_going:
+                    stop = True
+
+# the chain of steps, each needed by the next one, with the longest total duration
+def get_critical_path(steps):
+    steps_by_name = {step.name: step for step in steps}
+    path_durations = {} # name => (duration of the longest path ending with the step, previous step)
+    for step in steps: # resolved recursively, the graph is checked acyclic
+        resolve_path_duration(step, steps_by_name, path_durations)
+    if not path_durations:
+        return [], 0
+    name = max(path_durations, key=lambda name: path_durations[name][0])
+    total = path_durations[name][0]
+    path = []
+    while name is not None:
+        path.append(steps_by_name[name])
+        name = path_durations[name][1]
+    return list(reversed(path)), total
+
+def resolve_path_duration(step, steps_by_name, path_durations):
+    if step.name not in path_durations:
+        previous = None
+        for need in step.needs:
+            resolve_path_duration(steps_by_name[need], steps_by_name, path_durations)
+            if previous is None or path_durations[need][0] > path_durations[previous][0]:
+                previous = need
+        previous_duration = path_durations[previous][0] if previous else 0
+        path_durations[step.name] = (previous_duration + step.get_duration(), previous)
+    return path_durations[step.name]
+
+def print_report(steps, duration):
+    my_utils.builder_print(f'{"step":>24} {"state":>8} {"start (s)":>10} {"duration (s)":>13}')
+    origin = min((step.start for step in steps if step.start is not None), default=0)
+    for step in steps:
+        start = f'{step.start - origin:10.2f}' if step.start is not None else f'{"-":>10}'
+        my_utils.builder_print(f'{step.name:>24} {step.state:>8} {start} {step.get_duration():13.2f}')
+
+    path, path_duration = get_critical_path(steps)
+    steps_duration = sum(step.get_duration() for step in steps)
+    my_utils.builder_print(f'run: critical path {" -> ".join(step.name for step in path)}: {path_duration:.2f} seconds')
+    my_utils.builder_print(f'run: done in {duration:.2f} seconds, {steps_duration:.2f} seconds of steps')
+
+def main(workspace_root, command_argv, argv):
+    desc = '''
+builder run [options] [<command> ...]     run several builder commands in one builder process, as a graph of steps
+
+The steps are given with --plan <file> or as quoted commands, for instance:
+    builder run "build --config debug,release" "unit-tests --config debug" "system-tests --config release"
+
+Unless a plan step lists its needs, build steps run after the previous builds and tests of their configurations,
+test steps after the previous builds of their configurations, and the other commands (config...) alone in order.
+Independent steps run concurrently. The output of each step is written to build/logs/run_<step>.log.
+'''
+    parser = ArgumentParser('run', usage='builder run [options] [<command> ...]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+    parser.add_argument('commands', nargs='*', metavar='<command>', help='builder commands with their options, run in this order when they depend on each other')
+    parser.add_argument('--plan', '-p', default=None, metavar='<file>',
+                        help='Steps to run, in a toml (python 3.11+) or json file with a list of steps: name, command and needs')
+    parser.add_argument('--max_parallel', '-m', default=None, type=int, metavar='<count>',
+                        help='Maximum number of steps running concurrently, default is the max_parallel of the plan or 2')
+    parser.add_argument('--keep_going', '-k', default=False, action='store_true',
+                        help='Keep running the steps not depending on a failed step, instead of stopping at the first failure')
+    parser.add_argument('--dry_run', default=False, action='store_true', help='Print the steps and their needs without running them')
+    parser.add_argument('--profile', default=None, metavar='<file>',
+                        help='Write the wall clock time of each step to <file> as chrome trace events, and a sorted summary to <file>.txt')
+    parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose, printing the output of all the steps')
+    args = parser.parse_args(command_argv)
+
+    args.workspace_root = workspace_root
+    args.build_root = my_utils.normalize_path(f'{workspace_root}/build')
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    plan_max_parallel = None
+    steps = []
+    try:
+        if args.plan:
+            steps, plan_max_parallel = read_plan(my_utils.make_path_absolute(workspace_root, args.plan))
+        for command in args.commands:
+            command_args = to_argv(command)
+            steps.append(Step(get_step_name(command_args, [step.name for step in steps]), command_args))
+    except (OSError, ValueError) as e:
+        my_utils.builder_print_error(f'Invalid plan: {e}')
+        return 1
+    if not steps:
+        my_utils.builder_print_error('No step to run, give a --plan or commands')
+        return 1
+    if any(step.command == 'run' for step in steps):
+        my_utils.builder_print_error('run steps cannot run other run commands')
+        return 1
+    args.max_parallel = max(1, args.max_parallel or plan_max_parallel or 2)
+
+    infer_needs(steps)
+    error = check_graph(steps)
+    if error:
+        my_utils.builder_print_error(error)
+        return 1
+    set_concurrent_builds(steps, args.max_parallel)
+
+    if args.dry_run:
+        for step in steps:
+            my_utils.builder_print(f'run: {step.name}: builder {" ".join(step.argv)}, needs: {", ".join(step.needs) or "nothing"}')
+        return 0
+
+    start = time.perf_counter()
+    warm_state(workspace_root, steps)
+    run_steps(args, steps)
+    print_report(steps, time.perf_counter() - start)
+
+    if args.profile:
+        profile_path = my_utils.make_path_absolute(workspace_root, args.profile)
+        profiler.write(profile_path)
+        my_utils.builder_print(f'Profile written to: {profile_path}')
+    return 0 if all(step.state == 'passed' for step in steps) else 1
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import random
+from pathlib import Path
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from . import my_utils
+
+# builder scaffold: generates a large multi library project, built by the existing CMakeLists.txt/find_source_files flow:
+# the libraries are sub directories of src/lib (compiled in the lib target) and their tests are in src/tests.
+
+workspace_files = ['my_builder.py', 'CMakeLists.txt', 'CMakeLists.txt.in', 'scripts', 'src']
+scaffold_dir_name = 'scaffold'
+# written in the generated workspaces: only the directories holding it are deleted by the next scaffold
+marker_name = '.builder-scaffold'
+sub_dirs_per_level = 4
+
+# returns an error message or None
+def copy_workspace(workspace_root, destination):
+    real_root, real_destination = os.path.realpath(workspace_root), os.path.realpath(destination)
+    if os.path.commonpath([real_root, real_destination]) == real_destination:
+        return f'{destination} contains the workspace, choose an other --output'
+    if os.path.exists(destination):
+        if not os.path.isdir(destination):
+            return f'{destination} is not a directory'
+        if os.path.isfile(f'{destination}/{marker_name}'):
+            shutil.rmtree(destination)
+        elif os.listdir(destination):
+            return f'{destination} is not empty and was not generated by builder scaffold'
+    os.makedirs(destination, exist_ok=True)
+    Path(f'{destination}/{marker_name}').write_text('generated by builder scaffold, deleted by the next one\n')
+    for name in workspace_files:
+        source = f'{workspace_root}/{name}'
+        if os.path.isdir(source):
+            shutil.copytree(source, f'{destination}/{name}', ignore=shutil.ignore_patterns('__pycache__'))
+        elif os.path.exists(source):
+            shutil.copy2(source, f'{destination}/{name}')
+
+class Unit:
+    def __init__(self, lib, index, include_path):
+        self.lib = lib
+        self.index = index
+        self.include_path = include_path # relative to src/lib
+        self.function = f'function_{index}'
+        self.namespace = f'ScaffoldLib{lib}'
+        self.includes = []
+
+def get_unit_dir(lib, index_in_lib, depth):
+    # spread the units of a library in a tree of depth levels with sub_dirs_per_level sub directories per level
+    parts = [f'lib_{lib}']
+    value = index_in_lib
+    for level in range(depth):
+        parts.append(f'level{level}_{value % sub_dirs_per_level}')
+        value //= sub_dirs_per_level
+    return '/'.join(parts)
+
+def create_units(files, depth, libs, fan_out, rng):
+    units = []
+    files_per_lib = max(1, files // libs)
+    for index in range(files):
+        lib = min(index // files_per_lib, libs - 1)
+        index_in_lib = index - lib * files_per_lib
+        unit = Unit(lib, index, f'{scaffold_dir_name}/{get_unit_dir(lib, index_in_lib, depth)}/unit_{index}.h')
+        # include units created before: same or lower libraries, so there is no cycle
+        if units:
+            unit.includes = rng.sample(units, min(fan_out, len(units)))
+        units.append(unit)
+    return units
+
+def write_unit(lib_dir, unit):
+    header_path = f'{lib_dir}/{unit.include_path}'
+    os.makedirs(os.path.dirname(header_path), exist_ok=True)
+    Path(header_path).write_text(
+        '#pragma once\n#include <string>\n#include <vector>\n\n'
+        f'namespace {unit.namespace} {{\nint {unit.function}(int value);\nstd::string {unit.function}_name();\n}}\n')
+
+    includes = ''.join(f'#include "{include.include_path}"\n' for include in unit.includes)
+    calls = ''.join(f'    result += {include.namespace}::{include.function}(value - 1);\n' for include in unit.includes)
+    Path(header_path[:-2] + '.cpp').write_text(
+        f'#include "{unit.include_path}"\n{includes}#include <algorithm>\n#include <map>\n\n'
+        f'namespace {unit.namespace} {{\n'
+        f'int {unit.function}(int value) {{\n    if (value <= 0)\n        return {unit.index};\n    int result = value;\n{calls}'
+        f'    std::vector<int> values(static_cast<size_t>(value % 16), result);\n'
+        f'    return static_cast<int>(std::count(values.begin(), values.end(), result)) + result % 1000;\n}}\n\n'
+        f'std::string {unit.function}_name() {{\n    std::map<int, std::string> names{{{{{unit.index}, "{unit.function}"}}}};\n'
+        f'    return names[{unit.index}];\n}}\n}}\n')
+
+def write_tests(tests_dir, units, libs, tests_per_lib):
+    os.makedirs(tests_dir, exist_ok=True)
+    for lib in range(libs):
+        lib_units = [unit for unit in units if unit.lib == lib][:tests_per_lib]
+        if not lib_units:
+            continue
+        includes = ''.join(f'#include "{unit.include_path}"\n' for unit in lib_units)
+        tests = ''.join(f'TEST(ScaffoldLib{lib}, Unit{unit.index}) {{\n'
+                        f'    EXPECT_EQ(std::string("{unit.function}"), {unit.namespace}::{unit.function}_name());\n'
+                        f'    EXPECT_EQ({unit.index}, {unit.namespace}::{unit.function}(0));\n}}\n\n' for unit in lib_units)
+        Path(f'{tests_dir}/test_lib_{lib}.cpp').write_text(f'#include "gtest/gtest.h"\n{includes}#include <string>\n\n{tests}')
+
+# generates the project sources in the workspace, returns the path of the most included header
+def generate_project(workspace, files, depth, libs, fan_out, tests_per_lib=10, seed=0):
+    rng = random.Random(seed)
+    libs = max(1, min(libs, files))
+    lib_dir = f'{workspace}/src/lib'
+    tests_dir = f'{workspace}/src/tests/{scaffold_dir_name}'
+    for directory in [f'{lib_dir}/{scaffold_dir_name}', tests_dir]:
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+    units = create_units(files, depth, libs, fan_out, rng)
+    for unit in units:
+        write_unit(lib_dir, unit)
+    write_tests(tests_dir, units, libs, tests_per_lib)
+
+    include_counts = {}
+    for unit in units:
+        for include in unit.includes:
+            include_counts[include.include_path] = include_counts.get(include.include_path, 0) + 1
+    most_included = max(include_counts, key=include_counts.get) if include_counts else units[0].include_path
+    return my_utils.normalize_path(f'{lib_dir}/{most_included}')
+
+def main(workspace_root, command_argv, argv):
+    desc = '''
+builder scaffold [options]     generate a large multi library project to measure how the builder scales
+
+The project is a copy of this workspace where the libraries are generated in src/lib/scaffold/lib_<n>
+and their tests in src/tests/scaffold. Build it with `builder build` from the output directory.
+'''
+    parser = ArgumentParser('scaffold', usage='builder scaffold [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+    parser.add_argument('--files', '-n', default=1000, type=int, metavar='<count>', help='Number of generated sources (.cpp and .h pairs), default is 1000')
+    parser.add_argument('--depth', '-d', default=3, type=int, metavar='<depth>', help='Depth of the directory tree of each library, default is 3')
+    parser.add_argument('--libs', '-l', default=4, type=int, metavar='<count>', help='Number of libraries, default is 4')
+    parser.add_argument('--fan_out', '-f', default=4, type=int, metavar='<count>',
+                        help='Number of headers of the same or lower libraries included by each source, default is 4')
+    parser.add_argument('--tests_per_lib', default=10, type=int, metavar='<count>', help='Number of unit tests per library, default is 10')
+    parser.add_argument('--seed', default=0, type=int, metavar='<seed>', help='Seed of the include graph, the same seed generates the same project')
+    parser.add_argument('--output', '-o', default='build/scaffold', metavar='<dir>',
+                        help='Directory of the generated workspace, relative to the workspace root or absolute. default is build/scaffold')
+    parser.add_argument('--in_place', default=False, action='store_true', help='Generate the sources in this workspace instead of a copy')
+    parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+    args = parser.parse_args(command_argv)
+
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    if args.files < 1 or args.libs < 1 or args.depth < 0 or args.fan_out < 0:
+        my_utils.builder_print_error('--files and --libs must be positive, --depth and --fan_out must not be negative')
+        return 1
+
+    output = workspace_root if args.in_place else my_utils.make_path_absolute(workspace_root, args.output)
+    if not args.in_place:
+        error = copy_workspace(workspace_root, output)
+        if error:
+            my_utils.builder_print_error(error)
+            return 1
+    most_included = generate_project(output, args.files, args.depth, args.libs, args.fan_out, args.tests_per_lib, args.seed)
+
+    my_utils.builder_print(f'scaffold: generated {args.files} sources in {args.libs} libraries of depth {args.depth} '
+                           f'with {args.fan_out} includes per source in {output}')
+    my_utils.builder_print(f'scaffold: most included header: {my_utils.make_path_relative(output, most_included)}')
+    return 0
@@ -1,4 +1,204 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import time
+import shlex
+import shutil
+import signal
+import fnmatch
+import tempfile
+import threading
+import subprocess
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from .my_generic_parser import MyGenericParser
+from . import my_utils
+from . import test_utils
+from . import event_utils
+from . import process_utils
+
+# A system test case is a directory of src/system_tests:
+#   expected_output.txt   the expected standard output of the app
+#   args.txt              optional, the command line arguments of the app
+#   stdin.txt             optional, the standard input of the app
+#   input/                optional, files copied to the working directory of the app
+# Each case runs the installed app in its own temporary working directory, and fails if the app exits with an
+# error, times out, or if its output differs from the expected one.
+
+system_tests_dir = 'src/system_tests'
+suite_name = 'SystemTests'
+max_details_lines = 20
+
+def discover_cases(workspace_root, name_filter):
+    cases_root = f'{workspace_root}/{system_tests_dir}'
+    if not os.path.isdir(cases_root):
+        return []
+    cases = []
+    for name in sorted(os.listdir(cases_root)):
+        case_dir = my_utils.normalize_path(f'{cases_root}/{name}')
+        if os.path.isfile(f'{case_dir}/expected_output.txt') and (not name_filter or fnmatch.fnmatch(name, name_filter)):
+            cases.append((name, case_dir))
+    return cases
+
+def get_test_name(case_name):
+    return f'{suite_name}.{case_name}'
+
+def find_app(args):
+    exe_name = f'{args.app_name}.exe' if sys.platform == 'win32' else args.app_name
+    path = my_utils.normalize_path(f'{args.workspace_root}/bin/{args.config}/{exe_name}')
+    return path if os.path.isfile(path) else None
+
+def get_case_command(app_path, case_dir):
+    args_path = f'{case_dir}/args.txt'
+    if not os.path.isfile(args_path):
+        return [app_path]
+    with open(args_path, encoding='utf-8') as args_file:
+        return [app_path] + shlex.split(args_file.read(), comments=True)
+
+# reads the output of the app line by line, writes it to output_path and compares it to the expected output file,
+# so that neither is held in memory. Returns the first difference as (line number, expected, actual), or None.
+def compare_output(stream, expected_path, output_path):
+    difference = None
+    with open(expected_path, encoding='utf-8', errors='surrogateescape', newline=None) as expected_file, \
+            open(output_path, 'w', encoding='utf-8', errors='surrogateescape') as output_file:
+        for line_number, (expected, actual) in enumerate(zip_longest(expected_file, stream), start=1):
+            if actual is not None:
+                output_file.write(actual)
+            if difference is None and (expected or '').rstrip('\r\n') != (actual or '').rstrip('\r\n'):
+                difference = (line_number, expected, actual)
+    return difference
+
+def run_case(args, app_path, case_name, case_dir):
+    output_path = my_utils.normalize_path(f'{args.system_tests_results_dir}/{case_name}.out')
+    stdin_path = f'{case_dir}/stdin.txt'
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix=f'builder-{case_name}-') as sandbox_dir:
+        input_dir = f'{case_dir}/input'
+        for name in os.listdir(input_dir) if os.path.isdir(input_dir) else []:
+            if os.path.isdir(f'{input_dir}/{name}'):
+                shutil.copytree(f'{input_dir}/{name}', f'{sandbox_dir}/{name}')
+            else:
+                shutil.copy2(f'{input_dir}/{name}', sandbox_dir)
+        stdin = open(stdin_path, 'rb') if os.path.isfile(stdin_path) else subprocess.DEVNULL
+        try:
+            process = subprocess.Popen(get_case_command(app_path, case_dir), cwd=sandbox_dir, stdin=stdin, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, encoding='utf-8', errors='surrogateescape',
+                                       start_new_session=os.name == 'posix')
+        finally:
+            if stdin is not subprocess.DEVNULL:
+                stdin.close()
+        process_utils.register_process(args.build_root, process.pid)
+        timed_out = threading.Event()
+        def kill_on_timeout():
+            timed_out.set()
+            # kill the children of the app too, they would keep its output open
+            try:
+                if os.name == 'posix':
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            except OSError:
+                pass # already exited
+        timer = threading.Timer(args.timeout, kill_on_timeout)
+        timer.start()
+        try:
+            difference = compare_output(process.stdout, f'{case_dir}/expected_output.txt', output_path)
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+            process.stdout.close()
+            process_utils.unregister_process(args.build_root, process.pid)
+    duration = time.perf_counter() - start
+
+    failure = None
+    if timed_out.is_set():
+        failure = ('error', f'timed out after {args.timeout:g} seconds', '')
+    elif returncode != 0:
+        failure = ('failure', f'the app exited with code {returncode}', '')
+    elif difference is not None:
+        line_number, expected, actual = difference
+        failure = ('failure', f'output differs at line {line_number}',
+                   f'expected: {"<end of output>" if expected is None else expected.rstrip()}\n'
+                   f'actual:   {"<end of output>" if actual is None else actual.rstrip()}')
+    if failure is not None:
+        details = failure[2] + ('\n' if failure[2] else '') + f'output: {output_path}'
+        failure = (failure[0], failure[1], details)
+    return case_name, duration, failure
+
 def main(workspace_root, command_argv, argv):
-    return 0
+    desc = f'''
+builder system-tests [options]     run the system tests cases of {system_tests_dir} against the installed app
+
+Each case is a directory with expected_output.txt, and optionally args.txt, stdin.txt and an input/ directory copied to
+the temporary working directory of the app. The cases run concurrently, from the slowest to the fastest according to
+the previous runs.
+See 'builder system-tests --help' for more information on this command.
+'''
+    parser = ArgumentParser('system-tests', usage='builder system-tests [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+
+    my_parser = MyGenericParser(parser, workspace_root)
+    my_parser.add_args_for_system_tests_command()
+    args = my_parser.parse_args_with_config_file(command_argv)
+
+    args.workspace_root = workspace_root
+    if args.app_name is None:
+        args.app_name = "my_app"
+    test_utils.set_test_directories(args)
+    args.system_tests_results_dir = my_utils.normalize_path(f'{args.test_results_dir}/system_tests')
+
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    app_path = find_app(args)
+    if app_path is None:
+        my_utils.builder_print_error(f'App {args.app_name} not found in {workspace_root}/bin/{args.config}. Build the {args.config} configuration first.')
+        return 1
+
+    cases = discover_cases(workspace_root, args.filter)
+    timings = test_utils.load_test_timings(args, 'system-tests')
+    if args.last_failed:
+        last_failed = test_utils.get_last_failed_tests(timings, [get_test_name(name) for name, _ in cases])
+        if last_failed:
+            cases = [case for case in cases if get_test_name(case[0]) in last_failed]
+        else:
+            my_utils.builder_print('No test failed in the previous run, running all tests')
+
+    if not cases:
+        my_utils.builder_print_warning(f'No system test case to run in {workspace_root}/{system_tests_dir}')
+        return 0
+
+    # the thread pool picks the cases up in order, starting with the slowest ones shortens the total duration
+    durations = test_utils.get_expected_durations(timings, [get_test_name(name) for name, _ in cases])
+    cases.sort(key=lambda case: durations[get_test_name(case[0])], reverse=True)
+
+    os.makedirs(args.system_tests_results_dir, exist_ok=True)
+    worker_count = max(1, min(args.jobs, len(cases)))
+    my_utils.builder_print(f'Running {len(cases)} system tests in {worker_count} processes')
+    event_utils.emit('jobs', command='system-tests', jobs=worker_count, tests=len(cases))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        results = list(executor.map(lambda case: run_case(args, app_path, *case), cases))
+    duration = time.perf_counter() - start
+
+    report_path = my_utils.normalize_path(f'{args.test_results_dir}/system_tests.xml')
+    report = test_utils.write_junit_xml_report(suite_name, results, report_path)
+    test_utils.save_test_timings(args, 'system-tests', test_utils.get_test_results(report))
+    test_utils.emit_test_result_events('system-tests', report)
+
+    failed = 0
+    for case_name, case_duration, failure in results:
+        if failure is None:
+            if args.verbose:
+                my_utils.builder_print(f'PASSED {case_name} in {case_duration:.2f} seconds')
+            continue
+        failed += 1
+        my_utils.builder_print_error(f'FAILED {case_name}: {failure[1]}')
+        for line in failure[2].splitlines()[:max_details_lines]:
+            print(line)
+
+    my_utils.builder_print(f'{len(results)} system tests run, {failed} failed in {duration:.2f} seconds')
+    my_utils.builder_print(f'Test report written to: {report_path}')
+    return 1 if failed else 0
@@ -1,4 +1,149 @@
 #!/usr/bin/env python3
 
+import os
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from .my_generic_parser import MyGenericParser
+from . import my_utils
+from . import test_utils
+from . import event_utils
+from . import process_utils
+
+# the tests of a batch are passed in --gtest_filter, long filters are split to stay below the command line limits
+# (32767 characters on Windows)
+max_filter_length = 8000
+
+# a batch is a process of the unit tests executable running the given list of tests
+def run_batch(args, exe_path, batch_index, tests):
+    xml_path = my_utils.normalize_path(f'{args.test_results_dir}/batch_{batch_index}.xml')
+    log_path = my_utils.normalize_path(f'{args.test_results_dir}/batch_{batch_index}.log')
+    if os.path.exists(xml_path):
+        os.remove(xml_path)
+
+    cmd = [exe_path, f'--gtest_output=xml:{xml_path}', f'--gtest_filter={":".join(tests)}']
+    with open(log_path, 'w') as log_file:
+        returncode = process_utils.run_registered(args.build_root, cmd, stdout=log_file, stderr=subprocess.STDOUT, cwd=args.build_dir)
+    return {'index': batch_index, 'tests': tests, 'returncode': returncode, 'log_path': log_path, 'xml_path': xml_path}
+
+def run_batches(args, exe_path, batches, worker_count):
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = [executor.submit(run_batch, args, exe_path, i, tests) for i, tests in enumerate(batches)]
+        return [future.result() for future in futures]
+
+def schedule_batches(args, tests, timings):
+    durations = test_utils.get_expected_durations(timings, tests)
+    if args.slowest_first:
+        # one test per batch, the thread pool picks them up in order
+        return [[test] for test in test_utils.sort_slowest_first(tests, durations)]
+    return split_long_batches(test_utils.schedule_longest_first(tests, durations, args.jobs), max_filter_length)
+
+# splits the batches whose --gtest_filter would be longer than max_length, keeping the order of their tests
+def split_long_batches(batches, max_length):
+    split_batches = []
+    for tests in batches:
+        batch = []
+        length = 0
+        for test in tests:
+            if batch and length + len(test) + 1 > max_length:
+                split_batches.append(batch)
+                batch = []
+                length = 0
+            batch.append(test)
+            length += len(test) + 1
+        if batch:
+            split_batches.append(batch)
+    return split_batches
+
+# the tests of the batches that exited without report (crash) are recorded as failed, so that --last_failed runs them
+def add_crashed_batches_results(results, crashed_batches, timings):
+    for batch in crashed_batches:
+        for test in batch['tests']:
+            results.setdefault(test, (timings.get(test, {}).get('duration', 0.0), True))
+    return results
+
 def main(workspace_root, command_argv, argv):
-    return 0
+    desc = '''
+builder unit-tests [options]     run the unit tests, spread across several processes
+
+Tests are balanced between the processes according to their durations in the previous runs.
+See 'builder unit-tests --help' for more information on this command.
+'''
+    parser = ArgumentParser('unit-tests', usage='builder unit-tests [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+
+    my_parser = MyGenericParser(parser, workspace_root)
+    my_parser.add_args_for_unit_tests_command()
+    args = my_parser.parse_args_with_config_file(command_argv)
+
+    args.workspace_root = workspace_root
+    if args.unit_tests_name is None:
+        args.unit_tests_name = "my_tests"
+    test_utils.set_test_directories(args)
+
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    exe_path = test_utils.find_executable(args, args.unit_tests_name)
+    if exe_path is None:
+        my_utils.builder_print_error(f'Unit tests executable {args.unit_tests_name} not found in {args.build_dir}. Build the {args.config} configuration first.')
+        return 1
+
+    try:
+        tests = test_utils.list_gtest_tests(exe_path, args.filter)
+    except subprocess.CalledProcessError as e:
+        my_utils.builder_print_error(f'Failed to list the unit tests of {exe_path}: {e}')
+        return 1
+
+    timings = test_utils.load_test_timings(args, 'unit-tests')
+    if args.last_failed:
+        last_failed = test_utils.get_last_failed_tests(timings, tests)
+        if last_failed:
+            tests = last_failed
+        else:
+            my_utils.builder_print('No test failed in the previous run, running all tests')
+
+    if not tests:
+        my_utils.builder_print_warning('No unit test to run')
+        return 0
+
+    os.makedirs(args.test_results_dir, exist_ok=True)
+    worker_count = max(1, min(args.jobs, len(tests)))
+    batches = schedule_batches(args, tests, timings)
+    my_utils.builder_print(f'Running {len(tests)} unit tests in {worker_count} processes')
+    event_utils.emit('jobs', command='unit-tests', jobs=worker_count, tests=len(tests))
+
+    start = time.perf_counter()
+    batch_results = run_batches(args, exe_path, batches, worker_count)
+    duration = time.perf_counter() - start
+
+    error = 0
+    xml_paths = []
+    crashed_batches = []
+    for batch in batch_results:
+        if args.verbose:
+            test_utils.print_log_tail(batch['log_path'], line_count=None)
+        if os.path.exists(batch['xml_path']):
+            xml_paths.append(batch['xml_path'])
+        else:
+            # no report means the process crashed before the end of the tests
+            my_utils.builder_print_error(f'Process running {", ".join(batch["tests"])} exited with code {batch["returncode"]} without test report:')
+            test_utils.print_log_tail(batch['log_path'])
+            crashed_batches.append(batch)
+            error = 1
+
+    merged_path = my_utils.normalize_path(f'{args.test_results_dir}/unit_tests.xml')
+    report = test_utils.merge_gtest_xml_reports(xml_paths, merged_path)
+    results = add_crashed_batches_results(test_utils.get_test_results(report), crashed_batches, timings)
+    test_utils.save_test_timings(args, 'unit-tests', results)
+    test_utils.emit_test_result_events('unit-tests', report)
+
+    failed = test_utils.get_failed_test_cases(report)
+    for name, message in failed:
+        my_utils.builder_print_error(f'FAILED {name}')
+        if message:
+            print(message)
+
+    my_utils.builder_print(f'{report.get("tests")} tests run, {len(failed)} failed, {report.get("disabled")} disabled in {duration:.2f} seconds')
+    my_utils.builder_print(f'Test report written to: {merged_path}')
+    return 1 if failed or error else 0
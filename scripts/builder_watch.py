@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import signal
+import select
+import ctypes
+import ctypes.util
+import subprocess
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from . import my_utils
+from . import cmake_utils
+from .my_generic_parser import config_choices
+from . import config_store
+
+# builder watch: rebuild and rerun the tests when the sources change.
+# The watcher only tells that something changed (inotify on Linux, polling otherwise), the stages to run are
+# computed from the difference between two snapshots of the watched files.
+
+watched_files = ['CMakeLists.txt', 'CMakeLists.txt.in']
+watched_dirs = list(cmake_utils.source_dirs) + ['scripts/cmake']
+
+def take_snapshot(workspace_root):
+    snapshot = {}
+    paths = [f'{workspace_root}/{name}' for name in watched_files] + config_store.get_config_paths(workspace_root)
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+            snapshot[my_utils.normalize_path(path)] = (stat_result.st_mtime_ns, stat_result.st_size)
+        except FileNotFoundError:
+            pass
+    for directory in watched_dirs:
+        for root, _, files in os.walk(f'{workspace_root}/{directory}'):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat_result = os.stat(path)
+                    snapshot[my_utils.normalize_path(path)] = (stat_result.st_mtime_ns, stat_result.st_size)
+                except FileNotFoundError:
+                    pass # deleted while walking
+    return snapshot
+
+# the directory of the user config file, or its parent until it is created
+def get_user_config_directory():
+    directory = os.path.dirname(config_store.get_user_config_path())
+    return directory if os.path.isdir(directory) else os.path.dirname(directory)
+
+def get_watched_directories(workspace_root):
+    directories = [workspace_root]
+    for directory in watched_dirs:
+        for root, _, _ in os.walk(f'{workspace_root}/{directory}'):
+            directories.append(root)
+    user_config_directory = get_user_config_directory()
+    if os.path.isdir(user_config_directory):
+        directories.append(user_config_directory)
+    return directories
+
+class PollingWatcher:
+    def __init__(self, workspace_root, interval=0.5):
+        self.workspace_root = workspace_root
+        self.interval = interval
+        self.snapshot = take_snapshot(workspace_root)
+
+    # returns True if something changed before the timeout
+    def wait_for_change(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = take_snapshot(self.workspace_root)
+            if snapshot != self.snapshot:
+                self.snapshot = snapshot
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, workspace_root):
+        self.workspace_root = workspace_root
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._add_watches()
+
+    # inotify is not recursive, the new sub directories are watched after each change
+    def _add_watches(self):
+        for directory in get_watched_directories(self.workspace_root):
+            self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.mask)
+
+    def wait_for_change(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        self._add_watches()
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(workspace_root, force_polling):
+    if not force_polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(workspace_root)
+        except (OSError, AttributeError):
+            pass # no inotify in this libc
+    return PollingWatcher(workspace_root)
+
+#### stages
+
+# swap, backup and lock files written by the editors next to the edited files (4913 is the write test file of vim)
+editor_file_suffixes = ('~', '.swp', '.swo', '.swx', '.tmp', '.bak', '.orig')
+editor_file_prefixes = ('.#', '#')
+editor_file_names = ('4913',)
+
+def is_editor_file(path):
+    name = os.path.basename(path)
+    return name.endswith(editor_file_suffixes) or name.startswith(editor_file_prefixes) or name in editor_file_names
+
+def is_cmake_input(workspace_root, path):
+    name = os.path.basename(path)
+    return name in watched_files or name.endswith('.cmake') or \
+        path in (my_utils.normalize_path(config_path) for config_path in config_store.get_config_paths(workspace_root))
+
+def get_needed_stages(workspace_root, old_snapshot, new_snapshot):
+    added = new_snapshot.keys() - old_snapshot.keys()
+    removed = old_snapshot.keys() - new_snapshot.keys()
+    modified = {path for path in new_snapshot.keys() & old_snapshot.keys() if new_snapshot[path] != old_snapshot[path]}
+
+    tests_dir = my_utils.normalize_path(f'{workspace_root}/src/tests')
+    stages = set()
+    for path in added | removed | modified:
+        if is_editor_file(path):
+            continue
+        is_source = path.endswith(cmake_utils.source_extensions)
+        if is_cmake_input(workspace_root, path) or (is_source and (path in added or path in removed)):
+            # cmake files, builder config, or files globbed by find_source_files added or removed
+            stages.update(['generate', 'build'])
+        elif is_source:
+            stages.add('build')
+        # the other files of the tests directory are data of the tests
+        if path.startswith(tests_dir + os.sep):
+            stages.add('unit-tests')
+    return stages
+
+def get_stage_commands(args, stages):
+    builder = [sys.executable, f'{args.workspace_root}/my_builder.py']
+    commands = []
+    if 'build' in stages:
+        build_command = builder + ['build', '--config', args.config]
+        if 'generate' not in stages:
+            build_command.append('--no_generate')
+        commands.append(build_command)
+    if 'unit-tests' in stages or (args.run_tests and 'build' in stages):
+        commands.append(builder + ['unit-tests', '--config', args.config])
+    return commands
+
+def start_command(command):
+    my_utils.builder_print(f'watch: running {my_utils._join_quoted(command[1:])}')
+    # own process group, to cancel the whole build
+    return subprocess.Popen(command, start_new_session=(sys.platform != 'win32'))
+
+def cancel_command(process):
+    my_utils.builder_print('watch: changes detected, cancelling the running command')
+    try:
+        if sys.platform == 'win32':
+            process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+def main(workspace_root, command_argv, argv):
+    desc = '''
+builder watch [options]     rebuild and rerun the unit tests when the sources change
+
+Source edits trigger a build, added or removed sources and cmake or builder config changes a generate and build,
+test edits a build and a unit tests run. A running build is cancelled when new changes arrive.
+'''
+    parser = ArgumentParser('watch', usage='builder watch [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+    parser.add_argument('--config', '-c', default='release', choices=config_choices, metavar='<configuration>',
+                        help='configuration to build and test in debug or release (default is release)')
+    parser.add_argument('--run_tests', '-t', default=False, action='store_true', help='Run the unit tests after every build, not only after test edits')
+    parser.add_argument('--debounce', default=0.3, type=float, metavar='<seconds>',
+                        help='Wait for this quiet time after a change before running the stages (default is 0.3)')
+    parser.add_argument('--polling', default=False, action='store_true', help='Poll the file system instead of using inotify')
+    parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+    args = parser.parse_args(command_argv)
+    args.workspace_root = workspace_root
+
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    watcher = create_watcher(workspace_root, args.polling)
+    watched = watched_dirs + watched_files + ['builder-config.txt', config_store.get_user_config_path()]
+    my_utils.builder_print(f'watch: watching {", ".join(watched)} with {type(watcher).__name__}, press Ctrl+C to stop')
+
+    snapshot = take_snapshot(workspace_root)
+    pending_stages = set()
+    commands = []
+    process = None
+    try:
+        while True:
+            if watcher.wait_for_change(0.5 if process else 3600):
+                # debounce: wait until no more change arrives
+                while watcher.wait_for_change(args.debounce):
+                    pass
+                new_snapshot = take_snapshot(workspace_root)
+                stages = get_needed_stages(workspace_root, snapshot, new_snapshot)
+                snapshot = new_snapshot
+                if stages:
+                    if process is not None and process.poll() is None:
+                        cancel_command(process)
+                        process = None
+                    # the stages of the cancelled run are still needed
+                    pending_stages |= stages
+                    commands = get_stage_commands(args, pending_stages)
+
+            if process is not None and process.poll() is not None:
+                if process.returncode != 0:
+                    my_utils.builder_print_error(f'watch: command failed with code {process.returncode}, waiting for changes')
+                    commands = []
+                process = None
+                if not commands:
+                    pending_stages = set()
+                    my_utils.builder_print('watch: waiting for changes')
+
+            if process is None and commands:
+                process = start_command(commands.pop(0))
+    except KeyboardInterrupt:
+        if process is not None and process.poll() is None:
+            cancel_command(process)
+    finally:
+        watcher.close()
+    return 0
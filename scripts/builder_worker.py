@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import os
+import secrets
+import tempfile
+import threading
+import subprocess
+import socketserver
+import multiprocessing
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from . import my_utils
+from . import dist_utils
+
+# builder worker: compiles the preprocessed sources sent by scripts/dist_launcher.py during distributed builds.
+# Only the requests with the token of the worker are served, with the compilers of the worker allowlist and the
+# compile flags accepted by dist_utils.is_safe_compile_arg.
+
+default_compilers = 'cc,c++,gcc,g++,clang,clang++'
+
+class WorkerState:
+    def __init__(self, jobs, token, compilers):
+        self.jobs = jobs
+        self.token = token
+        self.compilers = compilers
+        self.slots = threading.Semaphore(jobs)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+
+# "gcc,/opt/bin/clang++" => {'gcc': '/usr/bin/gcc', 'clang++': '/opt/bin/clang++'}, names looked up in PATH
+def get_allowed_compilers(value):
+    compilers = {}
+    for compiler in value.split(','):
+        compiler = compiler.strip()
+        path = compiler if os.path.isabs(compiler) and os.path.isfile(compiler) else my_utils.which(compiler)
+        if path:
+            compilers[os.path.basename(compiler)] = path
+    return compilers
+
+# the compilers of the allowlist are matched by name, the path sent by the builder is never run
+def resolve_compiler(compilers, compiler):
+    return compilers.get(os.path.basename(compiler))
+
+def reject(message):
+    return {'returncode': 1, 'rejected': True, 'stderr': f'builder worker: {message}\n'}, b''
+
+def compile_source(header, preprocessed, compilers):
+    compiler = resolve_compiler(compilers, str(header.get('compiler', '')))
+    if compiler is None:
+        return reject(f'compiler {header.get("compiler")} is not allowed by this worker (see its --compilers)')
+    if header.get('language') not in dist_utils.languages:
+        return reject(f'language {header.get("language")} is not supported')
+    args = header.get('args')
+    if not isinstance(args, list) or not all(isinstance(arg, str) and dist_utils.is_safe_compile_arg(arg) for arg in args):
+        return reject('compile flags not allowed')
+
+    with tempfile.TemporaryDirectory(prefix='builder-worker-') as tmp_dir:
+        object_path = os.path.join(tmp_dir, 'output.o')
+        cmd = [compiler] + args + ['-x', header['language'], '-c', '-', '-o', object_path]
+        result = subprocess.run(cmd, input=preprocessed, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=tmp_dir)
+        stderr = result.stdout.decode('utf-8', errors='replace').replace('<stdin>', str(header.get('source', '<stdin>')))
+        object_data = b''
+        if result.returncode == 0:
+            with open(object_path, 'rb') as object_file:
+                object_data = object_file.read()
+        return {'returncode': result.returncode, 'stderr': stderr}, object_data
+
+class CompileRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        state = self.server.state
+        header, payload = dist_utils.recv_message(self.request)
+        if not dist_utils.is_token_valid(header, state.token):
+            dist_utils.send_message(self.request, {'error': 'invalid token', 'returncode': 1, 'rejected': True})
+            if self.server.verbose:
+                my_utils.builder_print_warning(f'worker: request with an invalid token from {self.client_address[0]}')
+            return
+        if header.get('type') == 'status':
+            dist_utils.send_message(self.request, {'active': state.active, 'jobs': state.jobs, 'completed': state.completed})
+            return
+
+        with state.lock:
+            state.active += 1
+        try:
+            with state.slots:
+                reply, object_data = compile_source(header, payload, state.compilers)
+        finally:
+            with state.lock:
+                state.active -= 1
+                state.completed += 1
+        dist_utils.send_message(self.request, reply, object_data)
+        if self.server.verbose:
+            my_utils.builder_print(f'worker: compiled {header.get("source")} ({len(payload)} bytes in, {len(object_data)} bytes out)')
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def main(workspace_root, command_argv, argv):
+    desc = f'''
+builder worker [options]     compile jobs of distributed builds sent by other builders over TCP
+
+Start workers on several hosts (or several ports of localhost) with the same token, then build with
+    builder build --dist_workers host1:{dist_utils.default_worker_port},host2:{dist_utils.default_worker_port}
+and the token in the dist_token entry of builder-config.txt or the {dist_utils.token_env_var} environment variable.
+The workers listen on localhost unless --host is given: only use them on trusted networks, the protocol is not encrypted.
+'''
+    parser = ArgumentParser('worker', usage='builder worker [options]', formatter_class=RawDescriptionHelpFormatter, description=desc)
+    parser.add_argument('--host', default='127.0.0.1', metavar='<address>',
+                        help='Address to listen on (default is 127.0.0.1, 0.0.0.0 for all interfaces)')
+    parser.add_argument('--token', default=os.environ.get(dist_utils.token_env_var), metavar='<token>',
+                        help=f'Shared secret required from the builders (default is the {dist_utils.token_env_var} environment '
+                             'variable, or a random token printed at startup)')
+    parser.add_argument('--compilers', default=default_compilers, metavar='<compiler,...>',
+                        help=f'Compilers this worker runs, names in PATH or absolute paths (default is {default_compilers})')
+    parser.add_argument('--port', '-p', default=dist_utils.default_worker_port, type=int, metavar='<port>',
+                        help=f'TCP port to listen on (default is {dist_utils.default_worker_port})')
+    parser.add_argument('--jobs', '-j', default=multiprocessing.cpu_count(), type=int, metavar='<count>',
+                        help='Number of compilations running concurrently (default is the cpu count)')
+    parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+    args = parser.parse_args(command_argv)
+
+    if args.verbose:
+        my_utils.builder_print_command(workspace_root, argv)
+
+    compilers = get_allowed_compilers(args.compilers)
+    if not compilers:
+        my_utils.builder_print_error(f'None of the compilers {args.compilers} was found')
+        return 1
+    token = args.token
+    if not token:
+        token = secrets.token_urlsafe(16)
+        my_utils.builder_print(f'worker: no token given, builders must use the token {token}')
+
+    with WorkerServer((args.host, args.port), CompileRequestHandler) as server:
+        server.state = WorkerState(max(1, args.jobs), token, compilers)
+        server.verbose = args.verbose
+        my_utils.builder_print(f'worker: listening on {args.host}:{args.port} with {server.state.jobs} jobs and the compilers '
+                               f'{", ".join(sorted(compilers))}, press Ctrl+C to stop')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
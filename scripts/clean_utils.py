@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import os
+import stat
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import my_utils
+
+# Fast clean of the build directories: the directory is renamed into build/.trash/<pid>, which is instant,
+# and deleted in background threads while the new build runs. Each builder process, including the workers building
+# configurations concurrently, has its own trash directory: the others only delete it once the process is gone.
+
+class _Node:
+    def __init__(self, path, parent):
+        self.path = path
+        self.parent = parent
+        self.pending = 1 # the scan of the directory itself, plus one per sub directory being deleted
+
+# Deletes directory trees with parallel os.scandir walks: each directory is scanned by a task of the thread pool,
+# which deletes the files and submits a task per sub directory. The last finished task of a directory removes it.
+class TreeDeleter:
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='builder-delete')
+        self.lock = threading.Lock()
+        self.roots_pending = 0
+        self.all_done = threading.Condition(self.lock)
+        self.errors = []
+
+    def delete(self, path):
+        with self.lock:
+            self.roots_pending += 1
+        self.executor.submit(self._scan, _Node(path, None))
+
+    def wait(self):
+        with self.lock:
+            while self.roots_pending:
+                self.all_done.wait()
+        return self.errors
+
+    def _remove(self, func, path):
+        try:
+            func(path)
+        except PermissionError:
+            # read only files and directories
+            try:
+                os.chmod(path, stat.S_IWUSR | stat.S_IRUSR | stat.S_IXUSR)
+                func(path)
+            except OSError as e:
+                self.errors.append((path, e))
+        except OSError as e:
+            self.errors.append((path, e))
+
+    def _scan(self, node):
+        try:
+            with os.scandir(node.path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        with self.lock:
+                            node.pending += 1
+                        self.executor.submit(self._scan, _Node(entry.path, node))
+                    else:
+                        self._remove(os.unlink, entry.path)
+        except OSError as e:
+            self.errors.append((node.path, e))
+        self._done(node)
+
+    def _done(self, node):
+        while node is not None:
+            with self.lock:
+                node.pending -= 1
+                if node.pending:
+                    return
+            self._remove(os.rmdir, node.path)
+            if node.parent is None:
+                with self.lock:
+                    self.roots_pending -= 1
+                    self.all_done.notify_all()
+            node = node.parent
+
+tree_deleter = None
+
+def get_tree_deleter():
+    global tree_deleter
+    if tree_deleter is None:
+        tree_deleter = TreeDeleter()
+    return tree_deleter
+
+# trash directories of this process, removed once their content is deleted
+trash_dirs = set()
+
+def get_trash_dir(build_root, pid=None):
+    return my_utils.normalize_path(f'{build_root}/.trash/{pid or os.getpid()}')
+
+# the trash directories left by builder processes that no longer run (interrupted builds), moved into trash_dir so
+# that a single process deletes each of them
+def claim_trash_leftovers(trash_dir):
+    import psutil
+    leftovers = []
+    for entry in os.scandir(os.path.dirname(trash_dir)):
+        if not entry.name.isdigit() or int(entry.name) == os.getpid() or psutil.pid_exists(int(entry.name)):
+            continue
+        claimed_path = my_utils.normalize_path(f'{trash_dir}/leftover-{entry.name}-{uuid.uuid4().hex}')
+        try:
+            os.rename(entry.path, claimed_path)
+        except OSError:
+            continue # claimed by another process
+        leftovers.append(claimed_path)
+    return leftovers
+
+# Move the directory into the trash and delete it in background. Also deletes what previous interrupted builds left in the trash.
+def delete_in_background(build_root, path):
+    trash_dir = get_trash_dir(build_root)
+    os.makedirs(trash_dir, exist_ok=True)
+    trash_dirs.add(trash_dir)
+    leftovers = claim_trash_leftovers(trash_dir)
+
+    trashed_path = my_utils.normalize_path(f'{trash_dir}/{os.path.basename(path)}-{uuid.uuid4().hex}')
+    try:
+        os.rename(path, trashed_path)
+    except OSError:
+        # on Windows a directory with open files can't be renamed, delete it in place
+        return False
+
+    deleter = get_tree_deleter()
+    for leftover in leftovers:
+        deleter.delete(leftover)
+    deleter.delete(trashed_path)
+    return True
+
+# blocks until the background deletions are finished and prints the errors
+def wait_for_background_deletions(workspace_root):
+    if tree_deleter is None:
+        return
+    for path, error in tree_deleter.wait():
+        rpath = my_utils.make_path_relative(workspace_root, path)
+        my_utils.builder_print_warning(f'Failed to delete file {rpath} : [{error}]. ')
+    tree_deleter.errors = []
+    for trash_dir in list(trash_dirs):
+        try:
+            os.rmdir(trash_dir)
+        except OSError:
+            pass # not empty after deletion errors, collected by a later build
+        trash_dirs.discard(trash_dir)
+
+def get_output_file_names(args):
+    names = []
+    for name in [args.app_name, args.unit_tests_name]:
+        names.extend([name, f'{name}.exe', f'{name}.pdb', f'{name}.ilk'])
+    names.extend([f'lib{args.lib_name}.a', f'{args.lib_name}.lib', f'{args.lib_name}.pdb'])
+    return names
+
+# Selective clean: removes the objects and outputs of the app, lib and tests targets but keeps the cmake cache and generated files
+def clean_outputs(args):
+    object_extensions = ('.o', '.obj')
+    for directory in [args.app_build_dir, args.lib_build_dir, args.tests_build_dir]:
+        if os.path.exists(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    for target in [args.app_name, args.lib_name, args.unit_tests_name]:
+        for root, _, files in os.walk(f'{args.build_dir}/CMakeFiles/{target}.dir'):
+            for name in files:
+                if name.endswith(object_extensions):
+                    os.remove(os.path.join(root, name))
+
+    # single configuration generators output in the build directory, msvc in a sub directory per configuration
+    for directory in [args.build_dir, f'{args.build_dir}/{args.config.capitalize()}']:
+        for name in get_output_file_names(args):
+            path = f'{directory}/{name}'
+            if os.path.isfile(path):
+                os.remove(path)
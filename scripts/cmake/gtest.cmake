@@ -1,6 +1,17 @@
 
 cmake_minimum_required(VERSION 3.8)
 
+# Prebuilt googletest of the builder dependency cache (see `builder deps`)
+if( BUILDER_GTEST_ROOT AND EXISTS "${BUILDER_GTEST_LIBRARY}" )
+	find_package(Threads REQUIRED)
+	add_library(gtest STATIC IMPORTED)
+	set_target_properties(gtest PROPERTIES
+		IMPORTED_LOCATION "${BUILDER_GTEST_LIBRARY}"
+		INTERFACE_INCLUDE_DIRECTORIES "${BUILDER_GTEST_ROOT}/include"
+		INTERFACE_LINK_LIBRARIES Threads::Threads)
+	return()
+endif()
+
 # Download and unpack googletest at configure time
 configure_file(CMakeLists.txt.in googletest-download/CMakeLists.txt)
 execute_process(COMMAND ${CMAKE_COMMAND} -G "${CMAKE_GENERATOR}" .
@@ -2,16 +2,25 @@
 
 
 import os
+import sys
+import glob
+import shlex
 import time
+import hashlib
 import subprocess
-import multiprocessing
 from pathlib import Path
 from . import my_utils
+from . import build_timings
+from . import compile_modes
+from . import job_policy
+from . import event_utils
+from .output_pipeline import OutputPipeline
 
 
 def get_cmake_set_command(var, value):
     if isinstance(value, str):
-        return f"set({var} \"{value}\" CACHE STRING \"\" FORCE)\n"
+        escaped_value = value.replace('\\', '\\\\').replace('"', '\\"')
+        return f"set({var} \"{escaped_value}\" CACHE STRING \"\" FORCE)\n"
 
     bool_value = "ON" if value else "OFF"
     return f"set({var} \"{bool_value}\" CACHE BOOL \"\" FORCE)\n"
@@ -21,9 +30,11 @@ def cmake_cache_init(args):
     content += "\n# CMake Global Properties\n"
     content += get_cmake_set_command("CMAKE_INSTALL_PREFIX", Path(args.workspace_root).as_posix())
     content += get_cmake_set_command("CMAKE_CONFIGURATION_TYPES", "debug;release")
-    if args.generator == 'makefile':
+    content += get_cmake_set_command("BUILDER_CONFIG", args.config)
+    if args.generator in ('makefile', 'ninja'):
         capitalized_config = args.config.capitalize()
         content += get_cmake_set_command("CMAKE_BUILD_TYPE", f"{capitalized_config}")
+    if args.generator == 'makefile':
         content += get_cmake_set_command("CMAKE_RULE_MESSAGES", args.verbose)
 
     if args.current_system == 'Darwin':
@@ -39,42 +50,113 @@ def cmake_cache_init(args):
 
     content += get_cmake_set_command("APP_USE_DEBUG_INFO", not args.no_debug)
 
+    content += "\n# Prebuilt dependencies of the builder dependency cache\n"
+    content += get_cmake_set_command("BUILDER_GTEST_ROOT", args.gtest_root)
+    content += get_cmake_set_command("BUILDER_GTEST_LIBRARY", args.gtest_library)
+
+    content += "\n# Compiler launcher: compiler cache or distributed build launcher\n"
+    compiler_launcher = args.compiler_cache_path or ""
+    if args.dist_workers:
+        launcher_path = Path(f'{args.workspace_root}/scripts/dist_launcher.py').as_posix()
+        compiler_launcher = f'{Path(sys.executable).as_posix()};{launcher_path}'
+    content += get_cmake_set_command("CMAKE_C_COMPILER_LAUNCHER", compiler_launcher)
+    content += get_cmake_set_command("CMAKE_CXX_COMPILER_LAUNCHER", compiler_launcher)
+
+    if args.timings:
+        content += "\n# Compile and link timings\n"
+        content += get_cmake_set_command("BUILDER_RULE_LAUNCH_COMPILE", build_timings.get_rule_launch_command(args, 'compile'))
+        content += get_cmake_set_command("BUILDER_RULE_LAUNCH_LINK", build_timings.get_rule_launch_command(args, 'link'))
+    else:
+        content += get_cmake_set_command("BUILDER_RULE_LAUNCH_COMPILE", "")
+        content += get_cmake_set_command("BUILDER_RULE_LAUNCH_LINK", "")
+
+    content += "\n# Precompiled headers and unity build\n"
+    for name, value in compile_modes.get_cmake_variables(args):
+        content += get_cmake_set_command(name, value)
+
+    return content
+
+def write_cmake_cache_init(content):
     current_dir = os.getcwd()
     cache_filename = my_utils.normalize_path(f'{current_dir}/cmake_initial_cache.cmake')
     path = Path(cache_filename)
     path.write_text(content)
     return cache_filename
 
-
-def run_cmake(cmake_cmd_line, is_verbose):
+# same extensions and directories as find_source_files in scripts/cmake/FindSources.cmake
+source_extensions = ('.h', '.c', '.cpp', '.inl')
+source_dirs = ('src/lib', 'src/app', 'src/tests')
+
+def find_source_files(workspace_root):
+    source_files = []
+    for source_dir in source_dirs:
+        for root, _, files in os.walk(f'{workspace_root}/{source_dir}'):
+            for name in files:
+                if name.endswith(source_extensions):
+                    source_files.append(Path(root, name).relative_to(workspace_root).as_posix())
+    return sorted(source_files)
+
+# The fingerprint covers everything that changes the result of the cmake configure step:
+# the initial cache content, the cmake scripts and the list of files globbed by find_source_files.
+# The content of the source files is not part of it, since cmake --build tracks it by itself.
+def compute_generate_fingerprint(args, cache_content):
+    cmake_files = ['CMakeLists.txt', 'CMakeLists.txt.in'] + sorted(
+        Path(f).relative_to(args.workspace_root).as_posix() for f in glob.glob(f'{args.workspace_root}/scripts/cmake/*.cmake'))
+
+    sha = hashlib.sha256()
+    sha.update(cache_content.encode('utf-8'))
+    sha.update(f'\0{args.cmake_path}\0{args.cmake_generator}\0'.encode('utf-8'))
+    for cmake_file in cmake_files:
+        sha.update(f'\0{cmake_file}\0'.encode('utf-8'))
+        try:
+            sha.update(Path(f'{args.workspace_root}/{cmake_file}').read_bytes())
+        except FileNotFoundError:
+            pass
+    for source_file in find_source_files(args.workspace_root):
+        sha.update(f'\0{source_file}'.encode('utf-8'))
+    return sha.hexdigest()
+
+def get_generate_fingerprint_path(args):
+    return my_utils.normalize_path(f'{args.build_dir}/generate_fingerprint.txt')
+
+def is_generate_up_to_date(args, fingerprint):
+    if not os.path.exists(f'{args.build_dir}/CMakeCache.txt'):
+        return False
+    try:
+        return Path(get_generate_fingerprint_path(args)).read_text().strip() == fingerprint
+    except FileNotFoundError:
+        return False
+
+
+def get_log_path(args, step_name):
+    log_dir = my_utils.normalize_path(f'{args.build_root}/logs')
+    os.makedirs(log_dir, exist_ok=True)
+    return my_utils.normalize_path(f'{log_dir}/{args.config}_{step_name}.log')
+
+def run_cmake(args, cmake_cmd_line, step_name):
     my_utils.builder_print("")
     my_utils.builder_print(f"Running command : {cmake_cmd_line}")
+    log_path = get_log_path(args, step_name)
+    event_utils.emit('cmake_command', step=step_name, config=args.config, command_line=cmake_cmd_line, log_path=log_path)
+
+    start = time.perf_counter()
+    # a command line string is only understood by Popen on Windows
+    cmd = cmake_cmd_line if sys.platform == 'win32' else shlex.split(cmake_cmd_line)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
-    start = time.clock()
-    process = subprocess.Popen(cmake_cmd_line, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='utf-8', errors='surrogateescape')
-    progress = []
-    size = 50
-    for i in range(0, size):
-        p = ""
-        for j in range(0, i):
-            p+="."
-        for j in range(i + 1, size):
-            p += " "
-        progress.append(p)
-
-    i = 0
-    for line in iter(process.stdout):
-        if is_verbose:
-           print(line, end='')
-        else:
-            p = progress[i % size]
-            i = i+1
-            print(f'\r{p}', end='\r')
+    pipeline = OutputPipeline(process.stdout, log_path, args.verbose)
+    pipeline.start()
+    pipeline.wait(start)
     # here the stdout receiving EOF should occur almost at the same time as process exit, but let's still wait for for process completion
     process.wait()
-    end = time.clock()
+    process.stdout.close()
+    end = time.perf_counter()
     s = end-start
+    event_utils.emit('cmake_end', step=step_name, config=args.config, exit_code=process.returncode, duration=s,
+                     output_lines=pipeline.line_count, diagnostics=pipeline.diagnostic_count)
 
+    if process.returncode != 0 and not args.verbose:
+        pipeline.print_tail()
     my_utils.builder_print("Done in % .2f seconds" % s)
     my_utils.builder_blank_line()
     return process.returncode
@@ -86,16 +168,42 @@ def go_to_build_dir(args):
 
 def cmake_generate(args):
     go_to_build_dir(args)
+    cache_content = cmake_cache_init(args)
+    fingerprint = compute_generate_fingerprint(args, cache_content)
+    is_up_to_date = not args.force_generate and is_generate_up_to_date(args, fingerprint)
+    event_utils.emit('cache', cache='generate', config=args.config, hit=is_up_to_date, key=fingerprint)
+    if is_up_to_date:
+        my_utils.builder_print("Skipping generate: cmake inputs are unchanged since the last generate (use --force_generate to override)")
+        os.chdir(args.workspace_root)
+        return 0
+
+    # remove the fingerprint first, so that a failing or interrupted generate is redone next time
+    fingerprint_path = get_generate_fingerprint_path(args)
+    if os.path.exists(fingerprint_path):
+        os.remove(fingerprint_path)
+
     # generate the projects
-    cmake_cache_filename = cmake_cache_init(args)
+    cmake_cache_filename = write_cmake_cache_init(cache_content)
     cmake_command_line = f"\"{args.cmake_path}\" -G \"{args.cmake_generator}\" -C \"{cmake_cache_filename}\" \"{args.workspace_root}\""
-    error = run_cmake(cmake_command_line, args.verbose)
+    error = run_cmake(args, cmake_command_line, 'generate')
+    if error == 0:
+        Path(fingerprint_path).write_text(fingerprint + '\n')
     os.chdir(args.workspace_root)
     return error
 
 
+# make and ninja share the -j and -l options
+def get_jobs_options(args):
+    options = f" -j {args.build_jobs}"
+    if args.build_max_load is not None:
+        options += f" -l {args.build_max_load}"
+    return options
+
 def cmake_build(args):
     go_to_build_dir(args)
+    if args.timings:
+        build_timings.reset_timings_log(args)
+
     # generate the projects
     capitalized_config = args.config.capitalize()
     cmake_command_line = f"\"{args.cmake_path}\" --build . --config {capitalized_config}"
@@ -108,14 +216,17 @@ def cmake_build(args):
     if args.current_system == 'Windows':
         cmake_command_line += " /nologo"
         if args.generator.startswith('msvc'):
-            cmake_command_line += " /p:WarningLevel=0  /maxcpucount  /nr:false  /verbosity:" + ("minimal" if args.verbose else "quiet")
+            cmake_command_line += f" /p:WarningLevel=0  /maxcpucount:{args.build_jobs}  /nr:false  /verbosity:" + ("minimal" if args.verbose else "quiet")
+    elif args.generator == "ninja":
+        cmake_command_line += get_jobs_options(args) + (" -v" if args.verbose else "")
     elif args.current_system == 'Darwin':
         pass
     elif args.current_system == 'Linux':
         if args.generator == "makefile":
-            cpu_count = multiprocessing.cpu_count()
-            cmake_command_line += f" -j {cpu_count}" + ("" if args.verbose else " -s")
+            cmake_command_line += get_jobs_options(args) + ("" if args.verbose else " -s")
 
-    error = run_cmake(cmake_command_line, args.verbose)
+    with job_policy.JobMemoryMonitor() as monitor:
+        error = run_cmake(args, cmake_command_line, 'build')
+    args.max_job_memory = monitor.max_job_memory
     os.chdir(args.workspace_root)
     return error
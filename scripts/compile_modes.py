@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+from pathlib import Path
+from . import my_utils
+
+# Precompiled headers and unity builds of `builder build --pch --unity`, applied per target by CMakeLists.txt.
+# The duration of the full builds of each mode is kept in build/compile_modes_<config>.json to compare the modes.
+
+# target => sources directory, same as CMakeLists.txt
+target_source_dirs = {'LIB': 'src/lib', 'APP': 'src/app', 'TESTS': 'src/tests'}
+include_regex = re.compile(rb'^\s*#\s*include\s*([<"])([^>"]+)[>"]', re.MULTILINE)
+max_pch_headers = 10
+min_pch_includes = 2
+
+# the headers not found in the workspace sources (standard library, third parties) included by at least
+# min_pch_includes sources of the directory, most included first. Headers of the workspace change too often to be
+# precompiled: each change would rebuild the precompiled header and every source of the target.
+def select_pch_headers(workspace_root, source_dir):
+    from .cmake_utils import source_extensions
+    source_root = f'{workspace_root}/{source_dir}'
+    include_dirs = [source_root, f'{workspace_root}/src/lib']
+    counts = {}
+    for root, _, files in os.walk(source_root):
+        for name in files:
+            if not name.endswith(source_extensions):
+                continue
+            content = Path(root, name).read_bytes()
+            for delimiter, header in set(include_regex.findall(content)):
+                header = header.decode('utf-8', errors='replace').strip()
+                if delimiter == b'"' and any(os.path.exists(f'{directory}/{header}') for directory in include_dirs + [root]):
+                    continue
+                key = f'<{header}>' if delimiter == b'<' else f'"{header}"'
+                counts[key] = counts.get(key, 0) + 1
+    headers = sorted((header for header, count in counts.items() if count >= min_pch_includes), key=lambda header: (-counts[header], header))
+    return headers[:max_pch_headers]
+
+def get_mode_name(args):
+    modes = []
+    if args.pch == 'auto':
+        modes.append('pch')
+    if args.unity:
+        modes.append(f'unity{args.unity}')
+    return '+'.join(modes) or 'normal'
+
+# (name, value) of the cmake cache variables read by CMakeLists.txt
+def get_cmake_variables(args):
+    variables = []
+    for target, source_dir in target_source_dirs.items():
+        headers = select_pch_headers(args.workspace_root, source_dir) if args.pch == 'auto' else []
+        if args.verbose and headers:
+            my_utils.builder_print(f'precompiled headers of {source_dir}: {" ".join(headers)}')
+        variables.append((f'BUILDER_PCH_{target}_HEADERS', ';'.join(headers)))
+    variables.append(('BUILDER_UNITY_BATCH_SIZE', str(args.unity or 0)))
+    return variables
+
+#### full build durations per mode
+
+# one file per configuration, as the configurations build concurrently. Not in the build directory of the
+# configuration, which the full builds with --clean delete
+def get_durations_path(args):
+    return my_utils.normalize_path(f'{args.build_root}/compile_modes_{args.config}.json')
+
+# every object is compiled when the build directory is new or cleaned. --rebuild only runs the build, incrementally
+def is_full_build(args):
+    return args.clean or args.clean_outputs or not os.path.exists(f'{args.build_dir}/CMakeCache.txt')
+
+def record_full_build(args, duration):
+    path = get_durations_path(args)
+    try:
+        config_durations = json.loads(Path(path).read_text())
+    except (FileNotFoundError, ValueError):
+        config_durations = {}
+    mode = get_mode_name(args)
+    config_durations[mode] = duration
+    my_utils.write_text_atomically(path, json.dumps(config_durations, indent=1, sort_keys=True))
+
+    normal_duration = config_durations.get('normal')
+    if mode == 'normal':
+        return
+    if normal_duration:
+        change = 100 * (duration - normal_duration) / normal_duration
+        my_utils.builder_print(f'{mode} full build: {duration:.2f} seconds, normal full build: {normal_duration:.2f} seconds ({change:+.1f}%)')
+    else:
+        my_utils.builder_print(f'{mode} full build: {duration:.2f} seconds. Run a normal full build with `--pch none --unity 0 --clean` to compare')
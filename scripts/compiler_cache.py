@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import subprocess
+from . import my_utils
+from . import event_utils
+
+# ccache/sccache integration: the compiler cache is used as CMAKE_<LANG>_COMPILER_LAUNCHER
+
+compiler_cache_choices = ['none', 'auto', 'ccache', 'sccache']
+cache_dir_env_vars = {'ccache': 'CCACHE_DIR', 'sccache': 'SCCACHE_DIR'}
+
+# sets args.compiler_cache_tool and args.compiler_cache_path, None when no compiler cache is used
+def resolve_compiler_cache(args):
+    args.compiler_cache_tool = None
+    args.compiler_cache_path = None
+    choice = args.compiler_cache or 'none'
+    if choice == 'none':
+        return 0
+
+    if args.dist_workers:
+        my_utils.builder_print_warning('The compiler cache is not used in distributed builds')
+        return 0
+
+    if choice not in compiler_cache_choices:
+        my_utils.builder_print_error(f'Invalid compiler cache {choice}, choose from {", ".join(compiler_cache_choices)}')
+        return 1
+
+    for tool in ['ccache', 'sccache'] if choice == 'auto' else [choice]:
+        path = my_utils.which(tool)
+        if path:
+            args.compiler_cache_tool = tool
+            args.compiler_cache_path = my_utils.normalize_path(path)
+            break
+
+    if args.compiler_cache_path is None:
+        my_utils.builder_print_warning(f'Compiler cache {choice} not found in PATH, building without compiler cache')
+        return 0
+
+    # the launcher inherits the environment of the build, also in the worker processes
+    if args.compiler_cache_dir:
+        cache_dir = my_utils.make_path_absolute(args.workspace_root, args.compiler_cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ[cache_dir_env_vars[args.compiler_cache_tool]] = cache_dir
+
+    my_utils.builder_print(f'Using compiler cache {args.compiler_cache_path}' +
+                           (f' with cache directory {args.compiler_cache_dir}' if args.compiler_cache_dir else ''))
+    return 0
+
+def _run(cmd):
+    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, encoding='utf-8', errors='surrogateescape').stdout
+
+def _sum_counts(stats, name):
+    return sum(stats.get(name, {}).get('counts', {}).values())
+
+# returns (hits, misses) since the cache statistics were last zeroed, None if they can't be read
+def get_compiler_cache_stats(args):
+    try:
+        if args.compiler_cache_tool == 'ccache':
+            # --print-stats: one "name<tab>value" per line
+            values = {}
+            for line in _run([args.compiler_cache_path, '--print-stats']).splitlines():
+                name, _, value = line.partition('\t')
+                if value.strip().isdigit():
+                    values[name] = int(value)
+            hits = values.get('direct_cache_hit', 0) + values.get('preprocessed_cache_hit', 0)
+            return hits, values.get('cache_miss', 0)
+
+        if args.compiler_cache_tool == 'sccache':
+            stats = json.loads(_run([args.compiler_cache_path, '--show-stats', '--stats-format=json'])).get('stats', {})
+            return _sum_counts(stats, 'cache_hits'), _sum_counts(stats, 'cache_misses')
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        pass
+    return None
+
+# the statistics are global to the cache, so the report is the difference of the counters before and after the build
+def print_compiler_cache_stats(args, stats_before):
+    stats_after = get_compiler_cache_stats(args)
+    if stats_before is None or stats_after is None:
+        my_utils.builder_print_warning(f'Could not read the {args.compiler_cache_tool} statistics')
+        return
+
+    hits = stats_after[0] - stats_before[0]
+    misses = stats_after[1] - stats_before[1]
+    total = hits + misses
+    hit_rate = f' ({100 * hits / total:.0f}% hit rate)' if total else ''
+    event_utils.emit('cache', cache='compiler', config=args.config, tool=args.compiler_cache_tool, hits=hits, misses=misses)
+    my_utils.builder_print(f'{args.compiler_cache_tool}: {hits} hits, {misses} misses{hit_rate}')
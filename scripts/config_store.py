@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import marshal
+from . import my_utils
+
+# Sources of the values of the options stored in config files, from the lowest to the highest priority:
+#   1. the user file ~/.config/builder/builder-config.txt, shared by all the workspaces
+#   2. the workspace file builder-config.txt
+#   3. the BUILDER_<OPTION> environment variables, for instance BUILDER_GENERATOR=ninja for --generator
+#   4. the command line
+# The files contain `--option value` pairs and optional [profile] sections: the values of the profile selected with
+# --config_profile (or BUILDER_CONFIG_PROFILE) override the ones written before the first section.
+#
+# The parsed files are stored in a binary snapshot in build/, invalidated by the file modification time and size,
+# so the text files are only parsed again after they change.
+
+profile_env_var = 'BUILDER_CONFIG_PROFILE'
+default_section = ''
+snapshot_version = 1
+
+def get_workspace_config_path(workspace_root):
+    return my_utils.normalize_path(f'{workspace_root}/builder-config.txt')
+
+def get_user_config_path():
+    return my_utils.normalize_path('~/.config/builder/builder-config.txt')
+
+# the files from the lowest to the highest priority
+def get_config_paths(workspace_root):
+    return [get_user_config_path(), get_workspace_config_path(workspace_root)]
+
+def get_snapshot_path(workspace_root):
+    return my_utils.normalize_path(f'{workspace_root}/build/config-snapshot.bin')
+
+# '--compiler_cache_dir' => 'BUILDER_COMPILER_CACHE_DIR'
+def get_env_var(option_name):
+    return 'BUILDER_' + option_name.lstrip('-').upper()
+
+# returns {section: tokens}, the tokens before the first section are in default_section
+def parse_config_text(text):
+    sections = {default_section: []}
+    tokens = sections[default_section]
+    for line in text.splitlines():
+        comment_index = line.find('#')
+        if comment_index != -1:
+            line = line[:comment_index]
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            tokens = sections.setdefault(line[1:-1].strip(), [])
+        elif line:
+            tokens.extend(line.split())
+    return sections
+
+def format_config_text(section_values):
+    lines = []
+    for section, values in section_values.items():
+        if not values:
+            continue
+        if section != default_section:
+            if lines:
+                lines.append('')
+            lines.append(f'[{section}]')
+        lines.extend(f'{name} {value}' for name, value in values.items())
+    return '\n'.join(lines) + '\n' if lines else ''
+
+#### snapshot
+
+# snapshot files by snapshot path, for long lived processes like the builder daemon
+snapshot_cache = {}
+
+def load_snapshot(snapshot_path):
+    try:
+        with open(snapshot_path, 'rb') as snapshot_file:
+            snapshot = marshal.load(snapshot_file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    if not isinstance(snapshot, dict) or snapshot.get('version') != snapshot_version:
+        return {}
+    return snapshot['files']
+
+# the snapshot is only written once build/ exists: builder config and the other commands not building don't create it
+def write_snapshot(snapshot_path, files):
+    if not os.path.isdir(os.path.dirname(snapshot_path)):
+        return
+    tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as snapshot_file:
+            marshal.dump({'version': snapshot_version, 'files': files}, snapshot_file)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        # the snapshot is only a cache
+        my_utils.builder_print_warning(f'Failed to write the config snapshot {snapshot_path}: {e}')
+
+# returns the {section: tokens} of each path, read from the snapshot when the file is unchanged
+def read_config_sections(workspace_root, paths):
+    snapshot_path = get_snapshot_path(workspace_root)
+    files = snapshot_cache.get(snapshot_path)
+    if files is None:
+        files = load_snapshot(snapshot_path)
+        snapshot_cache[snapshot_path] = files
+
+    changed = False
+    all_sections = []
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+            key = (stat_result.st_mtime_ns, stat_result.st_size)
+        except FileNotFoundError:
+            key = None # no config file is perfectly ok
+        entry = files.get(path)
+        if entry is None or entry[0] != key:
+            sections = {}
+            if key is not None:
+                with open(path, encoding='utf-8', errors='surrogateescape') as config_file:
+                    sections = parse_config_text(config_file.read())
+            entry = (key, sections)
+            files[path] = entry
+            changed = True
+        all_sections.append(entry[1])
+
+    if changed:
+        write_snapshot(snapshot_path, files)
+    return all_sections
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Thin client of the builder daemon, kept free of heavy imports since it runs before the builder is loaded.
+
+import os
+import sys
+
+forwarded_commands = ('build', 'unit-tests')
+exit_code_marker = b'\0builder-exit-code:'
+
+def get_socket_path(workspace_root):
+    return os.path.join(workspace_root, 'build', 'builder-daemon.sock')
+
+def connect(workspace_root):
+    socket_path = get_socket_path(workspace_root)
+    if not os.path.exists(socket_path):
+        return None
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        # stale socket of a daemon that did not stop cleanly
+        client.close()
+        return None
+    return client
+
+def send_request(client, request):
+    import json
+    client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+
+# Returns the exit code of the command run by the daemon, or None when no daemon is running.
+# The daemon streams the output of the command, followed by the exit code marker.
+def forward_to_daemon(workspace_root, argv):
+    if not argv or argv[0] not in forwarded_commands:
+        return None
+    client = connect(workspace_root)
+    if client is None:
+        return None
+
+    with client:
+        send_request(client, {'command': 'run', 'argv': argv, 'env': dict(os.environ)})
+        out = sys.stdout.buffer
+        pending = b''
+        while True:
+            chunk = client.recv(64 * 1024)
+            if not chunk:
+                print('[builder] [ERROR] The builder daemon closed the connection', file=sys.stderr)
+                return 1
+            pending += chunk
+            marker_index = pending.find(exit_code_marker)
+            if marker_index != -1:
+                out.write(pending[:marker_index])
+                out.flush()
+                trailer = pending[marker_index + len(exit_code_marker):]
+                while not trailer.endswith(b'\n'):
+                    chunk = client.recv(64)
+                    if not chunk:
+                        break
+                    trailer += chunk
+                return int(trailer.strip() or b'1')
+            # keep a possible partial marker for the next chunk
+            keep = len(exit_code_marker) - 1
+            out.write(pending[:-keep])
+            out.flush()
+            pending = pending[-keep:]
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import glob
+import uuid
+import shutil
+import hashlib
+import tarfile
+import tempfile
+from pathlib import Path
+from . import my_utils
+from . import cmake_utils
+from . import artifact_cache
+from . import event_utils
+
+# Cache of the third party dependencies, shared by the workspaces and kept across clean builds:
+#   sources/<name>-<tree sha256>/            the sources, named after the hash of their content
+#   pins/<name>-<version>                    the sources directory of the pinned version
+#   builds/<name>-<tree>-<toolchain>-<config>/  the installed build, once per toolchain and configuration
+# The sources come from a vendored copy (--source, or the distribution googletest package), or from the pinned archive
+# verified with its sha256. builder deps fills the cache, builder build uses it and builds what is missing.
+
+googletest = {
+    'name': 'googletest',
+    'version': '1.12.1',
+    'url': 'https://github.com/google/googletest/archive/refs/tags/release-1.12.1.tar.gz',
+    'sha256': '81964fe578e9bd7c94dfdb09c8e4d6e6759e19967e397dbea48d1c10e45d0df2',
+    'vendored_dirs': ['/usr/src/googletest'],
+    'cmake_options': ['-DBUILD_GMOCK=OFF', '-DINSTALL_GTEST=ON', '-Dgtest_force_shared_crt=ON'],
+}
+gtest_library_regex = re.compile(r'^(lib)?gtestd?\.(a|lib)$')
+
+def get_cache_dir(args):
+    if args.deps_cache_dir:
+        return my_utils.make_path_absolute(args.workspace_root, args.deps_cache_dir)
+    return my_utils.normalize_path(f'{os.environ.get("XDG_CACHE_HOME", "~/.cache")}/builder/deps')
+
+def get_pin_path(cache_dir, dependency):
+    return f'{cache_dir}/pins/{dependency["name"]}-{dependency["version"]}'
+
+def compute_tree_hash(directory):
+    sha = hashlib.sha256()
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if name != '.git')
+        for name in sorted(names):
+            path = Path(root, name)
+            sha.update(f'\0{path.relative_to(directory).as_posix()}\0'.encode('utf-8'))
+            sha.update(path.read_bytes())
+    return sha.hexdigest()
+
+def get_sources_dir(cache_dir, dependency):
+    try:
+        name = Path(get_pin_path(cache_dir, dependency)).read_text().strip()
+    except FileNotFoundError:
+        return None
+    sources_dir = f'{cache_dir}/sources/{name}'
+    return sources_dir if os.path.isdir(sources_dir) else None
+
+def get_vendored_version(directory):
+    try:
+        match = re.search(r'GOOGLETEST_VERSION\s+([0-9.]+)', Path(f'{directory}/CMakeLists.txt').read_text())
+    except FileNotFoundError:
+        return None
+    return match.group(1) if match else None
+
+# moves the directory to sources/<name>-<tree hash> and pins it, returns the sources directory
+def add_sources(cache_dir, dependency, directory):
+    name = f'{dependency["name"]}-{compute_tree_hash(directory)[:16]}'
+    sources_dir = f'{cache_dir}/sources/{name}'
+    if not os.path.isdir(sources_dir):
+        os.makedirs(os.path.dirname(sources_dir), exist_ok=True)
+        try:
+            os.rename(directory, sources_dir)
+        except OSError:
+            if not os.path.isdir(sources_dir): # else added concurrently
+                raise
+    pin_path = get_pin_path(cache_dir, dependency)
+    os.makedirs(os.path.dirname(pin_path), exist_ok=True)
+    Path(pin_path).write_text(name + '\n')
+    return sources_dir
+
+# the archives come from the network or the command line, their members must not be written outside of the destination
+def extract_archive(archive, destination):
+    if hasattr(tarfile, 'data_filter'):
+        archive.extractall(destination, filter='data')
+        return
+    root = os.path.realpath(destination)
+    for member in archive.getmembers():
+        path = os.path.realpath(os.path.join(root, member.name))
+        if member.issym():
+            path = os.path.realpath(os.path.join(os.path.dirname(path), member.linkname))
+        elif member.islnk():
+            path = os.path.realpath(os.path.join(root, member.linkname))
+        if member.isdev() or os.path.commonpath([root, path]) != root:
+            raise ValueError(f'unsafe member {member.name} in the archive')
+    archive.extractall(destination)
+
+def download_sources(dependency, destination):
+    import urllib.request
+    with tempfile.TemporaryFile() as archive_file:
+        sha = hashlib.sha256()
+        with urllib.request.urlopen(dependency['url'], timeout=60) as response:
+            for chunk in iter(lambda: response.read(1024 * 1024), b''):
+                sha.update(chunk)
+                archive_file.write(chunk)
+        if sha.hexdigest() != dependency['sha256']:
+            raise ValueError(f'{dependency["url"]} sha256 is {sha.hexdigest()}, expected {dependency["sha256"]}')
+        archive_file.seek(0)
+        with tarfile.open(fileobj=archive_file, mode='r:gz') as archive:
+            extract_archive(archive, destination)
+    # the archive contains a single googletest-release-<version> directory
+    [top_dir] = os.listdir(destination)
+    return f'{destination}/{top_dir}'
+
+# returns the pinned sources directory, fetching them if needed, or None
+def fetch_sources(args, dependency, source=None, allow_download=True):
+    cache_dir = get_cache_dir(args)
+    sources_dir = get_sources_dir(cache_dir, dependency)
+    if sources_dir and not source:
+        return sources_dir
+
+    candidates = [source] if source else [directory for directory in dependency['vendored_dirs'] if os.path.isdir(directory)]
+    if not candidates and not allow_download:
+        return None
+    tmp_dir = f'{cache_dir}/.tmp-{uuid.uuid4().hex}'
+    os.makedirs(tmp_dir)
+    try:
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                try:
+                    with tarfile.open(candidate) as archive:
+                        extract_archive(archive, f'{tmp_dir}/archive')
+                except (tarfile.TarError, ValueError) as e:
+                    my_utils.builder_print_warning(f'Failed to extract {candidate}: {e}')
+                    continue
+                [top_dir] = os.listdir(f'{tmp_dir}/archive')
+                candidate = f'{tmp_dir}/archive/{top_dir}'
+            version = get_vendored_version(candidate)
+            if version != dependency['version']:
+                my_utils.builder_print_warning(f'{dependency["name"]} {version} in {candidate} is not the pinned version {dependency["version"]}')
+                continue
+            shutil.copytree(candidate, f'{tmp_dir}/copy', ignore=shutil.ignore_patterns('.git'))
+            my_utils.builder_print(f'{dependency["name"]} {dependency["version"]} sources copied from {candidate}')
+            return add_sources(cache_dir, dependency, f'{tmp_dir}/copy')
+
+        if not allow_download or source:
+            return None
+        my_utils.builder_print(f'Downloading {dependency["name"]} {dependency["version"]} from {dependency["url"]}')
+        try:
+            return add_sources(cache_dir, dependency, download_sources(dependency, f'{tmp_dir}/download'))
+        except (OSError, ValueError, tarfile.TarError) as e:
+            my_utils.builder_print_warning(f'Failed to download {dependency["name"]}: {e}')
+            return None
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def get_toolchain_hash(args):
+    toolchain = f'{artifact_cache.get_toolchain_version(args)}\0{args.cmake_generator}'
+    return hashlib.sha256(toolchain.encode('utf-8')).hexdigest()[:16]
+
+def get_build_dir(args, dependency, sources_dir):
+    cache_dir = get_cache_dir(args)
+    return f'{cache_dir}/builds/{os.path.basename(sources_dir)}-{get_toolchain_hash(args)}-{args.config}'
+
+def find_gtest_library(install_dir):
+    for path in sorted(glob.glob(f'{install_dir}/lib*/*')):
+        if gtest_library_regex.match(os.path.basename(path)):
+            return my_utils.normalize_path(path)
+    return None
+
+def emit_cache_event(args, dependency, hit):
+    event_utils.emit('cache', cache='deps', config=args.config, name=dependency['name'], version=dependency['version'], hit=hit)
+
+# builds and installs the sources once per toolchain and configuration, returns the install directory or None
+def build_dependency(args, dependency, sources_dir):
+    install_dir = get_build_dir(args, dependency, sources_dir)
+    is_cached = os.path.isdir(install_dir)
+    emit_cache_event(args, dependency, is_cached)
+    if is_cached:
+        return install_dir
+
+    tmp_dir = f'{install_dir}.tmp-{uuid.uuid4().hex}'
+    os.makedirs(f'{tmp_dir}/build')
+    my_utils.builder_print(f'Building {dependency["name"]} {dependency["version"]} ({args.config}) in the dependency cache')
+    capitalized_config = args.config.capitalize()
+    options = ' '.join(dependency['cmake_options'])
+    generate_command_line = f'"{args.cmake_path}" -G "{args.cmake_generator}" -DCMAKE_BUILD_TYPE={capitalized_config} ' \
+                            f'-DCMAKE_INSTALL_PREFIX="{tmp_dir}/install" {options} "{sources_dir}"'
+    build_command_line = f'"{args.cmake_path}" --build . --config {capitalized_config} --target install'
+    current_dir = os.getcwd()
+    try:
+        os.chdir(f'{tmp_dir}/build')
+        error = cmake_utils.run_cmake(args, generate_command_line, f'deps_{dependency["name"]}_generate') or \
+                cmake_utils.run_cmake(args, build_command_line, f'deps_{dependency["name"]}_build')
+        if error != 0:
+            return None
+        try:
+            os.rename(f'{tmp_dir}/install', install_dir)
+        except OSError:
+            if not os.path.isdir(install_dir): # else built concurrently
+                raise
+        return install_dir
+    finally:
+        os.chdir(current_dir)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# sets args.gtest_root and args.gtest_library to the prebuilt googletest of the cache, building it if needed.
+# They stay empty when it is not available, scripts/cmake/gtest.cmake then downloads googletest itself.
+def prepare_googletest(args, allow_download=False):
+    args.gtest_root = ''
+    args.gtest_library = ''
+    if args.deps_cache_dir == 'none':
+        return 0
+    sources_dir = fetch_sources(args, googletest, allow_download=allow_download)
+    if sources_dir is None:
+        emit_cache_event(args, googletest, False)
+        if args.verbose:
+            my_utils.builder_print('googletest is not in the dependency cache, cmake downloads it (see builder deps)')
+        return 0
+    install_dir = build_dependency(args, googletest, sources_dir)
+    library = find_gtest_library(install_dir) if install_dir else None
+    if library is None:
+        my_utils.builder_print_warning('Failed to build googletest in the dependency cache, cmake downloads it')
+        return 0
+    args.gtest_root = install_dir
+    args.gtest_library = library
+    return 0
+
+# returns the list of problems of the cached sources and builds
+def verify_cache(args, dependency):
+    cache_dir = get_cache_dir(args)
+    problems = []
+    sources_dir = get_sources_dir(cache_dir, dependency)
+    if sources_dir is None:
+        return [f'{dependency["name"]} {dependency["version"]} sources are not in {cache_dir}']
+    name = os.path.basename(sources_dir)
+    if not name.endswith(compute_tree_hash(sources_dir)[:16]):
+        problems.append(f'{sources_dir} content does not match its hash')
+    for build_dir in sorted(glob.glob(f'{cache_dir}/builds/{name}-*')):
+        if '.tmp-' not in build_dir and find_gtest_library(build_dir) is None:
+            problems.append(f'{build_dir} has no gtest library')
+    return problems
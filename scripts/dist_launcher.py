@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# Compiler launcher of the distributed builds, set as CMAKE_<LANG>_COMPILER_LAUNCHER by `builder build --dist_workers`.
+# usage: dist_launcher.py <compiler> <compiler arguments...>
+# Preprocesses the source locally (which also writes the dependency files), ships it to a worker of
+# BUILDER_DIST_WORKERS, and writes back the object file. Runs the compiler locally when no worker is usable, or when
+# the compile flags are not accepted by the workers.
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import dist_utils # pylint: disable=C0413
+
+# preprocessor options, not needed to compile the preprocessed source (option => has a separate value)
+preprocessor_options = {'-I': True, '-D': True, '-U': True, '-isystem': True, '-include': True, '-iquote': True,
+                        '-MT': True, '-MF': True, '-MQ': True, '-MD': False, '-MMD': False, '-MP': False}
+
+def parse_compile_command(cmd):
+    compiler, args = cmd[0], cmd[1:]
+    if '-c' not in args or args.count('-o') != 1:
+        return None
+    source = args[args.index('-c') + 1] if args.index('-c') + 1 < len(args) else None
+    output = args[args.index('-o') + 1]
+    if source is None or source.startswith('-'):
+        return None
+    return compiler, args, source, output
+
+def get_remote_args(args, source, output):
+    remote_args = []
+    skip_next = False
+    for i, arg in enumerate(args):
+        if skip_next:
+            skip_next = False
+            continue
+        if arg in ('-c', '-o'):
+            skip_next = True
+            continue
+        if arg == source and i > 0 and args[i - 1] == '-c':
+            continue
+        option = next((o for o in preprocessor_options if arg == o or (preprocessor_options[o] and arg.startswith(o) and len(o) == 2)), None)
+        if option is not None:
+            skip_next = arg == option and preprocessor_options[option]
+            continue
+        remote_args.append(arg)
+    return remote_args
+
+def get_language(source):
+    if source.endswith('.c'):
+        return 'cpp-output'
+    return 'c++-cpp-output'
+
+# a worker that doesn't answer in time is treated as failed and the source is compiled locally. The read timeout
+# leaves time for the compilations queued by a busy worker
+connect_timeout = 5
+compile_timeout = 300
+
+# the workers were queried once by the builder at the start of the build: each compilation goes to a worker picked at
+# random, weighted by the job counts of the workers, which queue the jobs above their capacity. This is not a least
+# loaded choice, which would need the live active count of every worker for each compilation
+def choose_worker(workers, worker_jobs):
+    if not workers:
+        return None
+    return random.choices(workers, weights=worker_jobs)[0]
+
+# "8,4" => [8, 4], one job count per worker
+def parse_worker_jobs(value, workers):
+    try:
+        worker_jobs = [max(1, int(jobs)) for jobs in (value or '').split(',') if jobs]
+    except ValueError:
+        worker_jobs = []
+    return worker_jobs if len(worker_jobs) == len(workers) else [1] * len(workers)
+
+def write_stats(record):
+    stats_path = os.environ.get('BUILDER_DIST_STATS')
+    if stats_path:
+        with open(stats_path, 'a') as stats_file:
+            stats_file.write(json.dumps(record) + '\n')
+
+def compile_remotely(workers, worker_jobs, token, parsed):
+    compiler, args, source, output = parsed
+    remote_args = get_remote_args(args, source, output)
+    if not all(dist_utils.is_safe_compile_arg(arg) for arg in remote_args):
+        return None, None # refused by the workers
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        preprocessed_path = os.path.join(tmp_dir, 'source.i')
+        preprocess_cmd = [compiler] + [arg if arg != '-c' else '-E' for arg in args]
+        preprocess_cmd[preprocess_cmd.index('-o') + 1] = preprocessed_path
+        if subprocess.call(preprocess_cmd) != 0:
+            return 1, None # preprocessing errors are reported by the compiler
+        with open(preprocessed_path, 'rb') as preprocessed_file:
+            preprocessed = preprocessed_file.read()
+
+    worker = choose_worker(workers, worker_jobs)
+    if worker is None:
+        return None, None
+
+    start = time.perf_counter()
+    header = {'type': 'compile', 'token': token, 'compiler': compiler, 'args': remote_args,
+              'language': get_language(source), 'source': source}
+    reply, object_data = dist_utils.request(worker, header, preprocessed, timeout=compile_timeout, connect_timeout=connect_timeout)
+    if reply.get('rejected'):
+        return None, None
+    if reply.get('stderr'):
+        sys.stderr.write(reply['stderr'])
+    if reply['returncode'] == 0:
+        with open(output, 'wb') as object_file:
+            object_file.write(object_data)
+
+    write_stats({'worker': f'{worker[0]}:{worker[1]}', 'source': source, 'duration': time.perf_counter() - start,
+                 'bytes_sent': len(preprocessed), 'bytes_received': len(object_data), 'fallback': False})
+    return reply['returncode'], worker
+
+def main(argv):
+    cmd = argv[1:]
+    workers = dist_utils.parse_workers(os.environ.get('BUILDER_DIST_WORKERS'))
+    worker_jobs = parse_worker_jobs(os.environ.get('BUILDER_DIST_WORKER_JOBS'), workers)
+    parsed = parse_compile_command(cmd)
+    if workers and parsed is not None:
+        try:
+            returncode, worker = compile_remotely(workers, worker_jobs, os.environ.get(dist_utils.token_env_var, ''), parsed)
+            if worker is not None or returncode:
+                return returncode
+        except (OSError, ValueError, KeyError):
+            pass # fallback to a local compilation
+
+    start = time.perf_counter()
+    returncode = subprocess.call(cmd)
+    if workers and parsed is not None:
+        write_stats({'worker': 'local', 'source': parsed[2], 'duration': time.perf_counter() - start,
+                     'bytes_sent': 0, 'bytes_received': 0, 'fallback': True})
+    return returncode
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+import hmac
+import json
+import socket
+import struct
+
+# Messages of the distributed build protocol, between scripts/dist_launcher.py and `builder worker`:
+# 4 bytes big endian header size, json header, then header['payload_size'] bytes of payload.
+# Every request carries the shared token of the worker, which only runs its own compilers with the compile flags
+# accepted by is_safe_compile_arg. The token is not encrypted: the workers are meant for trusted networks.
+
+default_worker_port = 8477
+token_env_var = 'BUILDER_DIST_TOKEN'
+languages = ('cpp-output', 'c++-cpp-output')
+
+# flags of the preprocessed source compilations. The flags with paths, or writing or loading files (plugins, profiles,
+# options of the assembler and linker, response files) are compiled locally.
+safe_compile_flags = ('-w', '-pthread', '-pipe', '-ansi')
+safe_compile_flag_prefixes = ('-O', '-g', '-std=', '--std=', '-W', '-f', '-m', '-pedantic')
+unsafe_compile_flag_prefixes = ('-Wa,', '-Wl,', '-Wp,', '-fplugin', '-fprofile', '-fauto-profile', '-fdump', '-fopt-info',
+                                '-fsave-optimization-record', '-fcrash-diagnostics', '-fsanitize-blacklist',
+                                '-fsanitize-ignorelist', '-fsanitize-coverage', '-fstack-usage', '-fcallgraph-info',
+                                '-fcoverage', '-ftest-coverage')
+
+def is_safe_compile_arg(arg):
+    if '/' in arg or '\\' in arg or arg.startswith(unsafe_compile_flag_prefixes):
+        return False
+    return arg in safe_compile_flags or arg.startswith(safe_compile_flag_prefixes)
+
+def is_token_valid(header, token):
+    return hmac.compare_digest(str(header.get('token', '')).encode('utf-8'), token.encode('utf-8'))
+
+def send_message(sock, header, payload=b''):
+    header = dict(header, payload_size=len(payload))
+    header_bytes = json.dumps(header).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(header_bytes)) + header_bytes + payload)
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1024 * 1024))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return bytes(data)
+
+def recv_message(sock):
+    header_size = struct.unpack('>I', _recv_exactly(sock, 4))[0]
+    header = json.loads(_recv_exactly(sock, header_size).decode('utf-8'))
+    payload = _recv_exactly(sock, header['payload_size'])
+    return header, payload
+
+# "host:port,host:port" => [('host', port), ...]
+def parse_workers(value):
+    workers = []
+    for worker in (value or '').split(','):
+        worker = worker.strip()
+        if worker:
+            host, _, port = worker.rpartition(':')
+            workers.append((host or 'localhost', int(port) if port else default_worker_port))
+    return workers
+
+# timeout applies to each read and write, connect_timeout to the connection, default is timeout
+def request(worker, header, payload=b'', timeout=None, connect_timeout=None):
+    with socket.create_connection(worker, timeout=connect_timeout or timeout) as sock:
+        sock.settimeout(timeout)
+        send_message(sock, header, payload)
+        return recv_message(sock)
+
+# returns {worker: status} for the workers answering in time and accepting the token
+def get_workers_status(workers, token, timeout=0.5):
+    statuses = {}
+    for worker in workers:
+        try:
+            status = request(worker, {'type': 'status', 'token': token}, timeout=timeout)[0]
+        except (OSError, ValueError):
+            continue
+        if 'error' not in status:
+            statuses[worker] = status
+    return statuses
+
+#### builder side of the distributed builds
+
+def get_stats_path(build_dir):
+    return os.path.join(build_dir, 'dist_stats.jsonl')
+
+# sets args.dist_worker_statuses to the status of the reachable workers, queried once per build
+def query_workers(args):
+    from . import my_utils
+    workers = parse_workers(args.dist_workers)
+    args.dist_worker_statuses = get_workers_status(workers, args.dist_token or '')
+    for worker in workers:
+        if worker not in args.dist_worker_statuses:
+            my_utils.builder_print_warning(f'distributed build: worker {worker[0]}:{worker[1]} is not reachable or refused the token')
+    return args.dist_worker_statuses
+
+def format_workers(workers):
+    return ','.join(f'{host}:{port}' for host, port in workers)
+
+# the launcher reads the reachable workers with their job counts, the token and the stats file from the environment
+# of the build, instead of polling the workers for each compilation
+def set_build_environment(args):
+    stats_path = get_stats_path(args.build_dir)
+    if os.path.exists(stats_path):
+        os.remove(stats_path)
+    workers = sorted(args.dist_worker_statuses)
+    os.environ['BUILDER_DIST_WORKERS'] = format_workers(workers)
+    os.environ['BUILDER_DIST_WORKER_JOBS'] = ','.join(str(args.dist_worker_statuses[worker]['jobs']) for worker in workers)
+    os.environ[token_env_var] = args.dist_token or ''
+    os.environ['BUILDER_DIST_STATS'] = stats_path
+
+def print_stats(args, build_duration):
+    from . import my_utils
+    per_worker = {}
+    try:
+        with open(get_stats_path(args.build_dir)) as stats_file:
+            for line in stats_file:
+                record = json.loads(line)
+                worker = per_worker.setdefault(record['worker'], {'jobs': 0, 'duration': 0.0, 'bytes_sent': 0, 'bytes_received': 0})
+                worker['jobs'] += 1
+                worker['duration'] += record['duration']
+                worker['bytes_sent'] += record['bytes_sent']
+                worker['bytes_received'] += record['bytes_received']
+    except FileNotFoundError:
+        pass
+
+    if not per_worker:
+        my_utils.builder_print('distributed build: no compile job ran')
+        return
+    my_utils.builder_print('distributed build, compile jobs per worker:')
+    for name, worker in sorted(per_worker.items(), key=lambda item: -item[1]['jobs']):
+        throughput = worker['jobs'] / build_duration if build_duration > 0 else 0
+        my_utils.builder_print(f'  {name:>21}: {worker["jobs"]} jobs, {throughput:.2f} jobs/s, {worker["duration"]:.2f}s of compile time, '
+                               f'{worker["bytes_sent"] / 1024 ** 2:.1f} MiB sent, {worker["bytes_received"] / 1024 ** 2:.1f} MiB received')
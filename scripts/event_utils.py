@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from . import my_utils
+
+# Machine readable event stream of `builder --events jsonl[:<path>]`: one JSON object per line, with at least
+#   {"time": <seconds since epoch>, "pid": <process id>, "type": <event type>}
+# and "tag" when several configurations or steps run concurrently. The event types are:
+#   command_start, command_end   a builder command, with its exit code and duration
+#   step_start, step_end         a step of the profiler (see build --profile), with its duration
+#   cmake_command, cmake_end     a cmake command line, with its exit code, duration and log
+#   diagnostic                   a compiler error or warning: file, line, column, severity, code, message
+#   test_result                  a unit test or system test case: name, status, duration, message
+#   cache                        a lookup in the artifact cache, compiler cache, dependency cache or generate fingerprint
+#   jobs                         the number of parallel jobs chosen for a build or test run
+#
+# emit() only queues the event: a writer thread serializes the queued events and appends them to the file every
+# flush_interval, with one write per batch, so emitting doesn't slow the build down and the file can be followed
+# with `tail -f`. The builder processes forked for concurrent configurations and run steps, and the builder
+# subprocesses (through the BUILDER_EVENTS environment variable), append to the same file.
+
+events_env_var = 'BUILDER_EVENTS'
+default_events_path = 'build/events.jsonl'
+flush_interval = 0.1
+event_formats = ('jsonl',)
+
+class EventStream:
+    def __init__(self):
+        self.path = None
+        self.enabled = False
+        self._fd = None
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # spec is jsonl[:<path>], path relative to the workspace root. Returns an error message or None
+    def open(self, workspace_root, spec):
+        event_format, _, path = spec.partition(':')
+        if event_format not in event_formats:
+            return f'Invalid events format {event_format}, choose from {", ".join(event_formats)}'
+        path = my_utils.make_path_absolute(workspace_root, path or default_events_path)
+        if path == self.path:
+            return None # already opened by the builder process this one was forked from
+
+        self.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # O_APPEND: the batches of the concurrent builder processes are appended whole
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.path = path
+        self.enabled = True
+        os.environ[events_env_var] = f'{event_format}:{path}'
+        return None
+
+    def emit(self, event_type, **fields):
+        if not self.enabled:
+            return
+        event = {'time': time.time(), 'pid': os.getpid(), 'type': event_type}
+        if my_utils.output_tag:
+            event['tag'] = my_utils.output_tag[1:-1]
+        event.update(fields)
+        self._pending.append(event)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(flush_interval)
+            self.flush()
+
+    # writes the queued events, called by the writer thread and before the process exits
+    def flush(self):
+        import json
+        with self._lock:
+            lines = []
+            while self._pending:
+                lines.append(json.dumps(self._pending.popleft(), separators=(',', ':'), default=str) + '\n')
+            if not lines or self._fd is None:
+                return
+            try:
+                os.write(self._fd, ''.join(lines).encode('utf-8', errors='surrogateescape'))
+            except OSError as e:
+                self.enabled = False
+                my_utils.builder_print_warning(f'Failed to write the events to {self.path}, no more events are written: {e}')
+
+    def close(self):
+        if self._fd is None:
+            return
+        self.flush()
+        os.close(self._fd)
+        self._fd = None
+        self.path = None
+        self.enabled = False
+
+    # the forked child has no writer thread, and the events queued before the fork are written by the parent
+    def _after_fork_in_child(self):
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._thread = None
+
+events = EventStream()
+atexit.register(events.flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=events._after_fork_in_child) # pylint: disable=W0212
+
+def emit(event_type, **fields):
+    events.emit(event_type, **fields)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import math
+import threading
+import multiprocessing
+from pathlib import Path
+from . import my_utils
+
+# Choice of the -j/-l values of the makefile and ninja builds from the cpus usable by the builder (affinity, cgroup quota),
+# the current system load and the available memory, with the memory of a job estimated from the previous builds
+
+default_memory_per_job = 1024 ** 3
+min_memory_per_job = 256 * 1024 ** 2
+
+def get_cgroup_cpu_limit():
+    # cgroup v2: "max 100000" or "<quota> <period>"
+    try:
+        quota, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    # cgroup v1
+    try:
+        quota = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us').read_text())
+        period = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us').read_text())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+def get_usable_cpu_count(reasons):
+    cpu_count = multiprocessing.cpu_count()
+    if hasattr(os, 'sched_getaffinity'):
+        affinity_count = len(os.sched_getaffinity(0))
+        if affinity_count < cpu_count:
+            reasons.append(f'cpu affinity allows {affinity_count} of {cpu_count} cpus')
+            cpu_count = affinity_count
+
+    cgroup_limit = get_cgroup_cpu_limit()
+    if cgroup_limit is not None and math.ceil(cgroup_limit) < cpu_count:
+        reasons.append(f'cgroup cpu quota is {cgroup_limit:.2f} cpus')
+        cpu_count = max(1, math.ceil(cgroup_limit))
+
+    reasons.append(f'{cpu_count} usable cpus')
+    return cpu_count
+
+#### memory of the jobs of the previous builds, stored in build/job_stats.json
+
+def get_job_stats_path(args):
+    return my_utils.normalize_path(f'{args.build_root}/job_stats.json')
+
+def get_memory_per_job(args, reasons):
+    try:
+        max_job_memory = json.loads(Path(get_job_stats_path(args)).read_text())['max_job_memory']
+        memory_per_job = max(min_memory_per_job, int(max_job_memory * 1.25))
+        reasons.append(f'previous builds used up to {max_job_memory / 1024 ** 2:.0f} MiB per job, counting {memory_per_job / 1024 ** 2:.0f} MiB per job')
+        return memory_per_job
+    except (OSError, ValueError, KeyError):
+        reasons.append(f'no previous build memory statistics, counting {default_memory_per_job / 1024 ** 2:.0f} MiB per job')
+        return default_memory_per_job
+
+def save_max_job_memory(args, max_job_memory):
+    Path(get_job_stats_path(args)).write_text(json.dumps({'max_job_memory': max_job_memory}))
+
+# Samples the memory of the processes started by the builder while a build runs, and keeps the biggest one.
+# The compilers and linkers are the biggest descendants, make/ninja/cmake are small.
+class JobMemoryMonitor:
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.max_job_memory = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        import psutil
+        builder_process = psutil.Process()
+        while not self._stop_event.wait(self.interval):
+            try:
+                children = builder_process.children(recursive=True)
+            except psutil.Error:
+                continue
+            for child in children:
+                try:
+                    self.max_job_memory = max(self.max_job_memory, child.memory_info().rss)
+                except psutil.Error:
+                    pass # the job already exited
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_event.set()
+        self._thread.join()
+
+#### job policy
+
+# set by builder run for its build steps: the number of build steps that can run concurrently and share the cpus
+concurrent_builds_env_var = 'BUILDER_CONCURRENT_BUILDS'
+
+def get_concurrent_builds():
+    try:
+        return max(1, int(os.environ.get(concurrent_builds_env_var, '1')))
+    except ValueError:
+        return 1
+
+# returns (jobs, max_load, reasons) for each of the config_count concurrent builds
+def choose_jobs(args, config_count):
+    import psutil
+    reasons = []
+    if args.jobs != 'auto':
+        reasons.append(f'--jobs {args.jobs} requested')
+        jobs = args.jobs
+    else:
+        cpu_count = get_usable_cpu_count(reasons)
+        jobs = cpu_count
+        try:
+            load = psutil.getloadavg()[0]
+            if load >= 1:
+                jobs = max(1, cpu_count - int(load))
+                reasons.append(f'system load is {load:.2f}, {jobs} cpus are idle')
+        except (AttributeError, OSError):
+            pass
+
+        memory_per_job = get_memory_per_job(args, reasons)
+        available_memory = psutil.virtual_memory().available
+        memory_jobs = max(1, available_memory // memory_per_job)
+        reasons.append(f'{available_memory / 1024 ** 3:.1f} GiB of available memory fit {memory_jobs} jobs')
+        jobs = min(jobs, memory_jobs)
+
+        concurrent_builds = get_concurrent_builds()
+        if concurrent_builds > 1:
+            jobs = max(1, jobs // concurrent_builds)
+            reasons.append(f'split between {concurrent_builds} build steps run concurrently by builder run')
+
+        if config_count > 1:
+            jobs = max(1, jobs // config_count)
+            reasons.append(f'split between {config_count} configurations built concurrently')
+
+    max_load = args.max_load
+    if max_load is not None:
+        reasons.append(f'new jobs are not started while the load is above {max_load}')
+    return jobs, max_load, reasons
+
+def print_job_choice(jobs, max_load, reasons):
+    my_utils.builder_print(f'Building with -j {jobs}' + (f' -l {max_load}' if max_load is not None else '') + ':')
+    for reason in reasons:
+        my_utils.builder_print(f'  - {reason}')
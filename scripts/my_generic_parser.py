@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
+import os
 from os.path import isdir
 from pathlib import Path
 from argparse import ArgumentParser, ArgumentTypeError, ArgumentError
 from . import my_utils
+from . import config_store
+
+config_choices = ['debug', 'release']
 
 def get_config_path(workspace_root):
-    return my_utils.normalize_path(f"{workspace_root}/builder-config.txt")
+    return config_store.get_workspace_config_path(workspace_root)
 
 class MyGenericParser:
     def __init__(self, parser: ArgumentParser, workspace_root):
@@ -14,8 +18,11 @@ class MyGenericParser:
         self.parser = parser
         self.config_names = []
         self.config_names_dict = {} # names_dict[name] = name used for shortnames support
-        self.config_values_from_file = {} # config_values[name] = value
+        self.config_consts = {} # config_consts[name] = value of the options given without value, like --unity
+        self.config_values_from_file = {} # config_values[name] = value, merged from the config files and the environment
         self.config_values_from_cmd_line = {} # config_values[name] = value
+        self.config_profile = None
+        self.in_config_command = False
 
     # path might be relative or absolute
     # raise exception if the directory does not exist
@@ -25,86 +32,124 @@ class MyGenericParser:
             raise ArgumentTypeError(f'Invalid directory: {path} => {abspath}')
         return abspath
 
-    def add_config_argument_name(self, name, short_name = None):
+    # 'debug,release' or 'all' => ['debug', 'release']
+    def to_config_list(self, value):
+        if value == 'all':
+            return list(config_choices)
+        configs = []
+        for config in value.split(','):
+            config = config.strip()
+            if config not in config_choices:
+                raise ArgumentTypeError(f'Invalid configuration: {config} (choose from {", ".join(config_choices)} or all)')
+            if config not in configs:
+                configs.append(config)
+        return configs
+
+    def to_jobs(self, value):
+        if value == 'auto':
+            return value
+        try:
+            jobs = int(value)
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            raise ArgumentTypeError(f'Invalid jobs count: {value} (expected auto or a positive number)')
+        return jobs
+
+    def add_config_argument_name(self, name, short_name = None, const = None):
         self.config_names.append(name)
         self.config_names_dict[name] = name
         if short_name is not None:
             self.config_names_dict[short_name] = name
+        if const is not None:
+            self.config_consts[name] = const
 
+    # writes the command line values in the section of the selected profile of the workspace file, keeping the other sections
     def write_config_file(self, ignore_current_file_content):
         config_file_abspath = get_config_path(self.workspace_root)
-        path = Path(config_file_abspath)
-        text = ""
+        section = self.config_profile or config_store.default_section
+        [sections] = config_store.read_config_sections(self.workspace_root, [config_file_abspath])
+        section_values = {name: self._config_values_from_tokens(tokens, config_file_abspath) for name, tokens in sections.items()}
+
+        values = {} if ignore_current_file_content else section_values.get(section, {})
         for arg_name in self.config_names:
             value = self.config_values_from_cmd_line.get(arg_name)
-            if value is None and not ignore_current_file_content:
-                value = self.config_values_from_file.get(arg_name)
             if value is not None:
-                text = text + f'{arg_name} {value}\n'
-        path.write_text(text)
-        my_utils.builder_print(f'builder config written to: {config_file_abspath}')
+                values[arg_name] = value
+        section_values[section] = {arg_name: values[arg_name] for arg_name in self.config_names if arg_name in values}
 
-    def _read_config_file(self):
-        all_tokens_in_file = []
-        config_file_abspath = get_config_path(self.workspace_root)
-        try:
-            all_tokens_in_file = my_utils.tokens_from_file(config_file_abspath)
-        except FileNotFoundError:
-            pass # no config file is perfectly ok
+        Path(config_file_abspath).write_text(config_store.format_config_text(section_values))
+        profile_text = f' [{self.config_profile}]' if self.config_profile else ''
+        my_utils.builder_print(f'builder config{profile_text} written to: {config_file_abspath}')
 
+    def _config_values_from_tokens(self, tokens, config_file_abspath):
         config_values = {}
-        iter_tokens = iter(all_tokens_in_file)
+        iter_tokens = iter(tokens)
         for token in iter_tokens:
             name = self.config_names_dict.get(token)
             if name is not None:
                 value = next(iter_tokens, None)
                 if not value:
-                    raise ArgumentError(name, f'in {config_file_abspath} expected one argument after {token}')
+                    raise ArgumentError(token, f'in {config_file_abspath} expected one argument after {token}')
                 existing_value = config_values.get(name)
                 if existing_value is not None:
-                    my_utils.builder_print_warning(f'Ignoring value {existing_value} for options for option {name}, as an other value has already be found ({existing_value}).')
+                    my_utils.builder_print_warning(f'Ignoring value {value} for option {name} in {config_file_abspath}, as an other value has already be found ({existing_value}).')
                 else:
                     config_values[name] = value
+        return config_values
+
+    # merges the config files and the BUILDER_<OPTION> environment variables, see config_store
+    def _read_config_file(self):
+        paths = config_store.get_config_paths(self.workspace_root)
+        all_sections = config_store.read_config_sections(self.workspace_root, paths)
+        sections_to_read = [config_store.default_section]
+        if self.config_profile:
+            sections_to_read.append(self.config_profile)
+            if not self.in_config_command and not any(self.config_profile in sections for sections in all_sections):
+                my_utils.builder_print_warning(f'No [{self.config_profile}] section in the config files {", ".join(paths)}')
+
+        config_values = {}
+        for path, sections in zip(paths, all_sections):
+            for section in sections_to_read:
+                config_values.update(self._config_values_from_tokens(sections.get(section, []), path))
+        for name in self.config_names:
+            value = os.environ.get(config_store.get_env_var(name))
+            if value:
+                config_values[name] = value
 
         self.config_values_from_file = config_values
 
-    ## returns
-    # not_config_arg_list : args that don't correspond to config entries
-    # extra_arg_list      : args '---' and after
+    # records the config entries and the profile given in the command line, stopping at '---'
     def _parse_cmd_line_from_config(self, argv):
-        not_config_arg_list = []
-        extra_arg_list = []
-        args = enumerate(argv)
-        for i, arg in args:
+        self.config_profile = os.environ.get(config_store.profile_env_var) or None
+        i = 0
+        while i < len(argv):
+            arg = argv[i]
+            i += 1
             if arg == '---':
-                extra_arg_list = argv[i:] # all remainings args are not arguments of the commands
-                break
+                break # all remainings args are not arguments of the commands
 
             name = self.config_names_dict.get(arg)
-            if name is not None:
-                _, value = next(args, None)
-                if value is None:
+            if name is not None or arg == '--config_profile':
+                value = argv[i] if i < len(argv) else None
+                if name in self.config_consts and (value is None or value.startswith('-')):
+                    value = self.config_consts[name] # given without value
+                elif value is None:
                     raise ArgumentError(arg, f'in command line arguments expected one argument after {arg}')
-                self.config_values_from_cmd_line[name] = value
-            else:
-                not_config_arg_list.append(arg)
-
-        return not_config_arg_list, extra_arg_list
+                else:
+                    i += 1
+                if name is not None:
+                    self.config_values_from_cmd_line[name] = value
+                else:
+                    self.config_profile = value
 
-    # this also updates the config entries if they are overriden by the command line
+    # the config entries become the defaults of their options, the command line overrides them
     def parse_args_with_config_file(self, command_arg_list):
+        self._parse_cmd_line_from_config(command_arg_list)
         self._read_config_file()
-
-        # config_cmd_line_values[name] = value
-        not_config_arg_list, extra_arg_list = self._parse_cmd_line_from_config(command_arg_list)
-        config_arg_list = []
-        for arg_name in self.config_names:
-            value = self.config_values_from_cmd_line.get(arg_name) or self.config_values_from_file.get(arg_name)
-            if value is not None:
-                config_arg_list.extend((arg_name, value))
-
-        completed_command_arg_list = not_config_arg_list + config_arg_list + extra_arg_list
-        return self.parser.parse_args(completed_command_arg_list)
+        self.parser.set_defaults(config_profile=self.config_profile,
+                                 **{name.lstrip('-'): value for name, value in self.config_values_from_file.items()})
+        return self.parser.parse_args(command_arg_list)
 
     # options not stored in config files
     def add_args_for_build_command(self):
@@ -114,22 +159,88 @@ class MyGenericParser:
         # self.parser.add_argument('--target', '-t', nargs=1, default='all', type=str, metavar='<target>', choices=target_choices,
         #                          help='Target project to build (default is all)')
 
-        config_choices = ['debug', 'release']
-        self.parser.add_argument('--config', '-c', default='release', type=str, metavar='<configuration>',
-                                 choices=config_choices, help='build configuration in debug or release (default is release)')
+        self.parser.add_argument('--config', '-c', default='release', type=self.to_config_list, metavar='<configuration>',
+                                 help='build configurations among debug, release, a comma separated list of them like debug,release or all. '
+                                      'Several configurations are built concurrently (default is release)')
         self.parser.add_argument('--no_generate', '-ng', default=False, action='store_true', help='Prevent from generating the project files.')
+        self.parser.add_argument('--force_generate', '-fg', default=False, action='store_true', help='Generate the project files even if the cmake inputs are unchanged since the last generate.')
         self.parser.add_argument('--no_build'   , '-nb', default=False, action='store_true', help='Prevent from building the project files.')
         self.parser.add_argument('--no_debug'   , '-nz', default=False, action='store_true', help='Prevent debug information ')
         self.parser.add_argument('--rebuild'    ,  '-r', default=False, action='store_true', help='Clean all output targets before build')
         self.parser.add_argument('--clean'      ,  '-x', default=False, action='store_true', help='Clean the build directory before running any build command')
+        self.parser.add_argument('--no_artifact_cache', default=False, action='store_true',
+                                 help='Neither restore nor store the outputs in the artifact cache for this build')
+        self.parser.add_argument('--kill_all', default=False, action='store_true',
+                                 help='Before building, kill all the processes of the machine named like the app or the unit tests, '
+                                      'not only the ones started by the builder')
+        self.parser.add_argument('--clean_outputs', '-xo', default=False, action='store_true',
+                                 help='Only delete the objects and outputs of the app, lib and tests targets before building, keeping the cmake cache')
         self.parser.add_argument('--verbose'    ,  '-v', default=False, action='store_true', help='run the command in verbose')
+        self.parser.add_argument('--jobs', '-j', default='auto', type=self.to_jobs, metavar='<auto|count>',
+                                 help='Number of parallel build jobs per configuration. auto (the default) chooses it from the usable cpus '
+                                      '(affinity, cgroup quota), the system load and the available memory')
+        self.parser.add_argument('--max_load', default=None, type=float, metavar='<load>',
+                                 help='Do not start new build jobs while the system load average is above <load> (makefile and ninja generators)')
+        self.parser.add_argument('--jobs_dry_run', default=False, action='store_true',
+                                 help='Print the chosen build jobs options and the reasons, without building')
+        self.parser.add_argument('--timings', default=False, action='store_true',
+                                 help='Measure the compile time of each object and the link time of each target, and report the slowest ones '
+                                      '(not supported by the msvc generators). The report is written to build/<config>/build_timings.json')
+        self.parser.add_argument('--profile', default=None, metavar='<file>',
+                                 help='Write the wall clock time of each builder step to <file> as chrome trace events, and a sorted summary to <file>.txt')
+
+    # options not stored in config files
+    def add_args_for_unit_tests_command(self):
+        self.add_args_for_config_command()
+        self.parser.add_argument('--config', '-c', default='release', type=str, metavar='<configuration>',
+                                 choices=config_choices, help='configuration of the unit tests to run in debug or release (default is release)')
+        self.parser.add_argument('--jobs', '-j', default=os.cpu_count() or 1, type=int, metavar='<count>',
+                                 help='Number of test processes running concurrently (default is the cpu count)')
+        self.parser.add_argument('--filter', '-f', default=None, metavar='<gtest-filter>', help='Only run the tests matching this gtest filter')
+        self.add_test_scheduling_options()
+        self.parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+
+    # options not stored in config files
+    def add_args_for_system_tests_command(self):
+        self.add_args_for_config_command()
+        self.parser.add_argument('--config', '-c', default='release', type=str, metavar='<configuration>',
+                                 choices=config_choices, help='configuration of the installed app to test in debug or release (default is release)')
+        self.parser.add_argument('--jobs', '-j', default=os.cpu_count() or 1, type=int, metavar='<count>',
+                                 help='Number of test cases running concurrently (default is the cpu count)')
+        self.parser.add_argument('--filter', '-f', default=None, metavar='<pattern>',
+                                 help='Only run the test cases whose name matches this shell pattern, for instance hello*')
+        self.parser.add_argument('--timeout', '-t', default=60, type=float, metavar='<seconds>',
+                                 help='The app is killed and the test case fails after this time (default is 60 seconds)')
+        # the cases always run from the slowest to the fastest according to the previous runs
+        self.add_last_failed_option()
+        self.parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
+
+    def add_last_failed_option(self):
+        self.parser.add_argument('--last_failed', '-lf', default=False, action='store_true',
+                                 help='Only run the tests that failed in the previous run (all tests if none failed)')
+
+    def add_test_scheduling_options(self):
+        self.add_last_failed_option()
+        self.parser.add_argument('--slowest_first', '-sf', default=False, action='store_true',
+                                 help='Run the tests one by one from the slowest to the fastest according to the previous runs, '
+                                      'instead of balancing batches of tests between the processes')
 
     def add_args_for_config_command(self, in_config_command=False):
         self.add_cmake_generator_option()
         self.add_app_name_option()
         self.add_lib_name_option()
         self.add_unit_tests_name_option()
+        self.add_compiler_cache_options()
+        self.add_dist_workers_option()
+        self.add_artifact_cache_options()
+        self.add_pch_and_unity_options()
+        self.add_deps_cache_option()
+        self.parser.add_argument('--config_profile', default=None, metavar='<profile>',
+                                 help=f'Use the values of the [<profile>] sections of the config files, for instance ci or dev '
+                                      f'(default is the {config_store.profile_env_var} environment variable). '
+                                      'With the config command, the options are written to this section')
         if in_config_command:
+            self.in_config_command = True
             # config specific option
             self.parser.add_argument('--clear', default=False, action='store_true', help='Shall we clear the existing file and keep only the provided options instead  of updating it?')
             self.parser.add_argument('--verbose', '-v', default=False, action='store_true', help='run the command in verbose')
@@ -137,12 +248,75 @@ class MyGenericParser:
     # options stored in config files
     def add_cmake_generator_option(self):
         name, short_name = '--generator', '-g'
-        generator_choices = ["msvc14", "msvc15", "makefile"]
+        generator_choices = ["msvc14", "msvc15", "makefile", "ninja"]
         generator_list = " ".join(generator_choices)
         self.parser.add_argument(name, short_name, metavar='<generator>',
-                                 help=f"CMake generator shortname among ({generator_list})")
+                                 help=f"CMake generator shortname among ({generator_list}). default is ninja if found in PATH, makefile otherwise, msvc15 on Windows")
         self.add_config_argument_name(name, short_name)
 
+    def add_compiler_cache_options(self):
+        name = '--compiler_cache'
+        self.parser.add_argument(name, metavar='<compiler-cache>',
+                                 help='Compiler cache used as compiler launcher among (none auto ccache sccache). '
+                                      'auto uses ccache or sccache if found in PATH. default is none')
+        self.add_config_argument_name(name)
+
+        name = '--compiler_cache_dir'
+        self.parser.add_argument(name, metavar='<dir>',
+                                 help='Directory of the compiler cache, relative to the workspace root or absolute. default is the compiler cache own default')
+        self.add_config_argument_name(name)
+
+    def add_dist_workers_option(self):
+        name = '--dist_workers'
+        self.parser.add_argument(name, metavar='<host:port,...>',
+                                 help='Distribute the compilations to these `builder worker` processes, '
+                                      'falling back to local compilations when they are not reachable')
+        self.add_config_argument_name(name)
+
+        name = '--dist_token'
+        self.parser.add_argument(name, metavar='<token>',
+                                 help='Shared secret of the `builder worker` processes (their --token), required by --dist_workers. '
+                                      'Better kept in builder-config.txt or the BUILDER_DIST_TOKEN environment variable than on the command line')
+        self.add_config_argument_name(name)
+
+    def add_artifact_cache_options(self):
+        name = '--artifact_cache_dir'
+        self.parser.add_argument(name, metavar='<dir>',
+                                 help='Enable the cache of build outputs shared between workspaces, stored in this directory '
+                                      '(relative to the workspace root or absolute)')
+        self.add_config_argument_name(name)
+
+        name = '--artifact_cache_size'
+        self.parser.add_argument(name, default=2048, type=int, metavar='<MiB>',
+                                 help='Size above which the least recently used outputs are evicted from the artifact cache. default is 2048')
+        self.add_config_argument_name(name)
+
+        name = '--artifact_cache_url'
+        self.parser.add_argument(name, metavar='<url>',
+                                 help='Also share the build outputs through this HTTP server, read with GET and written with PUT <url>/<key>.tar.gz')
+        self.add_config_argument_name(name)
+
+    def add_pch_and_unity_options(self):
+        name = '--pch'
+        self.parser.add_argument(name, nargs='?', const='auto', choices=['auto', 'none'], metavar='<auto|none>',
+                                 help='Precompile the external headers most included by the sources of each target (cmake 3.16+). '
+                                      'default is none, auto when given without value')
+        self.add_config_argument_name(name, const='auto')
+
+        name = '--unity'
+        self.parser.add_argument(name, nargs='?', const=8, type=int, metavar='<batch-size>',
+                                 help='Unity build: compile the sources of each target by batches of <batch-size> (cmake 3.16+). '
+                                      'default is 0 (disabled), 8 when given without value')
+        self.add_config_argument_name(name, const='8')
+
+    def add_deps_cache_option(self):
+        name = '--deps_cache_dir'
+        self.parser.add_argument(name, metavar='<dir|none>',
+                                 help='Directory of the dependencies (googletest) prebuilt once per toolchain and shared between workspaces, '
+                                      'relative to the workspace root or absolute. default is ~/.cache/builder/deps, '
+                                      'none lets cmake download googletest in each build directory')
+        self.add_config_argument_name(name)
+
     def add_app_name_option(self):
         name, short_name = '--app_name', '-a'
         self.parser.add_argument(name, short_name, metavar='<app-name>',
@@ -3,10 +3,11 @@
 # Disable E1101:Instance of 'URLError' has no 'headers|geturl' member'
 # pylint: disable=E1101
 
+import os
 import sys
+import functools
 from os.path import normpath, expanduser, expandvars, join
 from pathlib import Path
-import re
 
 ## generic utils
 
@@ -20,7 +21,33 @@ def make_path_absolute(base_absdir, path):
 def make_path_relative(base_absdir, abs_path):
     return str(Path(abs_path).relative_to(base_absdir))
 
+# the readers, maybe in a concurrent builder process, see the previous or the new content, never a partial file
+def write_text_atomically(path, text):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    Path(tmp_path).write_text(text)
+    os.replace(tmp_path, path)
+
+@functools.lru_cache(maxsize=None)
+def _cached_which(name, path_env):
+    import shutil
+    return shutil.which(name, path=path_env)
+
+# shutil.which cached per PATH value, the lookups are done once per process (or once per builder daemon)
+def which(name):
+    return _cached_which(name, os.environ.get('PATH'))
+
 #### builder specific utils
+
+# Extra tag printed after [builder], used to tell apart the outputs of concurrent builds
+output_tag = ''
+
+def set_output_tag(tag):
+    global output_tag
+    output_tag = f'[{tag}]' if tag else ''
+
+def get_output_prefix():
+    return f'[builder]{output_tag}'
+
 def blank_line():
     print(flush=True)
 
@@ -29,7 +56,10 @@ def builder_blank_line():
 
 def builder_print(*args, **kwargs):
     kwargs.setdefault('flush', True)
-    print('[builder]', *args, **kwargs)
+    # single write per call so that lines of concurrent builds don't get mixed
+    sep = kwargs.pop('sep', ' ')
+    end = kwargs.pop('end', '\n')
+    print(sep.join(str(a) for a in (get_output_prefix(),) + args) + end, end='', **kwargs)
 
 def builder_print_warning(*args, **kwargs):
     builder_print('[warning]', *args, **kwargs)
@@ -53,6 +83,7 @@ def builder_verbose_horizontal_separator(verbose, **kwargs):
         builder_print_horizontal_separator(**kwargs)
 
 def _join_quoted(cmd):
+    import re
     quoted = []
     for a in cmd:
         s = str(a)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import time
+import threading
+from collections import deque
+from . import my_utils
+from . import event_utils
+
+# Streaming of the output of a cmake process: a reader thread drains the pipe in large chunks, writes the full log
+# with buffered I/O and keeps the last lines in a ring buffer, shown when the command fails.
+# The main thread redraws the progress bar at most 10 times per second from the progress printed by make or ninja.
+
+read_chunk_size = 64 * 1024
+progress_redraw_interval = 0.1
+progress_bar_width = 40
+
+make_progress_regex = re.compile(rb'\[\s*(\d+)%\]')          # [ 42%] Building CXX object ...
+ninja_progress_regex = re.compile(rb'\[(\d+)/(\d+)\]')       # [12/40] Building CXX object ...
+
+# compiler diagnostics sent as events with --events
+gcc_diagnostic_regex = re.compile(       # src/lib/a.cpp:12:5: error: 'x' was not declared in this scope [-Wfoo]
+    rb'^((?:[A-Za-z]:)?[^:\n]+):(\d+):(?:(\d+):)? (fatal error|error|warning|note): (.*?)(?: \[(-W[^\]]+)\])?$')
+msvc_diagnostic_regex = re.compile(      # C:\src\lib\a.cpp(12,5): error C2065: 'x': undeclared identifier [project.vcxproj]
+    rb'^\s*(?:\d+>)?((?:[A-Za-z]:)?[^(:\n]+)\((\d+)(?:,(\d+))?\)\s*:\s*(fatal error|error|warning|note)\s+([A-Z]+\d+)\s*:\s*(.*?)(?: \[[^\]]+\])?$')
+
+def _decode(value):
+    return value.decode('utf-8', errors='replace') if value is not None else None
+
+# returns the fields of the diagnostic event of the line, or None
+def parse_diagnostic(line):
+    line = line.rstrip(b'\r')
+    match = gcc_diagnostic_regex.match(line)
+    if match:
+        path, line_number, column, severity, message, code = match.groups()
+    else:
+        match = msvc_diagnostic_regex.match(line)
+        if not match:
+            return None
+        path, line_number, column, severity, code, message = match.groups()
+    return {'file': _decode(path).strip(), 'line': int(line_number), 'column': int(column) if column else None,
+            'severity': _decode(severity), 'code': _decode(code), 'message': _decode(message)}
+
+class OutputPipeline:
+    def __init__(self, stream, log_path, is_verbose, tail_line_count=50):
+        self.stream = stream
+        self.log_path = log_path
+        self.is_verbose = is_verbose
+        self.tail = deque(maxlen=tail_line_count)
+        self.line_count = 0
+        self.progress = None # percentage, None until make or ninja prints one
+        self.diagnostic_count = 0
+        self.emit_diagnostics = event_utils.events.enabled
+        self._partial_line = b''
+        self._progress_text_length = 0
+        # when builds run concurrently, tag each line with the configuration instead of drawing the progress bar
+        self.tagged_prefix = f'{my_utils.get_output_prefix()} '.encode('utf-8') if my_utils.output_tag else None
+        self._thread = threading.Thread(target=self._read, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _update_progress(self, chunk):
+        percentages = make_progress_regex.findall(chunk)
+        if percentages:
+            self.progress = int(percentages[-1])
+            return
+        counts = ninja_progress_regex.findall(chunk)
+        if counts:
+            done, total = counts[-1]
+            self.progress = 100 * int(done) // max(1, int(total))
+
+    def _process_chunk(self, chunk, log_file):
+        log_file.write(chunk)
+        self._update_progress(chunk)
+
+        data = self._partial_line + chunk
+        lines = data.split(b'\n')
+        self._partial_line = lines.pop()
+        self.line_count += len(lines)
+        self.tail.extend(lines)
+        if self.emit_diagnostics:
+            self._emit_diagnostics(lines)
+
+        # complete lines only, the unfinished last line is written with the next chunk or at the end of the output
+        if self.is_verbose and lines:
+            if self.tagged_prefix is not None:
+                output = b''.join(self.tagged_prefix + line + b'\n' for line in lines)
+            else:
+                output = data[:len(data) - len(self._partial_line)]
+            sys.stdout.buffer.write(output)
+            sys.stdout.flush()
+
+    def _emit_diagnostics(self, lines):
+        for line in lines:
+            diagnostic = parse_diagnostic(line)
+            if diagnostic is not None:
+                self.diagnostic_count += 1
+                event_utils.emit('diagnostic', **diagnostic)
+
+    def _read(self):
+        fd = self.stream.fileno()
+        with open(self.log_path, 'wb', buffering=read_chunk_size) as log_file:
+            while True:
+                chunk = os.read(fd, read_chunk_size)
+                if not chunk:
+                    break
+                self._process_chunk(chunk, log_file)
+            if self._partial_line:
+                self.tail.append(self._partial_line)
+                if self.emit_diagnostics:
+                    self._emit_diagnostics([self._partial_line])
+                if self.is_verbose:
+                    sys.stdout.buffer.write((self.tagged_prefix or b'') + self._partial_line + b'\n')
+                    sys.stdout.flush()
+
+    def _draw_progress(self, start):
+        elapsed = time.perf_counter() - start
+        if self.progress is None:
+            text = f'{self.line_count} lines of output'
+        else:
+            done = progress_bar_width * self.progress // 100
+            text = f'[{"=" * done}{" " * (progress_bar_width - done)}] {self.progress:3d}%'
+        text = f'{my_utils.get_output_prefix()} {text} {elapsed:6.1f}s '
+        self._progress_text_length = len(text)
+        print(f'\r{text}', end='', flush=True)
+
+    # wait for the end of the output, drawing the progress bar
+    def wait(self, start):
+        draw_progress = not self.is_verbose and self.tagged_prefix is None and sys.stdout.isatty()
+        while self._thread.is_alive():
+            self._thread.join(progress_redraw_interval)
+            if draw_progress:
+                self._draw_progress(start)
+        if draw_progress:
+            # erase the progress bar before the next output
+            print('\r' + ' ' * self._progress_text_length + '\r', end='', flush=True)
+
+    def print_tail(self):
+        my_utils.builder_print(f'Last {len(self.tail)} lines of output (full log in {self.log_path}):')
+        sys.stdout.buffer.write(b''.join((self.tagged_prefix or b'') + line + b'\n' for line in self.tail))
+        sys.stdout.flush()
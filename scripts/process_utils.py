@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+from . import my_utils
+
+# Processes of the app and tests started by the builder are registered as build/pids/<pid> files,
+# so that the build only has to check them, instead of scanning all the processes of the machine.
+
+def get_pids_dir(build_root):
+    return my_utils.normalize_path(f'{build_root}/pids')
+
+def register_process(build_root, pid):
+    pids_dir = get_pids_dir(build_root)
+    os.makedirs(pids_dir, exist_ok=True)
+    open(f'{pids_dir}/{pid}', 'w').close()
+
+def unregister_process(build_root, pid):
+    try:
+        os.remove(f'{get_pids_dir(build_root)}/{pid}')
+    except FileNotFoundError:
+        pass
+
+def get_registered_pids(build_root):
+    try:
+        return [int(name) for name in os.listdir(get_pids_dir(build_root)) if name.isdigit()]
+    except FileNotFoundError:
+        return []
+
+# subprocess.run equivalent registering the process while it runs
+def run_registered(build_root, cmd, timeout=None, **kwargs):
+    process = subprocess.Popen(cmd, **kwargs)
+    register_process(build_root, process.pid)
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        unregister_process(build_root, process.pid)
+    return process.returncode
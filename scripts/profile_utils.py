@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from . import event_utils
+
+# Wall clock spans of the builder steps, written as chrome trace events (chrome://tracing, https://ui.perfetto.dev)
+# Times come from time.perf_counter, which is system wide, so spans recorded in worker processes can be merged.
+class Profiler:
+    def __init__(self):
+        self.spans = [] # (name, start, end, pid, tid)
+
+    def add_span(self, name, start, end):
+        self.spans.append((name, start, end, os.getpid(), threading.get_ident()))
+        event_utils.emit('step_end', name=name, duration=end - start)
+
+    @contextmanager
+    def span(self, name):
+        event_utils.emit('step_start', name=name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter())
+
+    # the python interpreter startup, from the process creation to the given perf_counter time
+    def add_interpreter_startup_span(self, end):
+        import psutil
+        elapsed_since_creation = time.time() - psutil.Process().create_time()
+        start = time.perf_counter() - elapsed_since_creation
+        self.add_span('python interpreter startup', start, end)
+
+    def write_trace(self, path):
+        origin = min((span[1] for span in self.spans), default=0)
+        events = []
+        for name, start, end, pid, tid in self.spans:
+            events.append({'name': name, 'cat': 'builder', 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': round((start - origin) * 1e6), 'dur': round((end - start) * 1e6)})
+        Path(path).write_text(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}))
+
+    def get_summary(self):
+        if not self.spans:
+            return 'No span recorded'
+        total = max(span[2] for span in self.spans) - min(span[1] for span in self.spans)
+        lines = [f'{"duration (s)":>12} {"% of total":>10}  step', f'{total:12.3f} {100:10.1f}  total']
+        for name, start, end, _, _ in sorted(self.spans, key=lambda span: span[1] - span[2]):
+            duration = end - start
+            lines.append(f'{duration:12.3f} {100 * duration / total if total else 0:10.1f}  {name}')
+        return '\n'.join(lines)
+
+    # write the trace to path and the text summary to path.txt
+    def write(self, path):
+        self.write_trace(path)
+        summary = self.get_summary()
+        Path(f'{path}.txt').write_text(summary + '\n')
+        return summary
+
+profiler = Profiler()
+
+#### startup profile
+
+# parses the `-X importtime` lines: (self us, cumulative us, depth, module)
+def parse_import_times(stderr):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return imports
+
+# runs the builder command in a child interpreter with -X importtime and reports where its startup time goes
+def report_startup_profile(workspace_root, command_argv, top_count=15):
+    import sys
+    import subprocess
+    from . import my_utils
+    cmd = [sys.executable, '-X', 'importtime', f'{workspace_root}/my_builder.py'] + command_argv
+    start = time.perf_counter()
+    result = subprocess.run(cmd, stderr=subprocess.PIPE, cwd=workspace_root, encoding='utf-8', errors='replace')
+    duration = time.perf_counter() - start
+    imports = parse_import_times(result.stderr)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            print(line, file=sys.stderr)
+
+    total_import_us = sum(self_us for self_us, _, _, _ in imports)
+    builder_us = sum(self_us for self_us, _, _, name in imports if name.startswith('scripts'))
+    my_utils.builder_print(f'startup profile of `builder {" ".join(command_argv)}`: {duration * 1000:.1f} ms wall time, '
+                           f'{len(imports)} modules imported in {total_import_us / 1000:.1f} ms '
+                           f'({builder_us / 1000:.1f} ms in the builder modules themselves)')
+    my_utils.builder_print(f'{"cumulative (ms)":>16} {"self (ms)":>10}  top level import')
+    top_level = sorted((entry for entry in imports if entry[2] == 0), key=lambda entry: -entry[1])
+    for self_us, cumulative_us, _, name in top_level[:top_count]:
+        my_utils.builder_print(f'{cumulative_us / 1000:16.1f} {self_us / 1000:10.1f}  {name}')
+    return result.returncode
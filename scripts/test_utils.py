@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import heapq
+import subprocess
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from . import my_utils
+from . import event_utils
+
+def set_test_directories(args):
+    args.build_root = my_utils.normalize_path(f'{args.workspace_root}/build')
+    args.build_dir = my_utils.normalize_path(f'{args.build_root}/{args.config}')
+    args.test_results_dir = my_utils.normalize_path(f'{args.build_dir}/test_results')
+
+#### test timings database
+# build/<config>/test_timings_<kind>.json keeps the duration and status of each test from the previous runs of the
+# unit-tests or system-tests: {"Suite.Test": {"duration": 0.25, "failed": false}}
+# One file per kind, as builder run runs the unit tests and system tests of a configuration concurrently.
+
+def get_test_timings_path(args, kind):
+    return my_utils.normalize_path(f'{args.build_dir}/test_timings_{kind}.json')
+
+def load_test_timings(args, kind):
+    try:
+        return json.loads(Path(get_test_timings_path(args, kind)).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+# results[test] = (duration, failed). Tests that did not run this time keep their previous timings.
+def save_test_timings(args, kind, results):
+    timings = load_test_timings(args, kind)
+    for test, (duration, failed) in results.items():
+        timings[test] = {'duration': duration, 'failed': failed}
+    my_utils.write_text_atomically(get_test_timings_path(args, kind), json.dumps(timings, indent=1, sort_keys=True))
+
+def get_last_failed_tests(timings, tests):
+    return [test for test in tests if timings.get(test, {}).get('failed')]
+
+def get_expected_durations(timings, tests):
+    known = [timings[test]['duration'] for test in tests if test in timings]
+    # tests never run before are expected to last as long as an average test
+    default_duration = sum(known) / len(known) if known else 1.0
+    return {test: timings[test]['duration'] if test in timings else default_duration for test in tests}
+
+def sort_slowest_first(tests, durations):
+    return sorted(tests, key=lambda test: durations[test], reverse=True)
+
+# longest processing time first: give each test, slowest first, to the least loaded worker
+def schedule_longest_first(tests, durations, worker_count):
+    bins = [(0.0, i, []) for i in range(min(worker_count, len(tests)))]
+    for test in sort_slowest_first(tests, durations):
+        load, i, bin_tests = heapq.heappop(bins)
+        bin_tests.append(test)
+        heapq.heappush(bins, (load + durations[test], i, bin_tests))
+    return [bin_tests for _, _, bin_tests in sorted(bins, key=lambda b: b[1])]
+
+def find_executable(args, name):
+    exe_name = f'{name}.exe' if sys.platform == 'win32' else name
+    # single configuration generators output in the build directory, msvc in a sub directory per configuration
+    for directory in [args.build_dir, f'{args.build_dir}/{args.config.capitalize()}']:
+        path = my_utils.normalize_path(f'{directory}/{exe_name}')
+        if os.path.isfile(path):
+            return path
+    return None
+
+# parse the output of --gtest_list_tests:
+# Suite.
+#   Test1
+#   Test2  # GetParam() = 2
+def list_gtest_tests(exe_path, gtest_filter=None):
+    cmd = [exe_path, '--gtest_list_tests']
+    if gtest_filter:
+        cmd.append(f'--gtest_filter={gtest_filter}')
+    output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True,
+                            encoding='utf-8', errors='surrogateescape').stdout
+    tests = []
+    suite = None
+    for line in output.splitlines():
+        line = line.split('#', 1)[0].rstrip()
+        if not line:
+            continue
+        if not line.startswith(' '):
+            suite = line.strip()
+        elif suite:
+            tests.append(f'{suite}{line.strip()}')
+    return tests
+
+def _to_int(element, name):
+    return int(element.get(name, '0') or '0')
+
+def _to_float(element, name):
+    return float(element.get(name, '0') or '0')
+
+# merge the <testsuites> of several gtest xml reports into a single one
+def merge_gtest_xml_reports(xml_paths, merged_path):
+    merged_root = ET.Element('testsuites', name='AllTests')
+    merged_suites = {}
+    for xml_path in xml_paths:
+        root = ET.parse(xml_path).getroot()
+        for suite in root.iter('testsuite'):
+            merged_suite = merged_suites.get(suite.get('name'))
+            if merged_suite is None:
+                merged_suite = ET.SubElement(merged_root, 'testsuite', name=suite.get('name'))
+                merged_suites[suite.get('name')] = merged_suite
+            merged_suite.extend(suite.findall('testcase'))
+
+    totals = {'tests': 0, 'failures': 0, 'disabled': 0, 'errors': 0}
+    total_time = 0.0
+    for suite in merged_root:
+        cases = suite.findall('testcase')
+        counts = {
+            'tests': len(cases),
+            'failures': sum(1 for case in cases if case.find('failure') is not None),
+            'disabled': sum(1 for case in cases if case.get('status') == 'notrun'),
+            'errors': sum(1 for case in cases if case.find('error') is not None),
+        }
+        suite_time = sum(_to_float(case, 'time') for case in cases)
+        for name, count in counts.items():
+            suite.set(name, str(count))
+            totals[name] += count
+        suite.set('time', f'{suite_time:.3f}')
+        total_time += suite_time
+
+    for name, count in totals.items():
+        merged_root.set(name, str(count))
+    merged_root.set('time', f'{total_time:.3f}')
+    ET.ElementTree(merged_root).write(merged_path, encoding='utf-8', xml_declaration=True)
+    return merged_root
+
+# cases: list of (name, duration, failure) where failure is None or (kind, message, details), kind is failure or error
+def write_junit_xml_report(suite_name, cases, report_path):
+    root = ET.Element('testsuites', name='AllTests')
+    suite = ET.SubElement(root, 'testsuite', name=suite_name)
+    for name, duration, failure in cases:
+        case = ET.SubElement(suite, 'testcase', name=name, classname=suite_name, time=f'{duration:.3f}')
+        if failure is not None:
+            kind, message, details = failure
+            ET.SubElement(case, kind, message=message).text = details
+    total_time = sum(duration for _, duration, _ in cases)
+    for element in (root, suite):
+        element.set('tests', str(len(cases)))
+        element.set('failures', str(sum(1 for _, _, failure in cases if failure and failure[0] == 'failure')))
+        element.set('errors', str(sum(1 for _, _, failure in cases if failure and failure[0] == 'error')))
+        element.set('disabled', '0')
+        element.set('time', f'{total_time:.3f}')
+    ET.ElementTree(root).write(report_path, encoding='utf-8', xml_declaration=True)
+    return root
+
+# results[test] = (duration, failed)
+def get_test_results(report_root):
+    results = {}
+    for suite in report_root.iter('testsuite'):
+        for case in suite.findall('testcase'):
+            if case.get('status') == 'notrun':
+                continue
+            failed = case.find('failure') is not None or case.find('error') is not None
+            results[f'{suite.get("name")}.{case.get("name")}'] = (_to_float(case, 'time'), failed)
+    return results
+
+def get_failed_test_cases(report_root):
+    failed = []
+    for suite in report_root.iter('testsuite'):
+        for case in suite.findall('testcase'):
+            failure = case.find('failure')
+            if failure is None:
+                failure = case.find('error')
+            if failure is not None:
+                failed.append((f'{suite.get("name")}.{case.get("name")}', failure.get('message', '')))
+    return failed
+
+# one test_result event per test case of the report, kind is unit-tests or system-tests
+def emit_test_result_events(kind, report_root):
+    if not event_utils.events.enabled:
+        return
+    for suite in report_root.iter('testsuite'):
+        for case in suite.findall('testcase'):
+            failure = case.find('failure')
+            if failure is None:
+                failure = case.find('error')
+            status = 'disabled' if case.get('status') == 'notrun' else 'passed' if failure is None else 'failed'
+            event_utils.emit('test_result', kind=kind, name=f'{suite.get("name")}.{case.get("name")}', status=status,
+                             duration=_to_float(case, 'time'), message=failure.get('message', '') if failure is not None else None)
+
+# line_count None prints the whole log
+def print_log_tail(log_path, line_count=30):
+    lines = Path(log_path).read_text(encoding='utf-8', errors='surrogateescape').splitlines()
+    for line in lines[-line_count:] if line_count else lines:
+        print(line)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# Compile/link launcher injected by `builder build --timings` through the RULE_LAUNCH_COMPILE and RULE_LAUNCH_LINK cmake properties.
+# usage: timing_launcher.py <log-file> <compile|link> <command...>
+# Runs the command and appends its wall time to <log-file> as a json line. Standalone: it does not import the builder.
+
+import sys
+import json
+import time
+import subprocess
+
+def get_output(cmd):
+    for i, arg in enumerate(cmd):
+        if arg == '-o' and i + 1 < len(cmd):
+            return cmd[i + 1]
+        if arg.startswith('/Fo') or arg.startswith('-Fo'):
+            return arg[3:]
+    # archivers (ar qc libx.a ..., ranlib libx.a) have no output option
+    for arg in cmd[1:]:
+        if arg.endswith(('.a', '.lib', '.so', '.dylib')):
+            return arg
+    return None
+
+def get_source(cmd):
+    for i, arg in enumerate(cmd):
+        if arg in ('-c', '/c') and i + 1 < len(cmd) and not cmd[i + 1].startswith('-'):
+            return cmd[i + 1]
+    return None
+
+def main(argv):
+    log_path, kind, cmd = argv[1], argv[2], argv[3:]
+    # the duration comes from the monotonic perf_counter, unaffected by system clock changes
+    start = time.time()
+    start_counter = time.perf_counter()
+    returncode = subprocess.call(cmd)
+    duration = time.perf_counter() - start_counter
+
+    record = {'kind': kind, 'output': get_output(cmd), 'source': get_source(cmd) if kind == 'compile' else None,
+              'start': start, 'duration': duration, 'returncode': returncode}
+    # one write of a whole line in append mode, concurrent jobs don't mix their records
+    with open(log_path, 'a') as log_file:
+        log_file.write(json.dumps(record) + '\n')
+    return returncode
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the builder scripts are imported as the `scripts` package of the workspace, like my_builder.py does
+workspace_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if workspace_root not in sys.path:
+    sys.path.insert(0, workspace_root)
@@ -0,0 +1,94 @@
+import json
+import os
+from argparse import Namespace
+import pytest
+from scripts import artifact_cache
+
+get_toolchain_version = artifact_cache.get_toolchain_version
+
+
+@pytest.fixture(autouse=True)
+def fixed_toolchain(monkeypatch):
+    monkeypatch.setattr(artifact_cache, 'get_toolchain_version', lambda args: 'cmake 3.25\0c++ 12')
+
+
+def make_workspace(root, source='int main() { return 0; }\n'):
+    os.makedirs(f'{root}/src/app')
+    os.makedirs(f'{root}/scripts/cmake')
+    with open(f'{root}/CMakeLists.txt', 'w') as f:
+        f.write('project(x)\n')
+    with open(f'{root}/src/app/main.cpp', 'w') as f:
+        f.write(source)
+    return Namespace(workspace_root=str(root))
+
+
+def test_compute_key_is_shared_between_workspaces(tmp_path):
+    first = make_workspace(tmp_path / 'first')
+    second = make_workspace(tmp_path / 'second')
+    settings = 'set(CMAKE_INSTALL_PREFIX "{}" CACHE STRING "" FORCE)\n'
+    first_key = artifact_cache.compute_key(first, settings.format((tmp_path / 'first').as_posix()))
+    assert first_key == artifact_cache.compute_key(second, settings.format((tmp_path / 'second').as_posix()))
+    assert first_key != artifact_cache.compute_key(first, settings.format('/other'))
+
+
+def test_compute_key_changes_with_the_sources(tmp_path):
+    args = make_workspace(tmp_path)
+    key = artifact_cache.compute_key(args, '')
+    (tmp_path / 'src/app/main.cpp').write_text('int main() { return 1; }\n')
+    assert artifact_cache.compute_key(args, '') != key
+    (tmp_path / 'src/app/main.cpp').write_text('int main() { return 0; }\n')
+    assert artifact_cache.compute_key(args, '') == key
+
+
+def make_entry(entry_dir, files):
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(f'{entry_dir}/files/{path}'), exist_ok=True)
+        with open(f'{entry_dir}/files/{path}', 'w') as f:
+            f.write(content)
+    with open(f'{entry_dir}/{artifact_cache.manifest_name}', 'w') as f:
+        json.dump({'files': list(files), 'size': 0}, f)
+
+
+def test_restore_entry(tmp_path):
+    args = make_workspace(tmp_path / 'workspace')
+    make_entry(tmp_path / 'entry', {'bin/debug/my_app': 'app', 'lib/debug/libmy_lib.a': 'lib'})
+    files, restored_bytes = artifact_cache._restore_entry(args, str(tmp_path / 'entry'))
+    assert files == ['bin/debug/my_app', 'lib/debug/libmy_lib.a']
+    assert restored_bytes == 6
+    assert (tmp_path / 'workspace/bin/debug/my_app').read_text() == 'app'
+
+    args.config = 'debug'
+    args.build_dir = str(tmp_path / 'workspace/build/debug')
+    artifact_cache._restore_build_dir_executables(args, files)
+    assert (tmp_path / 'workspace/build/debug/my_app').read_text() == 'app'
+    assert not (tmp_path / 'workspace/build/debug/libmy_lib.a').exists()
+
+
+@pytest.mark.parametrize('path', ['../outside', 'bin/../../outside', '/tmp/outside', '.'])
+def test_restore_entry_rejects_paths_out_of_the_workspace(tmp_path, path):
+    args = make_workspace(tmp_path / 'workspace')
+    make_entry(tmp_path / 'entry', {'bin/debug/my_app': 'app'})
+    manifest_path = tmp_path / 'entry' / artifact_cache.manifest_name
+    manifest_path.write_text(json.dumps({'files': ['bin/debug/my_app', path], 'size': 0}))
+    with pytest.raises(ValueError):
+        artifact_cache._restore_entry(args, str(tmp_path / 'entry'))
+    # nothing is restored from an invalid entry
+    assert not (tmp_path / 'workspace/bin').exists()
+    assert not (tmp_path / 'outside').exists()
+
+
+def test_toolchain_version_is_probed_once_per_toolchain(tmp_path, monkeypatch):
+    cmake_path, compiler = tmp_path / 'cmake', tmp_path / 'c++'
+    cmake_path.write_text('cmake')
+    compiler.write_text('c++')
+    monkeypatch.setenv('CXX', str(compiler))
+    probes = []
+    monkeypatch.setattr(artifact_cache, '_get_version', lambda cmd: probes.append(cmd[0]) or f'{os.path.basename(cmd[0])} 1.0')
+    args = Namespace(cmake_path=str(cmake_path), build_root=str(tmp_path))
+    version = get_toolchain_version(args)
+    assert get_toolchain_version(args) == version
+    assert len(probes) == 2
+
+    compiler.write_text('upgraded c++')
+    assert get_toolchain_version(args) == version
+    assert len(probes) == 4
@@ -0,0 +1,67 @@
+from argparse import Namespace
+from scripts import builder_build
+
+
+def write_cmake_cache(build_root, config, generator):
+    build_dir = build_root / config
+    build_dir.mkdir(parents=True)
+    (build_dir / 'CMakeCache.txt').write_text(f'CMAKE_BUILD_TYPE:STRING=Debug\nCMAKE_GENERATOR:INTERNAL={generator}\n')
+
+
+def test_recorded_generator_of_an_existing_build_directory(tmp_path):
+    write_cmake_cache(tmp_path, 'release', 'Unix Makefiles')
+    args = Namespace(build_root=str(tmp_path), config=['debug', 'release'], clean=False)
+    assert builder_build.get_recorded_generator(args) == 'makefile'
+
+
+def test_no_recorded_generator_for_new_or_cleaned_build_directories(tmp_path):
+    args = Namespace(build_root=str(tmp_path), config=['debug'], clean=False)
+    assert builder_build.get_recorded_generator(args) is None
+    write_cmake_cache(tmp_path, 'debug', 'Ninja')
+    assert builder_build.get_recorded_generator(args) == 'ninja'
+    args.clean = True
+    assert builder_build.get_recorded_generator(args) is None
+
+
+def test_jobs_dry_run_does_not_kill_processes(monkeypatch):
+    killed = []
+    monkeypatch.setattr(builder_build, 'kill_registered_processes', killed.append)
+    monkeypatch.setattr(builder_build, 'kill_all_processes', killed.append)
+    args = Namespace(jobs_dry_run=True, no_build=False, clean=False, kill_all=False)
+    assert builder_build.kill_processed_if_needed(args) == 0
+    assert killed == []
+    args.jobs_dry_run = False
+    assert builder_build.kill_processed_if_needed(args) == 0
+    assert killed == [args]
+
+
+def start_registered_copy(build_root, directory):
+    import shutil
+    import subprocess
+    from scripts import process_utils
+    directory.mkdir(parents=True)
+    exe = directory / 'my_tests'
+    shutil.copy2(shutil.which('sleep'), exe)
+    process = subprocess.Popen([str(exe), '30'])
+    process_utils.register_process(str(build_root), process.pid)
+    return process
+
+
+def test_kill_registered_processes_of_the_built_configurations_only(tmp_path):
+    from scripts import process_utils
+    build_root = tmp_path / 'build'
+    processes = [start_registered_copy(build_root, build_root / 'debug'),
+                 start_registered_copy(build_root, tmp_path / 'bin' / 'debug'),
+                 start_registered_copy(build_root, build_root / 'release')]
+    try:
+        args = Namespace(workspace_root=str(tmp_path), build_root=str(build_root), config=['debug'],
+                         app_name='my_app', unit_tests_name='my_tests')
+        builder_build.kill_registered_processes(args)
+        assert processes[0].wait(10) != 0
+        assert processes[1].wait(10) != 0
+        assert processes[2].poll() is None
+        assert process_utils.get_registered_pids(str(build_root)) == [processes[2].pid]
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import pytest
+from conftest import workspace_root
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork') or shutil.which('cmake') is None,
+                                reason='the daemon needs unix sockets, fork and cmake')
+
+
+def make_workspace(path):
+    shutil.copy2(f'{workspace_root}/my_builder.py', path)
+    shutil.copytree(f'{workspace_root}/scripts', path / 'scripts', ignore=shutil.ignore_patterns('__pycache__'))
+    (path / 'CMakeLists.txt').write_text('cmake_minimum_required(VERSION 3.8)\nmessage(FATAL_ERROR "broken project")\n')
+
+
+def run_builder(workspace, *argv):
+    return subprocess.run([sys.executable, 'my_builder.py'] + list(argv), cwd=workspace, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, encoding='utf-8', timeout=120)
+
+
+def test_failing_build_through_the_daemon_returns_an_error(tmp_path):
+    make_workspace(tmp_path)
+    daemon = subprocess.Popen([sys.executable, 'my_builder.py', 'daemon'], cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    try:
+        socket_path = tmp_path / 'build' / 'builder-daemon.sock'
+        deadline = time.monotonic() + 30
+        while not socket_path.exists():
+            assert daemon.poll() is None and time.monotonic() < deadline, 'the daemon did not start'
+            time.sleep(0.1)
+
+        for _ in range(2): # the second command runs after the daemon reaped the first one
+            result = run_builder(tmp_path, 'build', '--config', 'debug', '--deps_cache_dir', 'none')
+            assert 'broken project' in result.stdout
+            assert result.returncode != 0
+    finally:
+        run_builder(tmp_path, 'daemon', '--stop')
+        try:
+            daemon.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            daemon.kill()
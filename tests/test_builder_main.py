@@ -0,0 +1,32 @@
+import subprocess
+import sys
+import pytest
+from conftest import workspace_root
+
+# modules of the build commands, which `builder help` and `builder config` must not pay for at startup
+build_modules = ['scripts.builder_build', 'scripts.cmake_utils', 'scripts.job_policy', 'scripts.artifact_cache', 'psutil']
+
+list_imported_build_modules = f'''
+import sys
+sys.path.insert(0, {workspace_root!r})
+from scripts import builder_main
+try:
+    builder_main.main({workspace_root!r}, ['my_builder.py'] + sys.argv[1:])
+except SystemExit:
+    pass
+print(','.join(name for name in {build_modules!r} if name in sys.modules), file=sys.stderr)
+'''
+
+
+# each command runs in a new interpreter, the modules imported by the other tests don't count
+@pytest.mark.parametrize('argv', [['help'], ['config', '--help']])
+def test_cold_start_does_not_import_the_build_modules(argv):
+    result = subprocess.run([sys.executable, '-c', list_imported_build_modules] + argv, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, encoding='utf-8', cwd=workspace_root, timeout=60)
+    assert result.stderr.splitlines()[-1:] == [''], result.stderr
+
+
+def test_commands_are_imported_when_they_run():
+    from scripts import builder_main
+    for command, module in builder_main.command_modules.items():
+        assert builder_main.import_command_module(command).__name__ == f'scripts.{module}'
@@ -0,0 +1,44 @@
+from scripts import builder_run
+
+
+def make_steps(*commands):
+    steps = []
+    for command in commands:
+        argv = builder_run.to_argv(command)
+        steps.append(builder_run.Step(builder_run.get_step_name(argv, [step.name for step in steps]), argv))
+    builder_run.infer_needs(steps)
+    return steps
+
+
+def test_infer_needs_of_builds_and_tests():
+    steps = make_steps('build --config debug,release', 'unit-tests --config debug', 'system-tests --config release',
+                       'build --config debug')
+    needs = {step.name: step.needs for step in steps}
+    assert needs == {
+        'build-debug-release': [],
+        'unit-tests-debug': ['build-debug-release'],
+        'system-tests-release': ['build-debug-release'],
+        'build-debug': ['build-debug-release', 'unit-tests-debug'],
+    }
+    assert builder_run.check_graph(steps) is None
+
+
+def test_infer_needs_of_other_commands():
+    steps = make_steps('build --config debug', 'config --set generator=ninja', 'build --config release')
+    assert [step.needs for step in steps] == [[], ['build-debug'], ['config-release']]
+
+
+def test_explicit_needs_are_kept():
+    steps = [builder_run.Step('a', ['build']), builder_run.Step('b', ['build'], needs=[])]
+    builder_run.infer_needs(steps)
+    assert steps[1].needs == []
+    assert steps[0].needs == []
+
+
+def test_concurrent_builds_share_the_jobs():
+    steps = make_steps('build --config debug', 'build --config release', 'unit-tests --config debug',
+                       'build --config debug')
+    builder_run.set_concurrent_builds(steps, 4)
+    assert [step.concurrent_builds for step in steps] == [2, 2, 1, 2]
+    builder_run.set_concurrent_builds(steps, 1)
+    assert [step.concurrent_builds for step in steps] == [1, 1, 1, 1]
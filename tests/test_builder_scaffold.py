@@ -0,0 +1,36 @@
+import os
+from scripts import builder_scaffold
+
+
+def make_workspace(root):
+    (root / 'src').mkdir(parents=True)
+    (root / 'src' / 'main.cpp').write_text('int main() { return 0; }\n')
+    (root / '.git').mkdir()
+    return root
+
+
+def test_refuses_outputs_containing_the_workspace(tmp_path):
+    workspace_root = make_workspace(tmp_path / 'workspace')
+    for output in [workspace_root, workspace_root / '..', tmp_path]:
+        assert 'contains the workspace' in builder_scaffold.copy_workspace(str(workspace_root), str(output))
+    assert (workspace_root / '.git').is_dir()
+    assert (workspace_root / 'src' / 'main.cpp').is_file()
+
+
+def test_refuses_directories_not_generated_by_scaffold(tmp_path):
+    workspace_root = make_workspace(tmp_path / 'workspace')
+    output = tmp_path / 'output'
+    output.mkdir()
+    (output / 'notes.txt').write_text('keep me\n')
+    assert 'not generated by builder scaffold' in builder_scaffold.copy_workspace(str(workspace_root), str(output))
+    assert (output / 'notes.txt').is_file()
+
+
+def test_replaces_a_generated_workspace(tmp_path):
+    workspace_root = make_workspace(tmp_path / 'workspace')
+    output = workspace_root / 'build' / 'scaffold'
+    assert builder_scaffold.copy_workspace(str(workspace_root), str(output)) is None
+    (output / 'src' / 'stale.cpp').write_text('\n')
+    assert builder_scaffold.copy_workspace(str(workspace_root), str(output)) is None
+    assert sorted(os.listdir(output / 'src')) == ['main.cpp']
+    assert (output / builder_scaffold.marker_name).is_file()
@@ -0,0 +1,21 @@
+from scripts import builder_unit_tests
+
+
+def test_split_long_batches_keeps_filters_short():
+    tests = [f'Suite.Test{i}' for i in range(100)]
+    batches = builder_unit_tests.split_long_batches([tests, ['Other.Test']], 100)
+    assert [test for batch in batches for test in batch] == tests + ['Other.Test']
+    assert all(len(':'.join(batch)) <= 100 for batch in batches)
+    assert batches[-1] == ['Other.Test']
+
+
+def test_split_long_batches_keeps_a_test_longer_than_the_limit():
+    assert builder_unit_tests.split_long_batches([['A' * 50, 'B.b']], 10) == [['A' * 50], ['B.b']]
+
+
+def test_crashed_batches_tests_are_recorded_as_failed():
+    results = {'A.a': (0.5, False)}
+    crashed_batches = [{'tests': ['A.a', 'A.b', 'A.c']}]
+    timings = {'A.b': {'duration': 2.0, 'failed': False}}
+    results = builder_unit_tests.add_crashed_batches_results(results, crashed_batches, timings)
+    assert results == {'A.a': (0.5, False), 'A.b': (2.0, True), 'A.c': (0.0, True)}
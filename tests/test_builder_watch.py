@@ -0,0 +1,54 @@
+import os
+import sys
+import pytest
+from scripts import builder_watch
+
+
+def get_stages(tmp_path, old, new):
+    root = str(tmp_path)
+    return builder_watch.get_needed_stages(root, {f'{root}/{path}': value for path, value in old.items()},
+                                           {f'{root}/{path}': value for path, value in new.items()})
+
+
+def test_source_edits_only_build(tmp_path):
+    assert get_stages(tmp_path, {'src/lib/a.cpp': (1, 1)}, {'src/lib/a.cpp': (2, 1)}) == {'build'}
+    assert get_stages(tmp_path, {'src/tests/t.cpp': (1, 1)}, {'src/tests/t.cpp': (2, 1)}) == {'build', 'unit-tests'}
+
+
+def test_added_sources_and_cmake_inputs_generate(tmp_path):
+    assert get_stages(tmp_path, {}, {'src/lib/b.cpp': (1, 1)}) == {'generate', 'build'}
+    assert get_stages(tmp_path, {'src/lib/b.h': (1, 1)}, {}) == {'generate', 'build'}
+    assert get_stages(tmp_path, {'CMakeLists.txt': (1, 1)}, {'CMakeLists.txt': (2, 1)}) == {'generate', 'build'}
+    assert get_stages(tmp_path, {'scripts/cmake/gtest.cmake': (1, 1)}, {'scripts/cmake/gtest.cmake': (2, 1)}) == {'generate', 'build'}
+    assert get_stages(tmp_path, {}, {'builder-config.txt': (1, 1)}) == {'generate', 'build'}
+
+
+def test_editor_files_are_ignored(tmp_path):
+    editor_files = ['src/lib/.a.cpp.swp', 'src/lib/a.cpp~', 'src/lib/.#a.cpp', 'src/lib/#a.cpp#', 'src/lib/4913']
+    assert get_stages(tmp_path, {}, {path: (1, 1) for path in editor_files}) == set()
+    assert get_stages(tmp_path, {'src/lib/README.md': (1, 1)}, {'src/lib/README.md': (2, 1)}) == set()
+
+
+def test_user_config_directory_is_watched(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    workspace_root = str(tmp_path / 'workspace')
+    os.makedirs(workspace_root)
+    os.makedirs(tmp_path / 'home' / '.config')
+    assert builder_watch.get_watched_directories(workspace_root)[-1] == str(tmp_path / 'home' / '.config')
+    os.makedirs(tmp_path / 'home' / '.config' / 'builder')
+    assert builder_watch.get_watched_directories(workspace_root)[-1] == str(tmp_path / 'home' / '.config' / 'builder')
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only used on Linux')
+def test_inotify_watcher_sees_user_config_edits(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    user_config_path = tmp_path / 'home' / '.config' / 'builder' / 'builder-config.txt'
+    os.makedirs(user_config_path.parent)
+    os.makedirs(tmp_path / 'workspace')
+    watcher = builder_watch.InotifyWatcher(str(tmp_path / 'workspace'))
+    try:
+        assert not watcher.wait_for_change(0)
+        user_config_path.write_text('jobs 4\n')
+        assert watcher.wait_for_change(5)
+    finally:
+        watcher.close()
@@ -0,0 +1,66 @@
+import shutil
+import threading
+import pytest
+from scripts import builder_worker
+from scripts import dist_utils
+
+token = 'secret-token'
+source = b'int answer(void) { return 42; }\n'
+
+
+@pytest.fixture
+def worker():
+    compilers = builder_worker.get_allowed_compilers('cc,gcc,clang')
+    if not compilers:
+        pytest.skip('no C compiler in PATH')
+    server = builder_worker.WorkerServer(('127.0.0.1', 0), builder_worker.CompileRequestHandler)
+    server.state = builder_worker.WorkerState(2, token, compilers)
+    server.verbose = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address, sorted(compilers)[0]
+    server.shutdown()
+    server.server_close()
+
+
+def compile_request(worker_address, **fields):
+    header = dict({'type': 'compile', 'token': token, 'args': ['-O2', '-g', '-Wall'], 'language': 'cpp-output',
+                   'source': 'answer.c'}, **fields)
+    return dist_utils.request(worker_address, header, source, timeout=60)
+
+
+def test_compiles_with_the_token(worker):
+    worker_address, compiler = worker
+    reply, object_data = compile_request(worker_address, compiler=f'/usr/local/any/{compiler}')
+    assert reply['returncode'] == 0, reply['stderr']
+    assert object_data
+    assert dist_utils.get_workers_status([worker_address], token)[worker_address]['jobs'] == 2
+
+
+def test_rejects_requests_without_the_token(worker):
+    worker_address, compiler = worker
+    reply, object_data = compile_request(worker_address, compiler=compiler, token='wrong')
+    assert reply['rejected'] and not object_data
+    assert dist_utils.get_workers_status([worker_address], 'wrong') == {}
+
+
+def test_rejects_compilers_out_of_the_allowlist(worker):
+    worker_address, _ = worker
+    reply, _ = compile_request(worker_address, compiler='/tmp/evil-script')
+    assert reply['rejected']
+    assert 'not allowed' in reply['stderr']
+
+
+@pytest.mark.parametrize('arg', ['-o', '-B/tmp', '-fplugin=evil', '-fplugin', '-Wa,-a=/tmp/listing', '@/tmp/args',
+                                 '-specs=/tmp/specs', '-fprofile-generate', '-isysroot'])
+def test_rejects_unsafe_compile_flags(worker, arg):
+    worker_address, compiler = worker
+    reply, _ = compile_request(worker_address, compiler=compiler, args=['-O2', arg])
+    assert reply['rejected']
+
+
+def test_safe_compile_flags():
+    for arg in ['-O2', '-g', '-std=c++17', '-Wall', '-Werror', '-fPIC', '-fvisibility=hidden', '-m64', '-pthread', '-w']:
+        assert dist_utils.is_safe_compile_arg(arg), arg
+    for arg in ['-o', '-c', '-x', '-fdebug-prefix-map=/a=/b', '-Wl,-rpath', '-B', '--sysroot=/tmp']:
+        assert not dist_utils.is_safe_compile_arg(arg), arg
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from scripts import clean_utils
+
+
+def get_dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def make_tree(path):
+    os.makedirs(f'{path}/sub/dir')
+    for name in ['a.o', 'sub/b.o', 'sub/dir/c.o']:
+        with open(f'{path}/{name}', 'w') as f:
+            f.write(name)
+
+
+def test_delete_in_background_only_collects_the_trash_of_dead_processes(tmp_path):
+    build_root = str(tmp_path)
+    dead_trash = clean_utils.get_trash_dir(build_root, get_dead_pid())
+    live_trash = clean_utils.get_trash_dir(build_root, os.getppid())
+    make_tree(f'{dead_trash}/debug-1')
+    make_tree(f'{live_trash}/release-1')
+    make_tree(f'{build_root}/debug')
+
+    assert clean_utils.delete_in_background(build_root, f'{build_root}/debug')
+    clean_utils.wait_for_background_deletions(build_root)
+
+    assert not os.path.exists(f'{build_root}/debug')
+    assert not os.path.exists(dead_trash)
+    assert not os.path.exists(clean_utils.get_trash_dir(build_root))
+    # the directory being deleted by another running builder is left alone
+    assert os.path.exists(f'{live_trash}/release-1/sub/dir/c.o')
@@ -0,0 +1,32 @@
+import json
+from argparse import Namespace
+from scripts import compile_modes
+
+
+def make_args(tmp_path, config='release', **options):
+    build_dir = tmp_path / config
+    build_dir.mkdir(parents=True, exist_ok=True)
+    values = dict(build_root=str(tmp_path), build_dir=str(build_dir), config=config, clean=False, clean_outputs=False,
+                  rebuild=False, pch='none', unity=0)
+    values.update(options)
+    return Namespace(**values)
+
+
+def test_full_builds(tmp_path):
+    args = make_args(tmp_path)
+    assert compile_modes.is_full_build(args)
+    (tmp_path / 'release' / 'CMakeCache.txt').write_text('')
+    assert not compile_modes.is_full_build(args)
+    args.rebuild = True
+    assert not compile_modes.is_full_build(args)
+    args.clean = True
+    assert compile_modes.is_full_build(args)
+
+
+def test_durations_are_recorded_per_configuration(tmp_path, capsys):
+    compile_modes.record_full_build(make_args(tmp_path, 'debug'), 10.0)
+    compile_modes.record_full_build(make_args(tmp_path, 'release'), 8.0)
+    compile_modes.record_full_build(make_args(tmp_path, 'release', pch='auto'), 6.0)
+    assert json.loads((tmp_path / 'compile_modes_debug.json').read_text()) == {'normal': 10.0}
+    assert json.loads((tmp_path / 'compile_modes_release.json').read_text()) == {'normal': 8.0, 'pch': 6.0}
+    assert 'pch full build: 6.00 seconds, normal full build: 8.00 seconds (-25.0%)' in capsys.readouterr().out
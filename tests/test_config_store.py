@@ -0,0 +1,17 @@
+import os
+from scripts import config_store
+
+
+def test_snapshot_is_only_written_in_an_existing_build_directory(tmp_path):
+    config_path = tmp_path / 'builder-config.txt'
+    config_path.write_text('jobs 4\n')
+    snapshot_path = config_store.get_snapshot_path(str(tmp_path))
+    config_store.snapshot_cache.clear()
+    assert config_store.read_config_sections(str(tmp_path), [str(config_path)]) == [{'': ['jobs', '4']}]
+    assert not os.path.exists(tmp_path / 'build')
+
+    os.makedirs(tmp_path / 'build')
+    config_store.snapshot_cache.clear()
+    config_path.write_text('jobs 2\n')
+    assert config_store.read_config_sections(str(tmp_path), [str(config_path)]) == [{'': ['jobs', '2']}]
+    assert str(config_path) in config_store.load_snapshot(snapshot_path)
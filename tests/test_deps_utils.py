@@ -0,0 +1,81 @@
+import io
+import os
+import tarfile
+import pytest
+from argparse import Namespace
+from scripts import deps_utils
+
+
+def make_dependency(version='1.12.1'):
+    return dict(deps_utils.googletest, vendored_dirs=[], version=version)
+
+
+def make_sources(directory, version='1.12.1'):
+    (directory / 'src').mkdir(parents=True)
+    (directory / 'CMakeLists.txt').write_text(f'set(GOOGLETEST_VERSION {version})\n')
+    (directory / 'src' / 'gtest.cc').write_text('int x;\n')
+    return directory
+
+
+def test_tree_hash_depends_on_paths_and_content_only(tmp_path):
+    first = make_sources(tmp_path / 'first')
+    second = make_sources(tmp_path / 'second')
+    (second / '.git').mkdir()
+    (second / '.git' / 'HEAD').write_text('ref: refs/heads/main\n')
+    assert deps_utils.compute_tree_hash(str(first)) == deps_utils.compute_tree_hash(str(second))
+    (second / 'src' / 'gtest.cc').write_text('int y;\n')
+    assert deps_utils.compute_tree_hash(str(first)) != deps_utils.compute_tree_hash(str(second))
+    os.rename(first / 'src' / 'gtest.cc', first / 'src' / 'gtest-all.cc')
+    assert deps_utils.compute_tree_hash(str(first)) != deps_utils.compute_tree_hash(str(make_sources(tmp_path / 'third')))
+
+
+def test_verify_cache(tmp_path):
+    args = Namespace(workspace_root=str(tmp_path), deps_cache_dir=str(tmp_path / 'cache'))
+    dependency = make_dependency()
+    assert deps_utils.verify_cache(args, dependency) == [f'googletest 1.12.1 sources are not in {tmp_path}/cache']
+
+    sources_dir = deps_utils.fetch_sources(args, dependency, source=str(make_sources(tmp_path / 'vendored')))
+    assert sources_dir is not None
+    assert deps_utils.verify_cache(args, dependency) == []
+
+    build_dir = f'{deps_utils.get_cache_dir(args)}/builds/{os.path.basename(sources_dir)}-toolchain-release'
+    os.makedirs(f'{build_dir}/lib')
+    assert deps_utils.verify_cache(args, dependency) == [f'{build_dir} has no gtest library']
+    open(f'{build_dir}/lib/libgtest.a', 'w').close()
+    with open(f'{sources_dir}/src/gtest.cc', 'a') as sources_file:
+        sources_file.write('// modified\n')
+    assert deps_utils.verify_cache(args, dependency) == [f'{sources_dir} content does not match its hash']
+
+
+def write_archive(path, members):
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+
+
+def test_fetch_sources_from_an_archive(tmp_path):
+    args = Namespace(workspace_root=str(tmp_path), deps_cache_dir=str(tmp_path / 'cache'))
+    archive_path = tmp_path / 'googletest.tar.gz'
+    write_archive(archive_path, [('googletest-release-1.12.1/CMakeLists.txt', b'set(GOOGLETEST_VERSION 1.12.1)\n')])
+    sources_dir = deps_utils.fetch_sources(args, make_dependency(), source=str(archive_path))
+    assert os.path.isfile(f'{sources_dir}/CMakeLists.txt')
+
+
+@pytest.mark.parametrize('has_data_filter', [True, False])
+def test_fetch_sources_rejects_archive_members_outside_of_the_destination(tmp_path, monkeypatch, has_data_filter):
+    if not has_data_filter:
+        monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    args = Namespace(workspace_root=str(tmp_path), deps_cache_dir=str(tmp_path / 'cache'))
+    archive_path = tmp_path / 'googletest.tar.gz'
+    write_archive(archive_path, [('googletest-release-1.12.1/CMakeLists.txt', b'set(GOOGLETEST_VERSION 1.12.1)\n'),
+                                 ('../../escaped.txt', b'escaped\n')])
+    assert deps_utils.fetch_sources(args, make_dependency(), source=str(archive_path)) is None
+    assert not any(path.name == 'escaped.txt' for path in tmp_path.rglob('*'))
+
+
+def test_fetch_sources_without_candidates_and_downloads_does_nothing(tmp_path):
+    args = Namespace(workspace_root=str(tmp_path), deps_cache_dir=str(tmp_path / 'cache'))
+    assert deps_utils.fetch_sources(args, make_dependency(), allow_download=False) is None
+    assert not (tmp_path / 'cache').exists()
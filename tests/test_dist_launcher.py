@@ -0,0 +1,40 @@
+from scripts import dist_launcher
+
+
+def test_worker_jobs_fall_back_to_equal_weights():
+    workers = [('a', 1), ('b', 2)]
+    assert dist_launcher.parse_worker_jobs('8,4', workers) == [8, 4]
+    assert dist_launcher.parse_worker_jobs('8', workers) == [1, 1]
+    assert dist_launcher.parse_worker_jobs('x,y', workers) == [1, 1]
+
+
+def test_choose_worker_uses_the_cached_workers():
+    assert dist_launcher.choose_worker([], []) is None
+    assert dist_launcher.choose_worker([('a', 1), ('b', 2)], [0, 3]) == ('b', 2)
+
+
+def test_remote_args_drop_the_preprocessor_and_output_options():
+    args = ['-DNDEBUG', '-I', 'include', '-Isrc', '-O2', '-MD', '-MT', 'a.o', '-MF', 'a.d', '-o', 'a.o', '-c', 'a.cpp']
+    assert dist_launcher.get_remote_args(args, 'a.cpp', 'a.o') == ['-O2']
+
+
+def test_hanging_worker_falls_back_to_a_local_compile(tmp_path, monkeypatch):
+    import json
+    import socket
+    import threading
+    connections = []
+    server = socket.create_server(('127.0.0.1', 0))
+    threading.Thread(target=lambda: connections.append(server.accept()[0]), daemon=True).start() # never answers
+    source, output, stats_path = tmp_path / 'a.c', tmp_path / 'a.o', tmp_path / 'stats.jsonl'
+    source.write_text('int f(void) { return 1; }\n')
+    monkeypatch.setattr(dist_launcher, 'compile_timeout', 0.5)
+    monkeypatch.setenv('BUILDER_DIST_WORKERS', f'127.0.0.1:{server.getsockname()[1]}')
+    monkeypatch.setenv('BUILDER_DIST_STATS', str(stats_path))
+    try:
+        assert dist_launcher.main(['dist_launcher.py', 'cc', '-O2', '-o', str(output), '-c', str(source)]) == 0
+    finally:
+        server.close()
+        for connection in connections:
+            connection.close()
+    assert output.is_file()
+    assert [json.loads(line)['fallback'] for line in stats_path.read_text().splitlines()] == [True]
@@ -0,0 +1,51 @@
+import os
+import json
+import time
+import pytest
+from scripts import event_utils
+from scripts.event_utils import events
+
+
+@pytest.fixture
+def events_path(tmp_path, monkeypatch):
+    monkeypatch.setenv(event_utils.events_env_var, '')
+    assert events.open(str(tmp_path), 'jsonl:events.jsonl') is None
+    try:
+        yield tmp_path / 'events.jsonl'
+    finally:
+        events.close()
+
+
+def read_events(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_invalid_events_format(tmp_path):
+    assert events.open(str(tmp_path), 'xml') == 'Invalid events format xml, choose from jsonl'
+    assert not events.enabled
+
+
+def test_the_writer_thread_flushes_the_events(events_path):
+    event_utils.emit('step_start', name='generate')
+    deadline = time.monotonic() + 5
+    while not events_path.read_text() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    [event] = read_events(events_path)
+    assert (event['type'], event['pid'], event['name']) == ('step_start', os.getpid(), 'generate')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork is not available')
+def test_forked_children_write_their_events_only(events_path, monkeypatch):
+    monkeypatch.setattr(event_utils, 'flush_interval', 60) # the events stay queued until flushed explicitly
+    event_utils.emit('command_start', command='build')
+    pid = os.fork()
+    if pid == 0:
+        event_utils.emit('step_start', name='child')
+        events.flush()
+        os._exit(0)
+    assert os.waitpid(pid, 0)[1] == 0
+    event_utils.emit('command_end', command='build')
+    events.flush()
+
+    written = [(event['type'], event['pid']) for event in read_events(events_path)]
+    assert sorted(written) == sorted([('step_start', pid), ('command_start', os.getpid()), ('command_end', os.getpid())])
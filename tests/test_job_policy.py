@@ -0,0 +1,16 @@
+from argparse import Namespace
+import psutil
+from scripts import job_policy
+
+
+def test_auto_jobs_are_split_between_concurrent_builds(monkeypatch):
+    monkeypatch.setattr(job_policy, 'get_usable_cpu_count', lambda reasons: 16)
+    monkeypatch.setattr(job_policy, 'get_memory_per_job', lambda args, reasons: 1)
+    monkeypatch.setattr(psutil, 'getloadavg', lambda: (0.0, 0.0, 0.0))
+    args = Namespace(jobs='auto', max_load=None)
+    monkeypatch.delenv(job_policy.concurrent_builds_env_var, raising=False)
+    assert job_policy.choose_jobs(args, 2)[0] == 8
+    monkeypatch.setenv(job_policy.concurrent_builds_env_var, '2')
+    assert job_policy.choose_jobs(args, 2)[0] == 4
+    args.jobs = 3
+    assert job_policy.choose_jobs(args, 2)[0] == 3
@@ -0,0 +1,89 @@
+import os
+import time
+from scripts import output_pipeline
+from scripts.output_pipeline import OutputPipeline
+
+
+def run_pipeline(tmp_path, chunks, is_verbose=True):
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(read_fd, 'rb') as stream:
+        pipeline = OutputPipeline(stream, str(tmp_path / 'output.log'), is_verbose)
+        pipeline.start()
+        for chunk in chunks:
+            os.write(write_fd, chunk)
+            time.sleep(0.01) # separate reads
+        os.close(write_fd)
+        pipeline.wait(time.perf_counter())
+    return pipeline
+
+
+def test_verbose_output_writes_each_line_once(tmp_path, capsysbinary):
+    pipeline = run_pipeline(tmp_path, [b'first\nsec', b'ond\nunfinished'])
+    assert capsysbinary.readouterr().out == b'first\nsecond\nunfinished\n'
+    assert (tmp_path / 'output.log').read_bytes() == b'first\nsecond\nunfinished'
+    assert list(pipeline.tail) == [b'first', b'second', b'unfinished']
+
+
+def test_make_and_ninja_progress(tmp_path):
+    pipeline = run_pipeline(tmp_path, [b'[ 10%] Building CXX object a.o\n[ 42%] Building CXX object b.o\n'], is_verbose=False)
+    assert pipeline.progress == 42
+    pipeline = run_pipeline(tmp_path, [b'[11/40] Building CXX object a.o\n[12/40] Building CXX object b.o\n'], is_verbose=False)
+    assert pipeline.progress == 30
+
+
+def test_progress_redraws_are_rate_limited(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(output_pipeline.sys.stdout, 'isatty', lambda: True)
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(read_fd, 'rb') as stream:
+        pipeline = OutputPipeline(stream, str(tmp_path / 'output.log'), False)
+        pipeline.start()
+        start = time.perf_counter()
+        for index in range(50):
+            os.write(write_fd, f'[{index + 1}/50] Building CXX object {index}.o\n'.encode())
+            time.sleep(0.005)
+        os.close(write_fd)
+        pipeline.wait(start)
+    output = capsys.readouterr().out
+    draws = output.count('%')
+    duration = time.perf_counter() - start
+    assert 1 <= draws <= duration / output_pipeline.progress_redraw_interval + 2
+    # the progress bar is erased at the end
+    assert output.endswith('\r' + ' ' * pipeline._progress_text_length + '\r') # pylint: disable=W0212
+
+
+def test_tail_printed_on_failure(tmp_path, capsys):
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(read_fd, 'rb') as stream:
+        pipeline = OutputPipeline(stream, str(tmp_path / 'output.log'), False, tail_line_count=2)
+        pipeline.start()
+        os.write(write_fd, b'line 1\nline 2\nerror: line 3\nline 4')
+        os.close(write_fd)
+        pipeline.wait(time.perf_counter())
+    pipeline.print_tail()
+    output = capsys.readouterr().out
+    assert f'Last 2 lines of output (full log in {tmp_path / "output.log"}):' in output
+    assert output.endswith('error: line 3\nline 4\n')
+    assert 'line 2' not in output
+    assert pipeline.line_count == 3
+
+
+def test_parse_gcc_and_clang_diagnostics():
+    assert output_pipeline.parse_diagnostic(b"/src/lib/a.cpp:12:5: error: 'x' was not declared in this scope\r") == {
+        'file': '/src/lib/a.cpp', 'line': 12, 'column': 5, 'severity': 'error', 'code': None,
+        'message': "'x' was not declared in this scope"}
+    assert output_pipeline.parse_diagnostic(b"a.cpp:3:1: warning: unused variable 'y' [-Wunused-variable]") == {
+        'file': 'a.cpp', 'line': 3, 'column': 1, 'severity': 'warning', 'code': '-Wunused-variable',
+        'message': "unused variable 'y'"}
+    diagnostic = output_pipeline.parse_diagnostic(b'a.cpp:3: fatal error: foo.h: No such file or directory')
+    assert (diagnostic['line'], diagnostic['column'], diagnostic['severity']) == (3, None, 'fatal error')
+
+
+def test_parse_msvc_diagnostics():
+    diagnostic = output_pipeline.parse_diagnostic(b"  2>C:\\src\\a.cpp(12,5): error C2065: 'x': undeclared identifier [C:\\b\\p.vcxproj]")
+    assert diagnostic == {'file': 'C:\\src\\a.cpp', 'line': 12, 'column': 5, 'severity': 'error', 'code': 'C2065',
+                          'message': "'x': undeclared identifier"}
+
+
+def test_other_lines_are_not_diagnostics():
+    for line in [b'make[2]: *** [x] Error 1', b'[12/40] Building CXX object a.o', b'In file included from a.h:3,', b'']:
+        assert output_pipeline.parse_diagnostic(line) is None
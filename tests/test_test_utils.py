@@ -0,0 +1,36 @@
+import os
+from argparse import Namespace
+from scripts import test_utils
+
+
+def test_schedule_longest_first_balances_the_durations():
+    durations = {'A.a': 5.0, 'A.b': 4.0, 'A.c': 3.0, 'A.d': 3.0, 'A.e': 2.0, 'A.f': 1.0}
+    batches = test_utils.schedule_longest_first(list(durations), durations, 2)
+    assert sorted(test for batch in batches for test in batch) == sorted(durations)
+    loads = [sum(durations[test] for test in batch) for batch in batches]
+    assert sorted(loads) == [9.0, 9.0]
+
+
+def test_schedule_longest_first_never_makes_empty_batches():
+    durations = {'A.a': 1.0, 'A.b': 2.0}
+    batches = test_utils.schedule_longest_first(list(durations), durations, 8)
+    assert len(batches) == 2
+    assert all(batches)
+
+
+def test_expected_durations_default_to_the_average_of_known_tests():
+    timings = {'A.a': {'duration': 1.0, 'failed': False}, 'A.b': {'duration': 3.0, 'failed': True}}
+    durations = test_utils.get_expected_durations(timings, ['A.a', 'A.b', 'A.new'])
+    assert durations == {'A.a': 1.0, 'A.b': 3.0, 'A.new': 2.0}
+    assert test_utils.get_last_failed_tests(timings, ['A.a', 'A.b', 'A.new']) == ['A.b']
+
+
+def test_unit_and_system_tests_timings_are_saved_separately(tmp_path):
+    args = Namespace(build_dir=str(tmp_path))
+    test_utils.save_test_timings(args, 'unit-tests', {'A.a': (1.0, True)})
+    test_utils.save_test_timings(args, 'system-tests', {'test_app': (2.0, False)})
+    test_utils.save_test_timings(args, 'unit-tests', {'A.b': (0.5, False)})
+    assert test_utils.load_test_timings(args, 'unit-tests') == {'A.a': {'duration': 1.0, 'failed': True},
+                                                                'A.b': {'duration': 0.5, 'failed': False}}
+    assert test_utils.load_test_timings(args, 'system-tests') == {'test_app': {'duration': 2.0, 'failed': False}}
+    assert sorted(os.listdir(tmp_path)) == ['test_timings_system-tests.json', 'test_timings_unit-tests.json']